@@ -1,50 +1,533 @@
-from fastapi import APIRouter, HTTPException, Depends, Query, Path
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Path, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional, Dict, Any, Set, Tuple
+import asyncio
 import logging
-from datetime import datetime
-from firebase_admin import firestore
+import json
+from datetime import date, datetime, timedelta, timezone
+from uuid import uuid4
 
-from app.models.diary import DiaryEntry, DiaryAnalysis, DiaryRecord, DiaryResponse
-from app.database import db
+from app.models.diary import (
+    DiaryEntry,
+    DiaryAnalysis,
+    DiaryRecord,
+    DiaryResponse,
+    DiaryBatchRequest,
+    DiaryStatsResponse,
+    DiaryTimeseriesResponse,
+    DIARY_RESPONSE_FIELDS,
+    DIARY_SUMMARY_FIELDS,
+)
+from app.models.job import Job, JobStatus, JobAccepted
+from app.database import repository, SERVER_TIMESTAMP
 from app.services.user_auth import verify_firebase_token, get_current_user
 from app.services.dify_api import DifyAPIService
+from app.services.executor import run_blocking
+from app.services.job_queue import job_queue, QueueFullError
+from app.services.admission import AdmissionRejected
+from app.services.user_stats import UserStatsStore
+from app.services.pending_diaries import PendingDiaryRecovery
+from app.services.write_behind import DiaryJournal, DiaryWriteBehind
+from app.services.diary_decoder import DIARY_SCHEMA_VERSION, decode_diary
+from app.services.data_version import data_versions, etag_matches, make_etag, not_modified, set_etag
+from app.services.export import iter_csv, iter_diary_pages, iter_ndjson
+from app.services.timeseries import aggregate as aggregate_timeseries, local_day_bounds
+from app.services.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, decode_cursor, split_page
 from app.config import settings
 
 # ロガーのセットアップ
 logger = logging.getLogger(__name__)
 
 # Dify APIサービスのインスタンス化
-dify_service = DifyAPIService(api_key=settings.DIFY_API_KEY)
+dify_service = DifyAPIService(api_key=settings.DIFY_API_KEY, repository=repository)
+
+# ユーザーごとの次元スコアの統計
+user_stats = UserStatsStore(
+    repository=repository,
+    collection=settings.USER_STATS_COLLECTION,
+    ewma_alpha=settings.USER_STATS_EWMA_ALPHA,
+)
+
+async def _on_diaries_written(diaries: List[Dict[str, Any]]) -> None:
+    """ライトビハインドで日記を書き込んだユーザーのデータのバージョンを増やす"""
+    for user_id in {diary["user_id"] for diary in diaries}:
+        await data_versions.bump(user_id)
+
+# 分析済みの日記をまとめてストレージに書き込むライトビハインド
+diary_writer = DiaryWriteBehind(
+    repository=repository,
+    journal=DiaryJournal(settings.WRITE_BEHIND_JOURNAL_PATH, fsync=settings.WRITE_BEHIND_FSYNC),
+    max_batch_size=settings.WRITE_BEHIND_MAX_BATCH_SIZE,
+    flush_interval_seconds=settings.WRITE_BEHIND_FLUSH_INTERVAL_SECONDS,
+    retry_max_seconds=settings.WRITE_BEHIND_RETRY_MAX_SECONDS,
+    max_item_attempts=settings.WRITE_BEHIND_MAX_ITEM_ATTEMPTS,
+    on_flushed=_on_diaries_written,
+)
 
 router = APIRouter()
 
-@router.post("/diary/analyze-and-save", response_model=DiaryResponse)
-async def analyze_and_save_diary(entry: DiaryEntry, firebase_uid: str = Depends(verify_firebase_token)):
+def _diary_document(diary_record: DiaryRecord, created_at: Any = SERVER_TIMESTAMP) -> Dict[str, Any]:
     """
-    日記を分析して結果をデータベースに保存し、分析結果と保存情報を返す
+    分析済みの日記レコードを保存するドキュメントに変換する
     
     Args:
-        entry: 日記の内容
-        firebase_uid: 認証済みのFirebase UID
+        diary_record: 日記レコード
+        created_at: 作成日時（既定ではサーバーサイドのタイムスタンプを使用）
+    """
+    return {
+        "id": diary_record.id,
+        "user_id": diary_record.user_id,
+        "content": diary_record.content,
+        "dimensions": diary_record.dimensions,
+        "feedback": diary_record.feedback,
+        "summary": diary_record.summary,
+        "status": JobStatus.COMPLETED.value,
+        "created_at": created_at,
+        "schema_version": DIARY_SCHEMA_VERSION
+    }
+
+async def _save_diary_record(diary_record: DiaryRecord) -> None:
+    """
+    分析済みの日記を保存し、関連するキャッシュを破棄する
+    
+    ライトビハインドが有効な場合は、ジャーナルに追記した時点で戻り、ストレージへの書き込みは
+    他の日記とまとめてバックグラウンドで行う。
+    
+    Args:
+        diary_record: 保存する日記レコード
+    """
+    diary_data = _diary_document(diary_record)
+    
+    if settings.DIARY_WRITE_BEHIND_ENABLED:
+        # データのバージョンはストレージに書き込んだ後に増やす
+        await diary_writer.submit(diary_data)
+    else:
+        await run_blocking(repository.save_diary, diary_data)
+    await _on_diaries_saved(diary_record.user_id, [
+        dify_service.history_digest.make_entry(
+            diary_record.id,
+            diary_record.content,
+            diary_record.dimensions,
+            diary_record.feedback,
+            diary_record.summary
+        )
+    ], bump_version=not settings.DIARY_WRITE_BEHIND_ENABLED)
+
+async def _on_diaries_saved(user_id: str, digest_entries: List[Dict[str, Any]], bump_version: bool = True) -> None:
+    """
+    日記の保存後に日記履歴ダイジェストとユーザー統計へ反映し、のびしろ情報のキャッシュを破棄する
+    
+    Args:
+        user_id: ユーザーID
+        digest_entries: 保存した日記のダイジェストのエントリー（統計の更新にもid・dimensions・created_atを使う）
+        bump_version: データのバージョンを増やすかどうか（ライトビハインドでは書き込み後に増やすためFalse）
     """
+    await dify_service.history_digest.append(user_id, digest_entries)
+    await user_stats.record(user_id, digest_entries)
+    # 日記が増えたのでのびしろ情報のキャッシュを破棄する
+    await dify_service.growth_cache.invalidate(user_id)
+    if bump_version:
+        await data_versions.bump(user_id)
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Eventsの1イベント分の文字列を生成する"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _run_diary_analysis_job(job: Job, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    分析待ちとして保存された日記を分析し、結果で更新する（ジョブハンドラー）
+    
+    混雑で拒否された場合はRetry-Afterの秒数だけ待ってDIARY_ANALYSIS_ADMISSION_MAX_RETRIES回まで再試行し、
+    それでも拒否された場合に分析失敗にする。
+    
+    Args:
+        job: 実行中のジョブ（IDは日記IDと同じ）
+        payload: 日記IDと本文
+    """
+    diary_id = payload["diary_id"]
     try:
-        # Firebase UIDからユーザー情報を取得
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", firebase_uid).limit(1)
-        users = list(query.stream())
+        for attempt in range(settings.DIARY_ANALYSIS_ADMISSION_MAX_RETRIES + 1):
+            try:
+                mbti_data = await dify_service.analyze_diary(payload["content"])
+                break
+            except AdmissionRejected as e:
+                if attempt >= settings.DIARY_ANALYSIS_ADMISSION_MAX_RETRIES:
+                    raise
+                logger.warning(f"混雑のため日記の分析を{e.retry_after:.1f}秒後に再試行します - ID: {diary_id}（{attempt + 1}回目）")
+                await asyncio.sleep(e.retry_after)
+        analysis = DiaryAnalysis(
+            dimensions=mbti_data["dimensions"],
+            feedback=mbti_data["feedback"],
+            summary=mbti_data["summary"]
+        )
         
-        if not users:
+        await run_blocking(repository.update_diary, diary_id, {
+            "dimensions": analysis.dimensions,
+            "feedback": analysis.feedback,
+            "summary": analysis.summary,
+            "status": JobStatus.COMPLETED.value,
+            "schema_version": DIARY_SCHEMA_VERSION,
+        })
+        await _on_diaries_saved(job.user_id, [
+            dify_service.history_digest.make_entry(
+                diary_id,
+                payload["content"],
+                analysis.dimensions,
+                analysis.feedback,
+                analysis.summary
+            )
+        ])
+    except Exception as e:
+        await run_blocking(repository.update_diary, diary_id, {"status": JobStatus.FAILED.value, "error": str(e)})
+        raise
+    
+    logger.info(f"日記をバックグラウンドで分析・保存しました - ID: {diary_id}, ユーザー: {job.user_id}")
+    return DiaryResponse(
+        id=diary_id,
+        content=payload["content"],
+        dimensions=analysis.dimensions,
+        feedback=analysis.feedback,
+        summary=analysis.summary,
+        created_at=job.created_at
+    ).model_dump(mode="json")
+
+job_queue.register_handler("diary_analysis", _run_diary_analysis_job)
+
+async def _enqueue_diary_analysis(user_id: str, content: str) -> JSONResponse:
+    """日記を分析待ちとして保存し、分析ジョブを登録して202レスポンスを返す"""
+    diary_id = str(uuid4())
+    # 分析結果が入るまでは一覧に表示されないよう、分析結果のフィールドは持たせない
+    await run_blocking(repository.save_diary, {
+        "id": diary_id,
+        "user_id": user_id,
+        "content": content,
+        "status": JobStatus.PENDING.value,
+        "created_at": SERVER_TIMESTAMP
+    })
+    
+    try:
+        job = await job_queue.enqueue(
+            "diary_analysis",
+            user_id,
+            {"diary_id": diary_id, "content": content},
+            job_id=diary_id
+        )
+    except QueueFullError as e:
+        logger.warning(f"分析ジョブを受け付けられませんでした: {str(e)}")
+        await run_blocking(repository.delete_diary, diary_id)
+        raise _queue_full_error()
+    
+    return _job_accepted_response(job)
+
+async def _requeue_pending_diary(diary_data: Dict[str, Any]) -> None:
+    """分析待ちのまま残った日記の分析ジョブを登録し直す（インスタンスの停止でジョブが失われた場合）"""
+    await job_queue.enqueue(
+        "diary_analysis",
+        diary_data["user_id"],
+        {"diary_id": diary_data["id"], "content": diary_data.get("content", "")},
+        job_id=diary_data["id"]
+    )
+
+# 分析待ちのまま残った日記を定期的に回収する
+pending_diary_recovery = PendingDiaryRecovery(
+    repository=repository,
+    job_queue=job_queue,
+    requeue=_requeue_pending_diary,
+    timeout_seconds=settings.DIARY_PENDING_TIMEOUT_SECONDS,
+    interval_seconds=settings.DIARY_PENDING_SWEEP_INTERVAL_SECONDS,
+    max_attempts=settings.DIARY_PENDING_MAX_RECOVERY_ATTEMPTS,
+)
+
+def _queue_full_error() -> HTTPException:
+    """ジョブキューが満杯の場合に返す503エラーを生成する"""
+    return HTTPException(
+        status_code=503,
+        detail="現在混み合っています。しばらくしてからもう一度お試しください。",
+        headers={"Retry-After": str(settings.JOB_QUEUE_RETRY_AFTER_SECONDS)}
+    )
+
+def _job_accepted_response(job: Job) -> JSONResponse:
+    """ジョブの受付を知らせる202レスポンスを生成する"""
+    accepted = JobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/v1/diary/jobs/{job.id}",
+        events_url=f"/api/v1/diary/jobs/{job.id}/events"
+    )
+    return JSONResponse(status_code=202, content=accepted.model_dump(mode="json"))
+
+async def _analyze_import_entry(index: int, content: str, semaphore: asyncio.Semaphore) -> Tuple[int, Optional[DiaryAnalysis], Optional[Exception]]:
+    """
+    一括インポートの日記を1件分析する
+    
+    混雑で拒否された場合はRetry-Afterの秒数だけ待ってから再試行する。
+    失敗しても例外は送出せず、他の日記の処理を続けられるように結果として返す。
+    
+    Returns:
+        Tuple: (日記の位置, 分析結果, 失敗した場合の例外)
+    """
+    for attempt in range(settings.BATCH_ADMISSION_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                mbti_data = await dify_service.analyze_diary(content, use_fallback=False)
+            analysis = DiaryAnalysis(
+                dimensions=mbti_data["dimensions"],
+                feedback=mbti_data["feedback"],
+                summary=mbti_data["summary"]
+            )
+            return index, analysis, None
+        except AdmissionRejected as e:
+            if attempt >= settings.BATCH_ADMISSION_MAX_RETRIES:
+                return index, None, e
+            # 実行枠を手放した状態で待つ
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            return index, None, e
+
+async def _run_diary_batch_job(job: Job, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    一括インポートされた日記を分析し、まとめて保存する（ジョブハンドラー）
+    
+    Dify APIの呼び出しはBATCH_ANALYSIS_CONCURRENCY件までに制限し、分析が終わった日記から
+    BATCH_WRITE_SIZE件ずつまとめてコミットする。進捗には件数と、前回の公開から状態が変わった
+    日記の結果だけを載せる（日記の件数に比例した量を毎回公開しないため）。すべての日記の結果は
+    ジョブの結果として返す。
+    
+    Args:
+        job: 実行中のジョブ
+        payload: インポートする日記（本文と元の作成日時）のリスト
+    """
+    entries = payload["entries"]
+    total = len(entries)
+    items: List[Dict[str, Any]] = [{"index": i, "status": "pending"} for i in range(total)]
+    counts = {"analyzed": 0, "saved": 0, "failed": 0}
+    # 前回の公開から状態が変わった日記の結果
+    changed: List[Dict[str, Any]] = []
+    pending: List[Tuple[int, Dict[str, Any]]] = []
+    saved_entries: List[Dict[str, Any]] = []
+    write_size = max(1, settings.BATCH_WRITE_SIZE)
+    
+    def set_item(index: int, item: Dict[str, Any]) -> None:
+        items[index] = item
+        changed.append(item)
+    
+    async def publish_progress() -> None:
+        await job_queue.update_progress(job.id, {
+            "total": total,
+            **counts,
+            "items": changed[:]
+        })
+        changed.clear()
+    
+    async def flush() -> None:
+        """分析済みの日記を1回のバッチ書き込みでコミットする"""
+        chunk = pending[:]
+        pending.clear()
+        try:
+            await run_blocking(repository.save_diaries, [diary_data for _, diary_data in chunk])
+        except Exception as e:
+            logger.error(f"日記のバッチ書き込みに失敗しました（{len(chunk)}件）: {str(e)}")
+            for index, _ in chunk:
+                set_item(index, {"index": index, "status": "failed", "error": f"保存に失敗しました: {str(e)}"})
+            counts["failed"] += len(chunk)
+        else:
+            for index, diary_data in chunk:
+                set_item(index, {"index": index, "status": "saved", "diary_id": diary_data["id"]})
+                saved_entries.append(dify_service.history_digest.make_entry(
+                    diary_data["id"],
+                    diary_data["content"],
+                    diary_data["dimensions"],
+                    diary_data["feedback"],
+                    diary_data["summary"],
+                    diary_data["created_at"]
+                ))
+            counts["saved"] += len(chunk)
+        await publish_progress()
+    
+    semaphore = asyncio.Semaphore(settings.BATCH_ANALYSIS_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(_analyze_import_entry(i, entry["content"], semaphore))
+        for i, entry in enumerate(entries)
+    ]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            index, analysis, error = await next_result
+            if error is not None:
+                set_item(index, {"index": index, "status": "failed", "error": str(error)})
+                counts["failed"] += 1
+                await publish_progress()
+                continue
+            
+            entry = entries[index]
+            diary_record = DiaryRecord.create(job.user_id, entry["content"], analysis)
+            pending.append((index, _diary_document(diary_record, created_at=entry["created_at"])))
+            set_item(index, {"index": index, "status": "analyzed", "diary_id": diary_record.id})
+            counts["analyzed"] += 1
+            if len(pending) >= write_size:
+                await flush()
+            else:
+                await publish_progress()
+        if pending:
+            await flush()
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    if saved_entries:
+        await _on_diaries_saved(job.user_id, saved_entries)
+    
+    logger.info(f"日記を一括インポートしました - ユーザー: {job.user_id}, 保存: {counts['saved']}件, 失敗: {counts['failed']}件")
+    return {"total": total, "saved": counts["saved"], "failed": counts["failed"], "items": items}
+
+job_queue.register_handler("diary_batch_import", _run_diary_batch_job)
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, str]]:
+    """クエリパラメータのカーソルをリポジトリのstart_afterの値に変換する（不正な場合は400）"""
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursorError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=400, detail="不正なカーソルです")
+
+
+def _parse_fields(view: str, fields: Optional[str]) -> Optional[Set[str]]:
+    """
+    日記一覧で返すフィールドを決める（不明なフィールドの場合は400）
+
+    Args:
+        view: "full"または"summary"
+        fields: 返すフィールドのカンマ区切り（viewより優先）
+
+    Returns:
+        Optional[Set[str]]: 返すフィールド。すべてのフィールドを返す場合はNone
+    """
+    if fields:
+        selected = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = selected - set(DIARY_RESPONSE_FIELDS)
+        if unknown:
             raise HTTPException(
-                status_code=404,
-                detail="ユーザーが見つかりません。アプリでユーザー登録を完了してください。"
+                status_code=400,
+                detail=f"不明なフィールドです: {', '.join(sorted(unknown))}（指定できるフィールド: {', '.join(DIARY_RESPONSE_FIELDS)}）",
             )
+        # idとcreated_atはページングに使うため常に含める
+        selected |= {"id", "created_at"}
+    elif view == "summary":
+        selected = set(DIARY_SUMMARY_FIELDS)
+    else:
+        return None
+    return None if selected >= set(DIARY_RESPONSE_FIELDS) else selected
+
+
+async def _list_diary_page(
+    user_id: str,
+    limit: int,
+    cursor: Optional[Tuple[Any, str]],
+    response: Response,
+    fields: Optional[Set[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    日記を1ページ分取得し、続きがある場合は次のページのカーソルをレスポンスヘッダーに設定する
+
+    Args:
+        user_id: ユーザーID
+        limit: 1ページの件数（DIARY_PAGE_MAX_SIZEで切り詰め済み）
+        cursor: 前のページの最後の日記の(created_at, id)
+        response: ヘッダーを設定するレスポンス
+        fields: 取得するフィールド（Noneの場合はすべて）
+
+    Returns:
+        List[Dict[str, Any]]: 作成日時の降順（同じ日時ではIDの降順）の日記
+    """
+    # 書き込み待ちの日記があれば、書き込まれてから読み込む
+    await diary_writer.wait_for_user(user_id)
+    # 続きがあるか判定するため1件多く取得する（正規の形式か判定するためschema_versionも取得する）
+    diary_docs = await run_blocking(
+        repository.list_user_diaries, user_id, limit + 1, cursor,
+        sorted(fields | {"schema_version"}) if fields is not None else None
+    )
+    page, next_cursor = split_page(diary_docs, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return page
+
+
+async def _load_job(job_id: str, user_id: str) -> Job:
+    """
+    ジョブの状態を取得する
+    
+    このインスタンスでジョブの状態が見つからない場合（別インスタンスで受け付けた、
+    または保持期間が過ぎた場合）は、同じIDの日記ドキュメントから状態を復元する。
+    """
+    job = await job_queue.get(job_id)
+    if job is not None:
+        if job.user_id != user_id:
+            raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+        return job
+    
+    diary_data = await run_blocking(repository.get_diary, job_id)
+    if diary_data is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    if diary_data.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    
+    status = JobStatus(diary_data.get("status", JobStatus.COMPLETED.value))
+    created_at = diary_data.get("created_at")
+    if not isinstance(created_at, datetime):
+        created_at = datetime.now()
+    result = None
+    if status == JobStatus.COMPLETED:
+        result = DiaryResponse(
+            id=job_id,
+            content=diary_data.get("content", ""),
+            dimensions=diary_data.get("dimensions", {}),
+            feedback=diary_data.get("feedback", ""),
+            summary=diary_data.get("summary", ""),
+            created_at=created_at
+        ).model_dump(mode="json")
+    return Job(
+        id=job_id,
+        type="diary_analysis",
+        user_id=user_id,
+        status=status,
+        result=result,
+        error=diary_data.get("error"),
+        created_at=created_at,
+        updated_at=datetime.now()
+    )
+
+@router.post(
+    "/diary/analyze-and-save",
+    response_model=DiaryResponse,
+    responses={202: {"model": JobAccepted, "description": "async=trueの場合、分析ジョブを受け付けた"}}
+)
+async def analyze_and_save_diary(
+    entry: DiaryEntry,
+    async_mode: bool = Query(False, alias="async"),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    日記を分析して結果をデータベースに保存し、分析結果と保存情報を返す
+    
+    async=trueを指定すると、日記を分析待ちとして保存してすぐに202とジョブIDを返す。
+    分析結果は/diary/jobs/{job_id}（ポーリング）または/diary/jobs/{job_id}/events（SSE）で取得する。
+    
+    Args:
+        entry: 日記の内容
+        async_mode: バックグラウンドで分析するかどうか
+        current_user: 認証済みユーザーの情報
+    """
+    try:
+        # 認証済みユーザーのID（ユーザー情報はキャッシュから解決済み）
+        user_id = current_user["id"]
         
-        user_data = users[0].to_dict()
-        user_id = user_data["id"]
+        if async_mode:
+            return await _enqueue_diary_analysis(user_id, entry.content)
         
         # 日記のテキストをDify APIを使って分析
         logger.info(f"ユーザー {user_id} の日記を分析します（文字数: {len(entry.content)}）")
-        mbti_data = dify_service.analyze_diary(entry.content)
+        mbti_data = await dify_service.analyze_diary(entry.content)
         
         # 分析結果をモデルに変換
         analysis = DiaryAnalysis(
@@ -60,19 +543,8 @@ async def analyze_and_save_diary(entry: DiaryEntry, firebase_uid: str = Depends(
             analysis=analysis
         )
         
-        # Firestoreでのシリアル化のために、datetimeをFirestoreのタイムスタンプに変換
-        diary_data = {
-            "id": diary_record.id,
-            "user_id": diary_record.user_id,
-            "content": diary_record.content,
-            "dimensions": diary_record.dimensions,
-            "feedback": diary_record.feedback,
-            "summary": diary_record.summary,
-            "created_at": firestore.SERVER_TIMESTAMP  # サーバーサイドのタイムスタンプを使用
-        }
-        
-        # Firestoreに保存
-        db.collection('diaries').document(diary_record.id).set(diary_data)
+        # データベースに保存
+        await _save_diary_record(diary_record)
         
         logger.info(f"日記を分析・保存しました - ID: {diary_record.id}, ユーザー: {user_id}")
         
@@ -95,6 +567,154 @@ async def analyze_and_save_diary(entry: DiaryEntry, firebase_uid: str = Depends(
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"日記の分析・保存中にエラーが発生しました: {str(e)}")
 
+@router.post(
+    "/diary/analyze-and-save/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "分析の途中経過と結果のSSEストリーム"}}
+)
+async def analyze_and_save_diary_stream(entry: DiaryEntry, current_user: Dict[str, Any] = Depends(get_current_user)):
+    """
+    日記をストリーミングで分析し、完了後にデータベースへ保存する
+    
+    Difyのストリーミングモードで生成途中のテキストをchunkイベントとして送り、
+    分析が完了したら日記を保存してdoneイベント（DiaryResponse）を送る。
+    失敗した場合はerrorイベントを送り、日記は保存しない。
+    
+    Args:
+        entry: 日記の内容
+        current_user: 認証済みユーザーの情報
+    """
+    user_id = current_user["id"]
+    logger.info(f"ユーザー {user_id} の日記をストリーミングで分析します（文字数: {len(entry.content)}）")
+    
+    async def event_stream():
+        try:
+            async for event in dify_service.stream_analysis(entry.content):
+                if event["event"] == "text_chunk":
+                    yield _format_sse("chunk", {"text": event["text"], "field": event["field"]})
+                    continue
+                
+                mbti_data = event["data"]
+                analysis = DiaryAnalysis(
+                    dimensions=mbti_data["dimensions"],
+                    feedback=mbti_data["feedback"],
+                    summary=mbti_data["summary"]
+                )
+                diary_record = DiaryRecord.create(
+                    user_id=user_id,
+                    content=entry.content,
+                    analysis=analysis
+                )
+                await _save_diary_record(diary_record)
+                logger.info(f"日記をストリーミングで分析・保存しました - ID: {diary_record.id}, ユーザー: {user_id}")
+                
+                response = DiaryResponse(
+                    id=diary_record.id,
+                    content=diary_record.content,
+                    dimensions=diary_record.dimensions,
+                    feedback=diary_record.feedback,
+                    summary=diary_record.summary,
+                    created_at=diary_record.created_at
+                )
+                yield _format_sse("done", response.model_dump(mode="json"))
+        except AdmissionRejected as e:
+            yield _format_sse("error", {"detail": e.detail, "status_code": e.status_code, "retry_after": e.headers["Retry-After"]})
+        except Exception as e:
+            logger.error(f"日記のストリーミング分析中にエラーが発生しました: {str(e)}")
+            yield _format_sse("error", {"detail": "日記の分析中にエラーが発生しました"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post(
+    "/diary/batch",
+    status_code=202,
+    response_model=JobAccepted
+)
+async def import_diaries(
+    batch: DiaryBatchRequest,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    元の日付付きの日記をまとめて受け付け、バックグラウンドで分析・保存する
+    
+    すぐに202とジョブIDを返す。日記ごとの進捗（分析済み・保存済み・失敗）は
+    /diary/jobs/{job_id}（ポーリング）または/diary/jobs/{job_id}/events（SSE）で取得する。
+    進捗のitemsは前回の更新から状態が変わった日記だけなので、すべての日記の結果は完了後のresultで確認する。
+    
+    Args:
+        batch: インポートする日記のリスト
+        current_user: 認証済みユーザーの情報
+    """
+    if len(batch.entries) > settings.BATCH_IMPORT_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"一度にインポートできる日記は{settings.BATCH_IMPORT_MAX_ENTRIES}件までです"
+        )
+    
+    try:
+        job = await job_queue.enqueue(
+            "diary_batch_import",
+            current_user["id"],
+            {"entries": [entry.model_dump() for entry in batch.entries]}
+        )
+    except QueueFullError as e:
+        logger.warning(f"一括インポートのジョブを受け付けられませんでした: {str(e)}")
+        raise _queue_full_error()
+    
+    return _job_accepted_response(job)
+
+@router.get("/diary/jobs/{job_id}", response_model=Job)
+async def get_diary_job(job_id: str = Path(...), current_user: Dict[str, Any] = Depends(get_current_user)):
+    """
+    分析ジョブの状態を取得する（ポーリング用）
+    
+    Args:
+        job_id: ジョブID（日記IDと同じ）
+        current_user: 認証済みユーザーの情報
+    """
+    return await _load_job(job_id, current_user["id"])
+
+@router.get("/diary/jobs/{job_id}/events")
+async def stream_diary_job_events(job_id: str = Path(...), current_user: Dict[str, Any] = Depends(get_current_user)):
+    """
+    分析ジョブの状態変化をServer-Sent Eventsで通知する
+    
+    状態が変わるたびにstatusイベントを送り、完了または失敗した時点でストリームを閉じる。
+    
+    Args:
+        job_id: ジョブID（日記IDと同じ）
+        current_user: 認証済みユーザーの情報
+    """
+    user_id = current_user["id"]
+    job = await _load_job(job_id, user_id)
+    
+    async def event_stream():
+        current = job
+        yield _format_sse("status", current.model_dump(mode="json"))
+        while not current.is_finished:
+            latest = await job_queue.wait_for_change(job_id, current.updated_at, settings.SSE_HEARTBEAT_SECONDS)
+            if latest is None:
+                # このインスタンスに状態がない場合は日記ドキュメントを確認する
+                latest = await _load_job(job_id, user_id)
+                if latest.status == current.status:
+                    yield ": keep-alive\n\n"
+                    continue
+            elif latest.updated_at == current.updated_at:
+                yield ": keep-alive\n\n"
+                continue
+            current = latest
+            yield _format_sse("status", current.model_dump(mode="json"))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # 後方互換性のために残しておく（非推奨）
 @router.post("/diary/analyze", response_model=DiaryAnalysis, deprecated=True)
 async def analyze_diary(entry: DiaryEntry, firebase_uid: str = Depends(verify_firebase_token)):
@@ -103,7 +723,7 @@ async def analyze_diary(entry: DiaryEntry, firebase_uid: str = Depends(verify_fi
     """
     try:
         # Dify APIを使用して分析
-        mbti_data = dify_service.analyze_diary(entry.content)
+        mbti_data = await dify_service.analyze_diary(entry.content)
         
         analysis = DiaryAnalysis(
             dimensions=mbti_data["dimensions"],
@@ -114,117 +734,80 @@ async def analyze_diary(entry: DiaryEntry, firebase_uid: str = Depends(verify_fi
         logger.warning("非推奨の/diary/analyzeエンドポイントが使用されました。代わりにanalyze-and-saveを使用してください。")
         
         return analysis
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing diary: {str(e)}")
         raise HTTPException(status_code=500, detail="分析中にエラーが発生しました")
 
 @router.get("/diary/user", response_model=List[DiaryResponse])
-async def get_current_user_diaries(limit: int = Query(10), firebase_uid: str = Depends(verify_firebase_token)):
+async def get_current_user_diaries(
+    response: Response,
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None),
+    view: Literal["full", "summary"] = Query("full"),
+    fields: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
     """
     現在認証されているユーザーの日記一覧を取得する
     
+    続きがある場合は次のページのカーソルをX-Next-Cursorヘッダーで返す。
+    view=summaryまたはfieldsを指定した場合は、指定したフィールドだけを取得して返す。
+    ETagはユーザーのデータのバージョンとクエリパラメータから求め、If-None-Matchが一致する場合は
+    日記を取得せずに304を返す。
+    
     Args:
-        limit: 取得する日記の最大数
-        firebase_uid: 認証済みのFirebase UID
+        limit: 取得する日記の最大数（DIARY_PAGE_MAX_SIZEが上限）
+        cursor: 前のページのレスポンスのX-Next-Cursorヘッダーの値
+        view: "summary"の場合はid・created_at・dimensionsだけを返す
+        fields: 返すフィールドのカンマ区切り（例: "id,created_at,dimensions"。idは常に含む）
+        if_none_match: 前回のレスポンスのETag
+        current_user: 認証済みユーザーの情報
     """
     try:
-        # Firebase UIDからユーザー情報を取得
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", firebase_uid).limit(1)
-        users = list(query.stream())
-        
-        if not users:
-            raise HTTPException(
-                status_code=404,
-                detail="ユーザーが見つかりません。アプリでユーザー登録を完了してください。"
-            )
+        # 認証済みユーザーのID（ユーザー情報はキャッシュから解決済み）
+        user_id = current_user["id"]
+        limit = min(limit, settings.DIARY_PAGE_MAX_SIZE)
+        start_after = _parse_cursor(cursor)
+        selected = _parse_fields(view, fields)
         
-        user_data = users[0].to_dict()
-        user_id = user_data["id"]
+        # 書き込み待ちの日記を書き込んでからバージョンを確認する
+        await diary_writer.wait_for_user(user_id)
+        version = await data_versions.get(user_id)
+        etag = make_etag(
+            "diary-list", user_id, version, limit, cursor or "",
+            ",".join(sorted(selected)) if selected is not None else "*",
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         
         logger.info(f"ユーザー {user_id} の日記を取得します（上限: {limit}件）")
         
         try:
-            # 日記データを取得（作成日時の降順）
-            diary_docs = db.collection('diaries')\
-                .where('user_id', '==', user_id)\
-                .order_by('created_at', direction='DESCENDING')\
-                .limit(limit)\
-                .stream()
+            # 日記データを1ページ分取得（作成日時の降順）
+            diary_docs = await _list_diary_page(user_id, limit, start_after, response, selected)
             
             diaries = []
-            for doc in diary_docs:
-                try:
-                    diary_data = doc.to_dict()
-                    logger.debug(f"日記データ取得: ID={doc.id}, キー={list(diary_data.keys())}")
-                    
-                    # 必須フィールドの存在確認
-                    required_fields = ['id', 'content', 'dimensions', 'feedback', 'summary']
-                    missing_fields = [field for field in required_fields if field not in diary_data]
-                    
-                    if missing_fields:
-                        logger.warning(f"日記データに不足フィールドがあります: {missing_fields}, ID={doc.id}")
-                        # 不足フィールドを持つレコードは無視して次に進む
-                        continue
-                    
-                    # Firestoreのタイムスタンプをdatetimeに変換
-                    created_at = datetime.now()  # デフォルト値を設定
-                    
-                    if 'created_at' in diary_data:
-                        timestamp_value = diary_data['created_at']
-                        logger.debug(f"created_at の型: {type(timestamp_value)}")
-                        
-                        if isinstance(timestamp_value, datetime):
-                            created_at = timestamp_value
-                        elif hasattr(timestamp_value, 'timestamp'):
-                            # Firestoreタイムスタンプ
-                            try:
-                                # タイムスタンプはすでに数値（秒）なので、そのままdatetimeに変換
-                                timestamp_seconds = timestamp_value.timestamp()
-                                created_at = datetime.fromtimestamp(timestamp_seconds)
-                            except Exception as ts_error:
-                                logger.warning(f"タイムスタンプ変換エラー: {str(ts_error)}")
-                        elif isinstance(timestamp_value, (int, float)):
-                            # UNIX タイムスタンプの場合
-                            try:
-                                created_at = datetime.fromtimestamp(timestamp_value)
-                            except Exception as ts_error:
-                                logger.warning(f"UNIXタイムスタンプ変換エラー: {str(ts_error)}")
-                    
-                    # 次元データの検証
-                    dimensions = diary_data.get('dimensions', {})
-                    if not isinstance(dimensions, dict):
-                        logger.warning(f"dimensions が辞書型ではありません: {type(dimensions)}")
-                        dimensions = {}
-                    
-                    # 欠損している次元を補完
-                    dimension_keys = ['EI', 'SN', 'TF', 'JP']
-                    for key in dimension_keys:
-                        if key not in dimensions:
-                            logger.warning(f"次元 {key} が欠損しています。デフォルト値 50 を設定します。")
-                            dimensions[key] = 50.0
-                    
-                    # DiaryResponseオブジェクトの作成
-                    diary_response = DiaryResponse(
-                        id=diary_data.get('id', doc.id),  # IDがない場合はドキュメントIDを使用
-                        content=diary_data.get('content', ''),
-                        dimensions=dimensions,
-                        feedback=diary_data.get('feedback', ''),
-                        summary=diary_data.get('summary', ''),
-                        created_at=created_at
-                    )
-                    
-                    diaries.append(diary_response)
-                    logger.debug(f"日記エントリーを追加しました: ID={diary_response.id}")
-                    
-                except Exception as item_error:
-                    logger.warning(f"日記アイテム処理中にエラー: {str(item_error)}")
-                    logger.warning(f"問題のあるデータ: {diary_data if 'diary_data' in locals() else 'データなし'}")
-                    # 不正なアイテムはスキップして次へ
+            for diary_data in diary_docs:
+                # 表示できない日記（分析待ち・フィールドの不足など）はスキップする
+                diary_response = decode_diary(diary_data, selected)
+                if diary_response is None:
                     continue
+                # 取得していないフィールドは空の値になっているため、指定したフィールドだけを返す
+                diaries.append(diary_response.model_dump(mode="json", include=selected))
             
             logger.info(f"取得完了: {len(diaries)}件の日記を取得しました")
-            return diaries
+            # デコード済みの日記をresponse_modelで検証し直さないよう、そのまま返す
+            # （一部のフィールドだけの日記はDiaryResponseとして検証できないためでもある）
+            headers = {
+                name: response.headers[name]
+                for name in (NEXT_CURSOR_HEADER, "ETag", "Cache-Control")
+                if name in response.headers
+            }
+            return JSONResponse(content=diaries, headers=headers)
                 
         except Exception as query_error:
             error_msg = str(query_error)
@@ -255,32 +838,42 @@ async def get_current_user_diaries(limit: int = Query(10), firebase_uid: str = D
 
 # 認証済みユーザーのビスろ情報を取得するエンドポイント
 @router.get("/diary/user/growth", response_model=Dict[str, Any])
-async def get_current_user_growth_advice(firebase_uid: str = Depends(verify_firebase_token)):
+async def get_current_user_growth_advice(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
     """
     現在認証されているユーザーののびしろ情報を取得する
     
+    のびしろ情報は日記から求めるため、データのバージョンが変わっていなければ304を返す。
+    Dify APIから取得できず既定値を返す場合は、復旧後に取得し直せるようETagを付けない。
+    
     Args:
-        firebase_uid: 認証済みのFirebase UID
+        if_none_match: 前回のレスポンスのETag
+        current_user: 認証済みユーザーの情報
     """
     try:
-        # Firebase UIDからユーザー情報を取得
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", firebase_uid).limit(1)
-        users = list(query.stream())
-        
-        if not users:
-            raise HTTPException(
-                status_code=404,
-                detail="ユーザーが見つかりません。アプリでユーザー登録を完了してください。"
-            )
+        # 認証済みユーザーのID（ユーザー情報はキャッシュから解決済み）
+        user_id = current_user["id"]
         
-        user_data = users[0].to_dict()
-        user_id = user_data["id"]
+        await diary_writer.wait_for_user(user_id)
+        etag = make_etag("growth", user_id, await data_versions.get(user_id))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
         logger.info(f"ユーザー {user_id} ののびしろ情報を取得します")
         
         # Dify APIを使用してのびしろ情報を取得
-        growth_data = dify_service.get_growth_advice(user_id)
+        try:
+            growth_data = await dify_service.get_growth_advice(user_id, use_fallback=False)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            # 既定値は日記から求めた結果ではないため、ETagを付けずキャッシュさせない
+            response.headers["Cache-Control"] = "no-store"
+            return dify_service.fallback_growth_advice(e)
+        set_etag(response, etag)
         
         logger.info(f"のびしろ情報取得成功: ユーザー {user_id}")
         
@@ -293,101 +886,140 @@ async def get_current_user_growth_advice(firebase_uid: str = Depends(verify_fire
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail="のびしろ情報の取得中にエラーが発生しました")
 
+@router.get("/diary/user/stats", response_model=DiaryStatsResponse)
+async def get_current_user_stats(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """
+    現在認証されているユーザーの次元スコアの統計（件数・平均・分散・EWMA・最新のタイプ）を取得する
+    
+    統計は日記の保存時に更新しているため、日記の件数によらず1ドキュメントの読み込みで返す。
+    
+    Args:
+        current_user: 認証済みユーザーの情報
+    """
+    try:
+        user_id = current_user["id"]
+        # 統計がまだない場合は日記から作成するため、書き込み待ちの日記を先に書き込む
+        await diary_writer.wait_for_user(user_id)
+        return await user_stats.load(user_id)
+    except Exception as e:
+        logger.error(f"ユーザー統計の取得中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail="ユーザー統計の取得中にエラーが発生しました")
+
+@router.get("/diary/user/timeseries", response_model=DiaryTimeseriesResponse)
+async def get_current_user_timeseries(
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    bucket: Literal["day", "week", "month"] = Query("day"),
+    max_points: int = Query(100, ge=1),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    現在認証されているユーザーの次元スコアを日・週・月ごとに平均した時系列を取得する
+    
+    期間内の日記のcreated_atとdimensionsだけを取得して集計するため、期間が長くても
+    レスポンスは最大max_points点に収まる。
+    
+    Args:
+        start: 開始日（省略時は終了日のTIMESERIES_DEFAULT_DAYS日前）
+        end: 終了日（この日を含む。省略時は今日）
+        bucket: 区間の大きさ（day, week, month）
+        max_points: 返す点の最大数（TIMESERIES_MAX_POINTSが上限。超える場合は隣り合う区間をまとめる）
+        current_user: 認証済みユーザーの情報
+    """
+    tz_offset = settings.TIMESERIES_TZ_OFFSET_MINUTES
+    end = end or datetime.now(timezone(timedelta(minutes=tz_offset))).date()
+    start = start or end - timedelta(days=settings.TIMESERIES_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="開始日は終了日以前の日付を指定してください")
+    max_points = min(max_points, settings.TIMESERIES_MAX_POINTS)
+    
+    try:
+        user_id = current_user["id"]
+        since, until = local_day_bounds(start, end, tz_offset)
+        await diary_writer.wait_for_user(user_id)
+        diary_docs = await run_blocking(
+            lambda: repository.list_user_diaries(
+                user_id,
+                fields=["created_at", "dimensions"],
+                created_since=since,
+                created_until=until,
+            )
+        )
+        # 集計はCPU処理なので、イベントループを止めないようにスレッドプールで実行する
+        result = await run_blocking(aggregate_timeseries, diary_docs, bucket, tz_offset, max_points)
+        logger.info(f"ユーザー {user_id} の時系列を集計しました（日記: {len(diary_docs)}件, 点: {len(result['points'])}件）")
+        return {"bucket": bucket, "start": start, "end": end, **result}
+    except Exception as e:
+        logger.error(f"時系列の集計中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail="時系列の集計中にエラーが発生しました")
+
+@router.get("/diary/user/export")
+async def export_current_user_diaries(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    現在認証されているユーザーの日記をすべてNDJSONまたはCSVでダウンロードする
+    
+    日記はEXPORT_PAGE_SIZE件ずつ取得しながら送るため、件数が多くてもメモリ使用量は一定で、
+    最初のページを取得した時点で送信を始める。
+    
+    Args:
+        format: 出力形式（ndjson, csv）
+        current_user: 認証済みユーザーの情報
+    """
+    user_id = current_user["id"]
+    logger.info(f"ユーザー {user_id} の日記をエクスポートします（形式: {format}）")
+
+    async def stream():
+        await diary_writer.wait_for_user(user_id)
+        pages = iter_diary_pages(repository, user_id, settings.EXPORT_PAGE_SIZE)
+        chunks = iter_csv(pages) if format == "csv" else iter_ndjson(pages)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # 送信を始めた後はステータスコードを変えられないため、途中で打ち切る
+            logger.error(f"日記のエクスポート中にエラーが発生しました - ユーザー: {user_id}: {str(e)}")
+            raise
+
+    filename = f"mbti-diary-{datetime.now().strftime('%Y%m%d')}.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream(),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # 後方互換性のために古いエンドポイントも残しつつ、非推奨とマークする
 @router.get("/diary/user/{user_id}", response_model=List[DiaryResponse], deprecated=True)
-async def get_user_diaries_deprecated(user_id: str = Path(...), limit: int = Query(10)):
+async def get_user_diaries_deprecated(
+    response: Response,
+    user_id: str = Path(...),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None),
+):
     """
     特定ユーザーの日記一覧を取得する（非推奨：代わりに認証付きの/diary/userを使用してください）
     """
     logger.warning(f"非推奨の/diary/user/{user_id}エンドポイントが使用されました。")
     try:
+        limit = min(limit, settings.DIARY_PAGE_MAX_SIZE)
+        start_after = _parse_cursor(cursor)
+        
         # ユーザーが存在するか確認
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
+        user_doc = await run_blocking(repository.get_user, user_id)
         
-        if not user_doc.exists:
+        if user_doc is None:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
         logger.info(f"ユーザー {user_id} の日記を取得します（上限: {limit}件）")
         
         try:
-            # 日記データを取得（作成日時の降順）
-            diary_docs = db.collection('diaries')\
-                .where('user_id', '==', user_id)\
-                .order_by('created_at', direction='DESCENDING')\
-                .limit(limit)\
-                .stream()
+            # 日記データを1ページ分取得（作成日時の降順）
+            diary_docs = await _list_diary_page(user_id, limit, start_after, response)
             
-            diaries = []
-            for doc in diary_docs:
-                try:
-                    diary_data = doc.to_dict()
-                    logger.debug(f"日記データ取得: ID={doc.id}, キー={list(diary_data.keys())}")
-                    
-                    # 必須フィールドの存在確認
-                    required_fields = ['id', 'content', 'dimensions', 'feedback', 'summary']
-                    missing_fields = [field for field in required_fields if field not in diary_data]
-                    
-                    if missing_fields:
-                        logger.warning(f"日記データに不足フィールドがあります: {missing_fields}, ID={doc.id}")
-                        # 不足フィールドを持つレコードは無視して次に進む
-                        continue
-                    
-                    # Firestoreのタイムスタンプをdatetimeに変換
-                    created_at = datetime.now()  # デフォルト値を設定
-                    
-                    if 'created_at' in diary_data:
-                        timestamp_value = diary_data['created_at']
-                        logger.debug(f"created_at の型: {type(timestamp_value)}")
-                        
-                        if isinstance(timestamp_value, datetime):
-                            created_at = timestamp_value
-                        elif hasattr(timestamp_value, 'timestamp'):
-                            # Firestoreタイムスタンプ
-                            try:
-                                # タイムスタンプはすでに数値（秒）なので、そのままdatetimeに変換
-                                timestamp_seconds = timestamp_value.timestamp()
-                                created_at = datetime.fromtimestamp(timestamp_seconds)
-                            except Exception as ts_error:
-                                logger.warning(f"タイムスタンプ変換エラー: {str(ts_error)}")
-                        elif isinstance(timestamp_value, (int, float)):
-                            # UNIX タイムスタンプの場合
-                            try:
-                                created_at = datetime.fromtimestamp(timestamp_value)
-                            except Exception as ts_error:
-                                logger.warning(f"UNIXタイムスタンプ変換エラー: {str(ts_error)}")
-                    
-                    # 次元データの検証
-                    dimensions = diary_data.get('dimensions', {})
-                    if not isinstance(dimensions, dict):
-                        logger.warning(f"dimensions が辞書型ではありません: {type(dimensions)}")
-                        dimensions = {}
-                    
-                    # 欠損している次元を補完
-                    dimension_keys = ['EI', 'SN', 'TF', 'JP']
-                    for key in dimension_keys:
-                        if key not in dimensions:
-                            logger.warning(f"次元 {key} が欠損しています。デフォルト値 50 を設定します。")
-                            dimensions[key] = 50.0
-                    
-                    # DiaryResponseオブジェクトの作成
-                    diary_response = DiaryResponse(
-                        id=diary_data.get('id', doc.id),  # IDがない場合はドキュメントIDを使用
-                        content=diary_data.get('content', ''),
-                        dimensions=dimensions,
-                        feedback=diary_data.get('feedback', ''),
-                        summary=diary_data.get('summary', ''),
-                        created_at=created_at
-                    )
-                    
-                    diaries.append(diary_response)
-                    logger.debug(f"日記エントリーを追加しました: ID={diary_response.id}")
-                    
-                except Exception as item_error:
-                    logger.warning(f"日記アイテム処理中にエラー: {str(item_error)}")
-                    logger.warning(f"問題のあるデータ: {diary_data if 'diary_data' in locals() else 'データなし'}")
-                    # 不正なアイテムはスキップして次へ
-                    continue
+            # 表示できない日記（分析待ち・フィールドの不足など）はスキップする
+            diaries = [diary for diary in map(decode_diary, diary_docs) if diary is not None]
             
             logger.info(f"取得完了: {len(diaries)}件の日記を取得しました")
             return diaries
@@ -428,16 +1060,15 @@ async def get_user_growth_advice_deprecated(user_id: str = Path(...)):
     logger.warning(f"非推奨の/diary/user/growth/{user_id}エンドポイントが使用されました。")
     try:
         # ユーザーが存在するか確認
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
+        user_doc = await run_blocking(repository.get_user, user_id)
         
-        if not user_doc.exists:
+        if user_doc is None:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
         logger.info(f"ユーザー {user_id} ののびしろ情報を取得します")
         
         # Dify APIを使用してのびしろ情報を取得
-        growth_data = dify_service.get_growth_advice(user_id)
+        growth_data = await dify_service.get_growth_advice(user_id)
         
         logger.info(f"のびしろ情報取得成功: ユーザー {user_id}")
         
@@ -459,16 +1090,15 @@ async def legacy_get_growth_advice(user_id: str = Path(...)):
     logger.warning(f"非推奨の/growth/{user_id}エンドポイントが使用されました。")
     try:
         # ユーザーが存在するか確認
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
+        user_doc = await run_blocking(repository.get_user, user_id)
         
-        if not user_doc.exists:
+        if user_doc is None:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
         logger.info(f"ユーザー {user_id} ののびしろ情報を取得します")
         
         # Dify APIを使用してのびしろ情報を取得
-        growth_data = dify_service.get_growth_advice(user_id)
+        growth_data = await dify_service.get_growth_advice(user_id)
         
         logger.info(f"のびしろ情報取得成功: ユーザー {user_id}")
         
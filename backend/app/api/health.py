@@ -0,0 +1,97 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from typing import Dict, Any
+import logging
+
+from app.services.executor import blocking_executor
+from app.services.token_verifier import token_verifier
+from app.services.user_auth import user_cache
+from app.services.data_version import data_versions
+from app.api.diary import dify_service, diary_writer, pending_diary_recovery
+from app.api.users import user_count_cache
+from app.services.job_queue import job_queue
+from app.services.startup import readiness_monitor, startup_profile
+from app.database import repository
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"],
+)
+
+
+@router.get("", response_model=Dict[str, Any])
+async def health_check():
+    """
+    アプリケーションの稼働状態を返す
+    """
+    return {"status": "ok", "storage": repository.backend_name}
+
+
+@router.get("/ready", response_model=Dict[str, Any])
+async def readiness_check():
+    """
+    トラフィックを受けられる状態かを返す（準備ができていない場合は503）
+
+    接続確認はバックグラウンドで行っているため、このエンドポイントは直近の結果を返すだけで
+    外部サービスへはアクセスしない。
+    """
+    status = readiness_monitor.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@router.get("/startup", response_model=Dict[str, Any])
+async def get_startup_profile():
+    """
+    起動処理の段階ごとの所要時間を返す
+    """
+    return startup_profile.report()
+
+
+@router.get("/pool", response_model=Dict[str, Any])
+async def get_pool_stats():
+    """
+    ブロッキング処理用スレッドプールの利用状況を返す
+    """
+    return blocking_executor.stats()
+
+
+@router.get("/caches", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """
+    プロセス内キャッシュのヒット率などを返す
+    """
+    return {
+        "id_token_claims": token_verifier.claims_cache.stats(),
+        "users": user_cache.stats(),
+        "user_count": user_count_cache.stats(),
+        "data_versions": data_versions.cache.stats(),
+        "analysis": dify_service.analysis_cache.stats(),
+        "growth": dify_service.growth_cache.stats(),
+    }
+
+
+@router.get("/jobs", response_model=Dict[str, Any])
+async def get_job_queue_stats():
+    """
+    バックグラウンドジョブキューの利用状況と、分析待ちのまま残った日記の回収状況を返す
+    """
+    return {**job_queue.stats(), "pending_recovery": pending_diary_recovery.stats()}
+
+
+@router.get("/dify", response_model=Dict[str, Any])
+async def get_dify_stats():
+    """
+    Dify API呼び出しの統計情報（サーキットブレーカーの状態、重複リクエストの合流数など）を返す
+    """
+    return dify_service.stats()
+
+
+@router.get("/writes", response_model=Dict[str, Any])
+async def get_write_behind_stats():
+    """
+    日記のライトビハインド（書き込み待ちの件数、バッチ書き込みの回数など）の状態を返す
+    """
+    return diary_writer.stats()
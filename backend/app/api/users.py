@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Response
+from typing import Dict, Any, Optional
 import logging
 
 from ..models.user import UserCreate, UserResponse, User
-from ..database import db
-from ..services.user_auth import verify_firebase_token
+from ..database import repository
+from ..config import settings
+from ..services.cache import TTLCache
+from ..services.singleflight import SingleFlight
+from ..services.user_auth import verify_firebase_token, get_current_user, invalidate_user
+from ..services.executor import run_blocking
+from ..services.data_version import data_versions, etag_matches, make_etag, not_modified, set_etag
 
 # ロガーのセットアップ
 logger = logging.getLogger(__name__)
@@ -15,6 +20,11 @@ router = APIRouter(
     responses={404: {"description": "User not found"}},
 )
 
+# 登録済みユーザー数のキャッシュ（認証なしで呼ばれるため、短時間は集計クエリを省く）
+user_count_cache: TTLCache[int] = TTLCache(maxsize=1, ttl=settings.USER_COUNT_CACHE_TTL_SECONDS, name="user-count")
+# キャッシュが切れた直後の同時リクエストは1回の集計クエリにまとめる
+_user_count_flight = SingleFlight(name="user-count")
+
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register_user(user: UserCreate, firebase_uid: str = Depends(verify_firebase_token)):
@@ -34,11 +44,9 @@ async def register_user(user: UserCreate, firebase_uid: str = Depends(verify_fir
             )
         
         # すでに同じFirebase UIDのユーザーが存在するか確認
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", firebase_uid).limit(1)
-        users = list(query.stream())
+        existing_user = await run_blocking(repository.find_user_by_firebase_uid, firebase_uid)
         
-        if users:
+        if existing_user is not None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="このFirebaseアカウントは既に登録されています"
@@ -47,7 +55,7 @@ async def register_user(user: UserCreate, firebase_uid: str = Depends(verify_fir
         # 新しいユーザーを作成
         new_user = User.create(user)
         
-        # Firestoreにユーザーを保存
+        # ユーザーを保存
         user_data = {
             "id": new_user.id,
             "username": new_user.username,
@@ -56,8 +64,13 @@ async def register_user(user: UserCreate, firebase_uid: str = Depends(verify_fir
             "created_at": new_user.created_at
         }
         
-        # Firestoreの'users'コレクションにドキュメントを追加
-        db.collection('users').document(new_user.id).set(user_data)
+        # 'users'コレクションにドキュメントを追加
+        await run_blocking(repository.create_user, user_data)
+        # 未登録としてキャッシュされている可能性があるので破棄する
+        invalidate_user(firebase_uid)
+        # このインスタンスのユーザー数のキャッシュも破棄する
+        user_count_cache.clear()
+        await data_versions.bump(new_user.id)
         
         logger.info(f"新しいユーザーを登録しました: {new_user.id}, Firebase UID: {new_user.firebase_uid}")
         
@@ -80,35 +93,29 @@ async def register_user(user: UserCreate, firebase_uid: str = Depends(verify_fir
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_profile(current_user: Dict[str, Any] = Depends(verify_firebase_token)):
+async def get_current_user_profile(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
     """
-    認証済みユーザーの情報を取得する
+    認証済みユーザーの情報を取得する（データのバージョンが変わっていなければ304を返す）
     
     Args:
-        current_user: 認証済みユーザーID
+        if_none_match: 前回のレスポンスのETag
+        current_user: 認証済みユーザーの情報
     """
     try:
-        # Firebase UIDでユーザーを検索
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", current_user).limit(1)
-        users = list(query.stream())
-        
-        if not users:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="ユーザーが見つかりません。アプリでユーザー登録を完了してください。"
-            )
-        
-        user_data = users[0].to_dict()
-        
+        etag = make_etag("user-profile", current_user["id"], await data_versions.get(current_user["id"]))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         return UserResponse(
-            userId=user_data["id"],
-            username=user_data["username"],
-            mbti=user_data["mbti"],
-            created_at=user_data["created_at"]
+            userId=current_user["id"],
+            username=current_user["username"],
+            mbti=current_user["mbti"],
+            created_at=current_user["created_at"]
         )
-    except HTTPException:
-        raise
     except Exception as e:
         logger.error(f"ユーザー情報取得中にエラーが発生しました: {str(e)}")
         raise HTTPException(
@@ -120,11 +127,15 @@ async def get_current_user_profile(current_user: Dict[str, Any] = Depends(verify
 @router.get("/count", response_model=int)
 async def get_user_count():
     """
-    登録済みユーザー数を取得する
+    登録済みユーザー数を取得する（USER_COUNT_CACHE_TTL_SECONDSの間はキャッシュから返す）
     """
-    users_ref = db.collection('users')
-    users = users_ref.stream()
-    count = 0
-    for _ in users:
-        count += 1
-    return count
\ No newline at end of file
+    count = user_count_cache.get("count")
+    if count is not None:
+        return count
+
+    async def load() -> int:
+        value = await run_blocking(repository.count_users)
+        user_count_cache.set("count", value)
+        return value
+
+    return await _user_count_flight.do("count", load)
\ No newline at end of file
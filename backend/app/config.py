@@ -15,10 +15,186 @@ class Settings(BaseSettings):
         "FIREBASE_CREDENTIALS_PATH", 
         str(BASE_DIR / "firebase-credentials.json")
     )
+    # IDトークン検証に使うプロジェクトID（未設定の場合は認証情報から取得）
+    FIREBASE_PROJECT_ID: str = ""
+    # トークン無効化（revoke）をリクエストごとに確認するかどうか
+    FIREBASE_CHECK_REVOKED: bool = False
+    # デコード済みIDトークンのキャッシュ件数
+    TOKEN_CLAIMS_CACHE_SIZE: int = 10000
+    # トークン検証時に許容する時計のずれ（秒）
+    TOKEN_CLOCK_SKEW_SECONDS: int = 0
+    # IDトークンの署名検証に使う公開鍵（X.509証明書）の取得先
+    # ローカルでの負荷試験ではtools/mock_dify_server.pyの/certsを指定する
+    FIREBASE_CERTS_URL: str = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+    # 未知の鍵IDのトークンを受け取った場合に公開鍵を再取得する最小間隔（秒）
+    TOKEN_CERTS_MIN_REFRESH_SECONDS: float = 60.0
+    
+    # データの保存先（"firestore", "memory", "sqlite"）
+    # memory/sqliteはFirebaseの認証情報なしで動作するため、ローカルでの開発・負荷試験に使う
+    STORAGE_BACKEND: str = "firestore"
+    # STORAGE_BACKENDが"sqlite"の場合のデータベースファイルのパス
+    SQLITE_PATH: str = str(BASE_DIR / "mbti_diary.sqlite3")
     
     # Dify API関連の設定
     DIFY_API_KEY: str = os.environ.get("DIFY_API_KEY", "app-tfRmkpyv8gsTxJFpH9gOGR2H")
+    DIFY_BASE_URL: str = "https://api.dify.ai/v1"
     
+    # Dify API用HTTPクライアントの接続プール設定
+    DIFY_HTTP2: bool = True
+    DIFY_MAX_CONNECTIONS: int = 50
+    DIFY_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    DIFY_KEEPALIVE_EXPIRY: float = 60.0
+    # タイムアウト設定（秒）
+    DIFY_CONNECT_TIMEOUT: float = 5.0
+    DIFY_READ_TIMEOUT: float = 60.0
+    DIFY_WRITE_TIMEOUT: float = 10.0
+    DIFY_POOL_TIMEOUT: float = 10.0
+    # サーキットブレーカーの設定（直近の呼び出しの失敗率で判定）
+    DIFY_CB_FAILURE_RATE_THRESHOLD: float = 0.5
+    DIFY_CB_MINIMUM_CALLS: int = 5
+    DIFY_CB_WINDOW_SIZE: int = 20
+    DIFY_CB_OPEN_SECONDS: float = 30.0
+    DIFY_CB_HALF_OPEN_MAX_CALLS: int = 1
+    # 再試行の設定（ジッター付き指数バックオフ）
+    DIFY_MAX_RETRIES: int = 2
+    DIFY_RETRY_BASE_DELAY: float = 0.5
+    DIFY_RETRY_MAX_DELAY: float = 5.0
+    # 再試行予算: リクエスト1件ごとに貯まる再試行数と毎秒の最低補充数
+    DIFY_RETRY_BUDGET_RATIO: float = 0.2
+    DIFY_RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+    DIFY_RETRY_BUDGET_CAPACITY: float = 10.0
+    # アドミッションコントロール（同時実行数の上限と待機キュー）
+    DIFY_MAX_CONCURRENCY: int = 16
+    DIFY_ADMISSION_QUEUE_SIZE: int = 64
+    # 実行枠・レート制限のトークンを待つ最大時間（秒）
+    DIFY_ADMISSION_TIMEOUT: float = 10.0
+    # APIキーごとのトークンバケット（毎秒の送信数とバースト）
+    DIFY_RATE_LIMIT_PER_SECOND: float = 5.0
+    DIFY_RATE_LIMIT_BURST: float = 10.0
+    # ワークフローを変更したら更新する（分析キャッシュのキーに含まれる）
+    DIFY_WORKFLOW_VERSION: str = "1"
+
+    # 分析結果キャッシュの設定
+    ANALYSIS_CACHE_SIZE: int = 2000
+    ANALYSIS_CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    # Firestoreにも保存してインスタンス間で共有するかどうか
+    ANALYSIS_CACHE_PERSISTENT: bool = True
+    ANALYSIS_CACHE_COLLECTION: str = "analysis_cache"
+
+    # 日記一覧の1ページあたりの最大件数（limitにこれより大きい値を指定しても切り詰める）
+    DIARY_PAGE_MAX_SIZE: int = 100
+
+    # /diary/user/exportで1回に取得する日記の件数
+    EXPORT_PAGE_SIZE: int = 200
+
+    # /diary/user/timeseriesの設定
+    # 期間を指定しない場合に集計する日数
+    TIMESERIES_DEFAULT_DAYS: int = 365
+    # max_pointsに指定できる上限
+    TIMESERIES_MAX_POINTS: int = 500
+    # 日・週・月の区切りに使うタイムゾーンのUTCからのずれ（分。既定は日本時間）
+    TIMESERIES_TZ_OFFSET_MINUTES: int = 540
+
+    # のびしろ情報キャッシュの設定（新しい日記の保存時に破棄される）
+    GROWTH_CACHE_SIZE: int = 5000
+    GROWTH_CACHE_TTL_SECONDS: float = 24 * 3600
+    GROWTH_CACHE_COLLECTION: str = "growth_cache"
+
+    # のびしろ情報の生成に使う日記履歴ダイジェストの設定
+    HISTORY_DIGEST_COLLECTION: str = "history_digests"
+    # ダイジェストに保持する直近の日記の件数
+    HISTORY_DIGEST_WINDOW_SIZE: int = 10
+    # ダイジェストに保存する日記本文の最大文字数（要約とフィードバックはその半分）
+    HISTORY_DIGEST_ENTRY_MAX_CHARS: int = 400
+    # Dify APIに送る日記履歴テキストのトークン数の上限（概算）
+    HISTORY_DIGEST_TOKEN_BUDGET: int = 3000
+
+    # /users/countの結果をキャッシュする期間（秒）
+    USER_COUNT_CACHE_TTL_SECONDS: float = 30.0
+
+    # ユーザーごとの次元スコアの統計
+    USER_STATS_COLLECTION: str = "user_stats"
+    # EWMAの平滑化係数（0〜1。大きいほど新しい日記の重みが大きい）
+    USER_STATS_EWMA_ALPHA: float = 0.3
+
+    # ユーザーごとのデータのバージョン（ETagの計算に使う）
+    DATA_VERSION_COLLECTION: str = "user_versions"
+    DATA_VERSION_CACHE_SIZE: int = 10000
+    # 他のインスタンスで更新したバージョンが反映されるまでの最大時間（秒）
+    DATA_VERSION_CACHE_TTL_SECONDS: float = 2.0
+
+    # firebase_uid → ユーザー情報キャッシュの設定
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 600.0
+    # 未登録ユーザーをキャッシュする期間（秒）
+    USER_NEGATIVE_CACHE_TTL_SECONDS: float = 10.0
+
+    # バックグラウンド分析ジョブの設定
+    JOB_QUEUE_BACKEND: str = "memory"
+    JOB_QUEUE_CONCURRENCY: int = 4
+    JOB_QUEUE_MAX_SIZE: int = 1000
+    # 完了したジョブの状態を保持する期間（秒）
+    JOB_RETENTION_SECONDS: float = 3600
+    # キューが満杯の場合にクライアントへ返す再試行までの秒数
+    JOB_QUEUE_RETRY_AFTER_SECONDS: int = 5
+    # 分析待ちのまま残った日記の回収（インスタンスの停止でジョブが失われた場合）
+    # この時間以上分析待ちのままの日記を回収の対象にする（秒）
+    DIARY_PENDING_TIMEOUT_SECONDS: float = 600.0
+    # 回収を実行する間隔（秒）
+    DIARY_PENDING_SWEEP_INTERVAL_SECONDS: float = 300.0
+    # 分析ジョブを登録し直す最大回数（超えた日記は分析失敗にする）
+    DIARY_PENDING_MAX_RECOVERY_ATTEMPTS: int = 2
+    # SSEでイベントがない間にkeep-aliveを送る間隔（秒）
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+
+    # 日記の一括インポート
+    # 1回のリクエストで受け付ける日記の最大件数
+    BATCH_IMPORT_MAX_ENTRIES: int = 500
+    # 1件のインポートジョブ内で同時に実行するDify API呼び出しの数
+    BATCH_ANALYSIS_CONCURRENCY: int = 4
+    # 1回のバッチ書き込みでコミットする件数（Firestoreでは500件ごとに分けてコミットする）
+    BATCH_WRITE_SIZE: int = 200
+    # 混雑で拒否された日記を再試行する最大回数
+    BATCH_ADMISSION_MAX_RETRIES: int = 3
+    # バックグラウンド分析で、混雑で拒否された日記を再試行する最大回数
+    DIARY_ANALYSIS_ADMISSION_MAX_RETRIES: int = 3
+
+    # 日記保存のライトビハインド
+    # 有効な場合、分析済みの日記はジャーナルに追記した時点で応答し、ストレージへはまとめて書き込む
+    # ジャーナルはローカルのファイルなので、インスタンスのディスクが消えると応答済みの日記が失われる。
+    # Cloud Runではディスクが一時的で、応答後はCPUが割り当てられず書き込みが進まないため無効にしておく。
+    # 有効にするのは、ジャーナルを永続的なディスクに置き、CPUを常に割り当てる環境に限る
+    DIARY_WRITE_BEHIND_ENABLED: bool = False
+    # 1回のバッチ書き込みでコミットする最大件数
+    WRITE_BEHIND_MAX_BATCH_SIZE: int = 200
+    # 最初の日記を受け付けてから書き込むまでに待つ時間（秒）
+    WRITE_BEHIND_FLUSH_INTERVAL_SECONDS: float = 0.1
+    # 書き込みに失敗した場合の再試行間隔の上限（秒）
+    WRITE_BEHIND_RETRY_MAX_SECONDS: float = 30.0
+    # 他の日記は書き込めたのに書き込めなかった日記を、退避するまでに試す回数
+    WRITE_BEHIND_MAX_ITEM_ATTEMPTS: int = 3
+    # 終了時に書き込み待ちの日記を書き込むのを待つ最大時間（秒）
+    # SIGTERMから強制終了までの猶予（Cloud Runでは10秒）より短くする
+    WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS: float = 5.0
+    # 書き込み待ちの日記を記録するジャーナルファイルのパス（異常終了後の起動時に書き込み直す）
+    WRITE_BEHIND_JOURNAL_PATH: str = str(BASE_DIR / "diary_write_behind.journal")
+    # ジャーナルへの追記ごとにfsyncするかどうか（無効にすると速いが、OSの異常終了で失われる場合がある）
+    WRITE_BEHIND_FSYNC: bool = True
+
+    # レディネスチェックの設定
+    # 準備完了後に接続を確認し直す間隔（秒）
+    READINESS_CHECK_INTERVAL_SECONDS: float = 30.0
+    # 1回のチェックのタイムアウト（秒）
+    READINESS_CHECK_TIMEOUT_SECONDS: float = 5.0
+    # 準備完了前にチェックが失敗した場合の再試行間隔（初回の秒数と上限。失敗するごとに倍にする）
+    READINESS_RETRY_INITIAL_SECONDS: float = 0.5
+    READINESS_RETRY_MAX_SECONDS: float = 10.0
+
+    # ブロッキング処理用スレッドプールの設定
+    BLOCKING_POOL_MAX_WORKERS: int = 32
+    # 待機数がこの値を超えたら飽和として警告を出す
+    BLOCKING_POOL_SATURATION_WARN_QUEUE: int = 0
+
     class Config:
         env_file = ".env"
 
@@ -1,6 +1,35 @@
 """
 データベース関連のモジュール
 """
-from .firebase import db
+from ..config import settings
+from .repository import StorageRepository, SERVER_TIMESTAMP
 
-__all__ = ["db"]
\ No newline at end of file
+
+def create_repository(backend: str) -> StorageRepository:
+    """
+    設定に応じたストレージリポジトリを生成する
+
+    Args:
+        backend: バックエンドの種類（"firestore", "memory", "sqlite"）
+
+    Returns:
+        StorageRepository: ストレージリポジトリ
+    """
+    if backend == "firestore":
+        # Firebaseの初期化は最初にFirestoreへアクセスするまで遅らせる
+        from .firebase import get_firestore_client
+        from .firestore_repository import FirestoreRepository
+        return FirestoreRepository(client_factory=get_firestore_client)
+    if backend == "memory":
+        from .memory_repository import InMemoryRepository
+        return InMemoryRepository()
+    if backend == "sqlite":
+        from .sqlite_repository import SQLiteRepository
+        return SQLiteRepository(settings.SQLITE_PATH)
+    raise ValueError(f"未対応のストレージバックエンドです: {backend}")
+
+
+# アプリケーション全体で共有するストレージリポジトリ
+repository = create_repository(settings.STORAGE_BACKEND)
+
+__all__ = ["repository", "create_repository", "StorageRepository", "SERVER_TIMESTAMP"]
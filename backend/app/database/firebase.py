@@ -5,8 +5,8 @@ import logging
 import sys
 import json
 import base64
+import threading
 import google.api_core.exceptions
-from pathlib import Path
 
 from ..config import settings
 
@@ -21,91 +21,122 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-def initialize_firebase():
-    """Firebase Admin SDKの初期化"""
-    try:
-        # 環境変数から直接JSONデータを取得できるか確認
-        firebase_creds_json = os.environ.get("FIREBASE_CREDENTIALS")
+# 初期化処理を複数のスレッドから同時に呼ばれても1回だけ実行するためのロック
+_init_lock = threading.RLock()
+_db = None
+
+
+def _load_credentials() -> credentials.Certificate:
+    """環境変数FIREBASE_CREDENTIALSまたは認証情報ファイルからFirebaseの認証情報を読み込む"""
+    # 環境変数から直接JSONデータを取得できるか確認
+    firebase_creds_json = os.environ.get("FIREBASE_CREDENTIALS")
+    
+    if firebase_creds_json:
+        # 環境変数からJSON文字列を取得した場合
+        logger.debug("環境変数FIREBASE_CREDENTIALSから認証情報を読み込みます")
         
-        if firebase_creds_json:
-            # 環境変数からJSON文字列を取得した場合
-            logger.debug("環境変数FIREBASE_CREDENTIALSから認証情報を読み込みます")
-            
+        try:
+            # Base64デコードを試みる
             try:
-                # Base64デコードを試みる
-                try:
-                    decoded_json = base64.b64decode(firebase_creds_json).decode('utf-8')
-                    cred_dict = json.loads(decoded_json)
-                    logger.debug("Base64エンコードされた認証情報をデコードしました")
-                except:
-                    # Base64でなければそのままJSONとして解析
-                    cred_dict = json.loads(firebase_creds_json)
-                    logger.debug("JSONとして認証情報を解析しました")
-                
-                # 辞書から認証情報を作成
-                cred = credentials.Certificate(cred_dict)
-                logger.debug(f"環境変数から認証情報を作成しました: プロジェクトID={cred.project_id}")
-            except json.JSONDecodeError as e:
-                logger.error(f"環境変数のJSONデータの解析に失敗しました: {str(e)}")
-                raise
-        else:
-            # ファイルパスから認証情報を読み込む（従来の方法）
-            cred_path = settings.FIREBASE_CREDENTIALS_PATH
-            logger.debug(f"Firebase認証情報ファイルパス: {cred_path}")
-            
-            # 認証情報ファイルが存在するか確認
-            if not os.path.exists(cred_path):
-                logger.error(f"Firebase認証情報ファイルが見つかりません: {cred_path}")
-                raise FileNotFoundError(f"Firebase認証情報ファイルが見つかりません: {cred_path}")
+                decoded_json = base64.b64decode(firebase_creds_json).decode('utf-8')
+                cred_dict = json.loads(decoded_json)
+                logger.debug("Base64エンコードされた認証情報をデコードしました")
+            except:
+                # Base64でなければそのままJSONとして解析
+                cred_dict = json.loads(firebase_creds_json)
+                logger.debug("JSONとして認証情報を解析しました")
             
-            logger.debug("認証情報ファイルが存在することを確認しました")
-            
-            # 認証情報を読み込み
-            cred = credentials.Certificate(cred_path)
-            logger.debug(f"認証情報を読み込みました: プロジェクトID={cred.project_id}")
+            # 辞書から認証情報を作成
+            cred = credentials.Certificate(cred_dict)
+            logger.debug(f"環境変数から認証情報を作成しました: プロジェクトID={cred.project_id}")
+        except json.JSONDecodeError as e:
+            logger.error(f"環境変数のJSONデータの解析に失敗しました: {str(e)}")
+            raise
+    else:
+        # ファイルパスから認証情報を読み込む（従来の方法）
+        cred_path = settings.FIREBASE_CREDENTIALS_PATH
+        logger.debug(f"Firebase認証情報ファイルパス: {cred_path}")
         
-        # Firebase初期化をシンプルに行う
-        # 注: 複数のオプションを指定するとエラーが発生する可能性があるため、シンプルにする
-        firebase_admin.initialize_app(cred)
-        logger.debug("Firebase Admin SDKを初期化しました")
+        # 認証情報ファイルが存在するか確認
+        if not os.path.exists(cred_path):
+            logger.error(f"Firebase認証情報ファイルが見つかりません: {cred_path}")
+            raise FileNotFoundError(f"Firebase認証情報ファイルが見つかりません: {cred_path}")
         
-        # Firestoreクライアント
-        db = firestore.client()
-        logger.debug("Firestoreクライアントを取得しました")
+        logger.debug("認証情報ファイルが存在することを確認しました")
         
-        # 実際にデータを書き込むテストを行ってみる
+        # 認証情報を読み込み
+        cred = credentials.Certificate(cred_path)
+        logger.debug(f"認証情報を読み込みました: プロジェクトID={cred.project_id}")
+    return cred
+
+
+def get_firebase_app() -> firebase_admin.App:
+    """
+    Firebase Admin SDKのアプリを取得する（未初期化であれば初期化する）
+
+    何度呼び出しても初期化は1回だけ行う。初期化に失敗した場合は例外を送出し、
+    次の呼び出しで再度初期化を試みる。
+
+    Returns:
+        firebase_admin.App: 初期化済みのアプリ
+    """
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+
+    with _init_lock:
         try:
-            logger.debug("テストデータの書き込みを試みます")
-            test_ref = db.collection('_test_connection').document('test_doc')
-            test_ref.set({'timestamp': firestore.SERVER_TIMESTAMP})
-            logger.info("テストデータの書き込みに成功しました！データベース接続は正常です")
-            # テストデータを削除
-            test_ref.delete()
-            logger.debug("テストデータを削除しました")
-        except Exception as e:
-            logger.warning(f"テストデータの書き込みに失敗しました: {str(e)}")
-            # 読み取りだけでも試してみる
-            try:
-                logger.debug("代わりに読み取りテストを試みます")
-                db.collection('_test_connection').limit(1).get()
-                logger.info("読み取りテストに成功しました！データベース接続は正常です")
-            except google.api_core.exceptions.NotFound:
-                # コレクションが見つからないのは問題なし
-                logger.info("コレクションは存在しませんが、接続テストは成功しました")
-            except Exception as read_error:
-                logger.error(f"読み取りテストにも失敗しました: {str(read_error)}")
-                raise
-                
-        return db
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+        app = firebase_admin.initialize_app(_load_credentials())
+        logger.info(f"Firebase Admin SDKを初期化しました: プロジェクトID={app.project_id}")
+        return app
+
+
+def get_firestore_client():
+    """
+    Firestoreクライアントを取得する（初回の呼び出し時に作成する）
+
+    クライアントの作成では通信を行わないため、接続確認はcheck_connectivityで別に行う。
+
+    Returns:
+        google.cloud.firestore.Client: Firestoreクライアント
+    """
+    global _db
+    if _db is not None:
+        return _db
+
+    with _init_lock:
+        if _db is None:
+            app = get_firebase_app()
+            _db = firestore.client(app)
+            logger.info("Firestoreクライアントを作成しました")
+    return _db
+
+
+def check_connectivity(db=None) -> None:
+    """
+    Firestoreに接続できるか読み取りで確認する（書き込みは行わない）
+
+    Args:
+        db: 確認するFirestoreクライアント（省略時は共有のクライアント）
+
+    Raises:
+        Exception: 接続できない場合
+    """
+    db = db or get_firestore_client()
+    try:
+        db.collection('_test_connection').limit(1).get()
+    except google.api_core.exceptions.NotFound:
+        # コレクションが見つからないのは問題なし
+        pass
     except google.api_core.exceptions.PermissionDenied as pde:
         logger.error(f"Firestoreにアクセスする権限がありません: {str(pde)}")
         logger.error("サービスアカウントの権限を確認してください。")
         raise
-    except google.api_core.exceptions.ResourceExhausted as ree:
-        logger.error(f"Firestoreのクォータを超過しました: {str(ree)}")
-        raise
     except google.api_core.exceptions.FailedPrecondition as fpe:
-        logger.error(f"前提条件エラーの詳細: {str(fpe)}")
         if "The database (default) does not exist" in str(fpe):
             logger.critical(
                 "Firestoreデータベースが存在しません。Firebaseコンソールで確認してください。\n"
@@ -117,17 +148,3 @@ def initialize_firebase():
         else:
             logger.error(f"Firestoreの前提条件エラー: {str(fpe)}")
         raise
-    except Exception as e:
-        logger.error(f"Firebase初期化エラー: {type(e).__name__}: {str(e)}")
-        raise
-
-# Firebase初期化（モジュールインポート時に実行される）
-db = None
-try:
-    logger.info("Firebase初期化を開始します")
-    db = initialize_firebase()
-    if db:
-        logger.info("Firebase初期化に成功しました - データベース接続OK")
-except Exception as e:
-    logger.error(f"Firebase初期化に失敗しました: {str(e)}")
-    # アプリケーション起動は続行（ただしFirestoreを使う機能は動作しない）
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Firestoreを使うストレージリポジトリ
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from firebase_admin import firestore
+
+from .firebase import check_connectivity as check_firestore_connectivity
+from .repository import DiaryCursor, DocumentUpdater, StorageRepository
+
+# Firestoreの1回のバッチ書き込みで扱える操作数の上限
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class FirestoreRepository(StorageRepository):
+    """
+    Firestoreの'users'・'diaries'コレクションに保存するリポジトリ
+
+    日記の一覧はuser_idとcreated_atの複合インデックスを使う。
+    分析待ちの日記の回収（list_diaries_by_status）はstatusとcreated_at（昇順）の複合インデックスを使う。
+    クライアントを渡さない場合は、最初にアクセスしたときにclient_factoryで作成する。
+    """
+
+    backend_name = "firestore"
+
+    def __init__(self, client=None, client_factory: Optional[Callable[[], Any]] = None):
+        self._db = client
+        self._client_factory = client_factory
+
+    @property
+    def client(self):
+        """Firestoreクライアント（初期化に失敗した場合は例外）"""
+        if self._db is None:
+            if self._client_factory is None:
+                raise RuntimeError("Firestoreクライアントが初期化されていません")
+            self._db = self._client_factory()
+        return self._db
+
+    def check_connectivity(self) -> None:
+        check_firestore_connectivity(self.client)
+
+    @staticmethod
+    def _to_dict(doc) -> Dict[str, Any]:
+        data = doc.to_dict()
+        data.setdefault("id", doc.id)
+        return data
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.client.collection('users').document(user_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def find_user_by_firebase_uid(self, firebase_uid: str) -> Optional[Dict[str, Any]]:
+        query = self.client.collection('users').where("firebase_uid", "==", firebase_uid).limit(1)
+        for doc in query.stream():
+            return self._to_dict(doc)
+        return None
+
+    def create_user(self, user: Dict[str, Any]) -> None:
+        self.client.collection('users').document(user["id"]).set(user)
+
+    def count_users(self) -> int:
+        # 集計クエリでサーバー側で数える（ドキュメントは読み込まない）
+        result = self.client.collection('users').count().get()
+        return int(result[0][0].value)
+
+    def get_diary(self, diary_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.client.collection('diaries').document(diary_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def save_diary(self, diary: Dict[str, Any]) -> None:
+        self.client.collection('diaries').document(diary["id"]).set(diary)
+
+    def save_diaries(self, diaries: List[Dict[str, Any]]) -> None:
+        diaries_ref = self.client.collection('diaries')
+        for start in range(0, len(diaries), FIRESTORE_BATCH_LIMIT):
+            batch = self.client.batch()
+            for diary in diaries[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(diaries_ref.document(diary["id"]), diary)
+            batch.commit()
+
+    def update_diary(self, diary_id: str, fields: Dict[str, Any]) -> None:
+        self.client.collection('diaries').document(diary_id).update(fields)
+
+    def delete_diary(self, diary_id: str) -> None:
+        self.client.collection('diaries').document(diary_id).delete()
+
+    def list_user_diaries(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_after: Optional[DiaryCursor] = None,
+        fields: Optional[Sequence[str]] = None,
+        created_since: Optional[datetime] = None,
+        created_until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        # 作成日時が同じ日記の順序を固定するため、ドキュメントIDでも並べる
+        # （複合インデックスは最後の並び順と同じ向きのドキュメントIDを含むため、インデックスの追加は不要）
+        query = self.client.collection('diaries')\
+            .where('user_id', '==', user_id)\
+            .order_by('created_at', direction='DESCENDING')\
+            .order_by('__name__', direction='DESCENDING')
+        # 作成日時の範囲はuser_idとcreated_atの複合インデックスでそのまま絞り込める
+        if created_since is not None:
+            query = query.where('created_at', '>=', created_since)
+        if created_until is not None:
+            query = query.where('created_at', '<', created_until)
+        if fields is not None:
+            # フィールドの射影で、指定していないフィールド（本文など）は転送しない
+            query = query.select([field for field in fields if field != 'id'] or ['created_at'])
+        if start_after is not None:
+            created_at, diary_id = start_after
+            query = query.start_after({'created_at': created_at, '__name__': diary_id})
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def list_diaries_by_status(
+        self,
+        status: str,
+        created_before: datetime,
+        limit: int,
+        start_after: Optional[DiaryCursor] = None,
+    ) -> List[Dict[str, Any]]:
+        # statusとcreated_atの複合インデックスで、古い日記から順に絞り込む
+        query = self.client.collection('diaries')\
+            .where('status', '==', status)\
+            .where('created_at', '<', created_before)\
+            .order_by('created_at')\
+            .order_by('__name__')
+        if start_after is not None:
+            created_at, diary_id = start_after
+            query = query.start_after({'created_at': created_at, '__name__': diary_id})
+        return [self._to_dict(doc) for doc in query.limit(limit).stream()]
+
+    def scan_diaries(self, limit: int, start_after_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = self.client.collection('diaries').order_by('__name__')
+        if start_after_id is not None:
+            query = query.start_after({'__name__': start_after_id})
+        return [self._to_dict(doc) for doc in query.limit(limit).stream()]
+
+    def get_document(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        doc = self.client.collection(collection).document(key).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_document(self, collection: str, key: str, data: Dict[str, Any]) -> None:
+        self.client.collection(collection).document(key).set(data)
+
+    def delete_document(self, collection: str, key: str) -> None:
+        self.client.collection(collection).document(key).delete()
+
+    def update_document(self, collection: str, key: str, updater: DocumentUpdater) -> Dict[str, Any]:
+        doc_ref = self.client.collection(collection).document(key)
+
+        @firestore.transactional
+        def update_in_transaction(transaction) -> Dict[str, Any]:
+            snapshot = doc_ref.get(transaction=transaction)
+            data = updater(snapshot.to_dict() if snapshot.exists else None)
+            transaction.set(doc_ref, data)
+            return data
+
+        return update_in_transaction(self.client.transaction())
@@ -0,0 +1,159 @@
+"""
+プロセス内のメモリに保存するストレージリポジトリ
+"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from .repository import (
+    DiaryCursor,
+    DocumentUpdater,
+    StorageRepository,
+    diary_sort_key,
+    project_fields,
+    resolve_server_timestamps,
+    timestamp_sort_key,
+)
+
+
+class InMemoryRepository(StorageRepository):
+    """
+    プロセス内の辞書に保存するリポジトリ
+
+    外部サービスに依存しないため、ローカルでの開発・負荷試験や
+    リクエスト処理のプロファイリングに使う。プロセスを終了するとデータは失われる。
+    """
+
+    backend_name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._users_by_firebase_uid: Dict[str, str] = {}
+        self._diaries: Dict[str, Dict[str, Any]] = {}
+        self._diary_ids_by_user: Dict[str, set] = {}
+        self._documents: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user is not None else None
+
+    def find_user_by_firebase_uid(self, firebase_uid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user_id = self._users_by_firebase_uid.get(firebase_uid)
+            return dict(self._users[user_id]) if user_id is not None else None
+
+    def create_user(self, user: Dict[str, Any]) -> None:
+        user = resolve_server_timestamps(user)
+        with self._lock:
+            self._users[user["id"]] = user
+            self._users_by_firebase_uid[user["firebase_uid"]] = user["id"]
+
+    def count_users(self) -> int:
+        with self._lock:
+            return len(self._users)
+
+    def get_diary(self, diary_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            diary = self._diaries.get(diary_id)
+            return dict(diary) if diary is not None else None
+
+    def _put_diary(self, diary: Dict[str, Any]) -> None:
+        previous = self._diaries.get(diary["id"])
+        if previous is not None and previous.get("user_id") != diary.get("user_id"):
+            self._diary_ids_by_user.get(previous.get("user_id"), set()).discard(diary["id"])
+        self._diaries[diary["id"]] = diary
+        self._diary_ids_by_user.setdefault(diary.get("user_id"), set()).add(diary["id"])
+
+    def save_diary(self, diary: Dict[str, Any]) -> None:
+        diary = resolve_server_timestamps(diary)
+        with self._lock:
+            self._put_diary(diary)
+
+    def save_diaries(self, diaries: List[Dict[str, Any]]) -> None:
+        diaries = [resolve_server_timestamps(diary) for diary in diaries]
+        with self._lock:
+            for diary in diaries:
+                self._put_diary(diary)
+
+    def update_diary(self, diary_id: str, fields: Dict[str, Any]) -> None:
+        fields = resolve_server_timestamps(fields)
+        with self._lock:
+            if diary_id not in self._diaries:
+                raise KeyError(f"日記が見つかりません: {diary_id}")
+            self._put_diary({**self._diaries[diary_id], **fields})
+
+    def delete_diary(self, diary_id: str) -> None:
+        with self._lock:
+            diary = self._diaries.pop(diary_id, None)
+            if diary is not None:
+                self._diary_ids_by_user.get(diary.get("user_id"), set()).discard(diary_id)
+
+    def list_user_diaries(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_after: Optional[DiaryCursor] = None,
+        fields: Optional[Sequence[str]] = None,
+        created_since: Optional[datetime] = None,
+        created_until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            diaries = [self._diaries[diary_id] for diary_id in self._diary_ids_by_user.get(user_id, ())]
+        diaries.sort(key=lambda diary: diary_sort_key(diary.get("created_at"), diary["id"]), reverse=True)
+        if start_after is not None:
+            cursor_key = diary_sort_key(*start_after)
+            diaries = [diary for diary in diaries if diary_sort_key(diary.get("created_at"), diary["id"]) < cursor_key]
+        if created_since is not None:
+            diaries = [diary for diary in diaries if timestamp_sort_key(diary.get("created_at")) >= created_since.timestamp()]
+        if created_until is not None:
+            diaries = [diary for diary in diaries if timestamp_sort_key(diary.get("created_at")) < created_until.timestamp()]
+        if limit is not None:
+            diaries = diaries[:limit]
+        return [project_fields(diary, fields) for diary in diaries]
+
+    def list_diaries_by_status(
+        self,
+        status: str,
+        created_before: datetime,
+        limit: int,
+        start_after: Optional[DiaryCursor] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            diaries = [
+                dict(diary) for diary in self._diaries.values()
+                if diary.get("status") == status
+                and timestamp_sort_key(diary.get("created_at")) < created_before.timestamp()
+            ]
+        diaries.sort(key=lambda diary: diary_sort_key(diary.get("created_at"), diary["id"]))
+        if start_after is not None:
+            cursor_key = diary_sort_key(*start_after)
+            diaries = [diary for diary in diaries if diary_sort_key(diary.get("created_at"), diary["id"]) > cursor_key]
+        return diaries[:limit]
+
+    def scan_diaries(self, limit: int, start_after_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            diary_ids = sorted(diary_id for diary_id in self._diaries if start_after_id is None or diary_id > start_after_id)
+            return [dict(self._diaries[diary_id]) for diary_id in diary_ids[:limit]]
+
+    def get_document(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._documents.get(collection, {}).get(key)
+            return dict(data) if data is not None else None
+
+    def set_document(self, collection: str, key: str, data: Dict[str, Any]) -> None:
+        data = resolve_server_timestamps(data)
+        with self._lock:
+            self._documents.setdefault(collection, {})[key] = data
+
+    def delete_document(self, collection: str, key: str) -> None:
+        with self._lock:
+            self._documents.get(collection, {}).pop(key, None)
+
+    def update_document(self, collection: str, key: str, updater: DocumentUpdater) -> Dict[str, Any]:
+        with self._lock:
+            current = self._documents.get(collection, {}).get(key)
+            data = resolve_server_timestamps(updater(dict(current) if current is not None else None))
+            self._documents.setdefault(collection, {})[key] = data
+            return dict(data)
@@ -0,0 +1,221 @@
+"""
+ストレージリポジトリのインターフェース
+"""
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from firebase_admin import firestore
+
+# 保存時にサーバー側の現在時刻に置き換えられる値
+# Firestore以外のバックエンドでは保存時の現在時刻（UTC）に置き換える
+SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
+
+# 日記一覧のページング位置: 前のページの最後の日記の(created_at, id)
+DiaryCursor = Tuple[Any, str]
+
+# ドキュメントの読み込み・更新処理: 現在の内容（存在しない場合はNone）を受け取り、新しい内容を返す
+DocumentUpdater = Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]
+
+
+def resolve_server_timestamps(data: Dict[str, Any]) -> Dict[str, Any]:
+    """SERVER_TIMESTAMPを現在時刻（UTC）に置き換えたコピーを返す"""
+    now = datetime.now(timezone.utc)
+    return {key: now if value is SERVER_TIMESTAMP else value for key, value in data.items()}
+
+
+def timestamp_sort_key(value: Any) -> float:
+    """作成日時を並べ替え用の数値に変換する（日時でない場合は最も古い扱い）"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float("-inf")
+
+
+def project_fields(data: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """指定したフィールドだけを残したコピーを返す（idは常に含める。fieldsがNoneの場合はすべて）"""
+    if fields is None:
+        return dict(data)
+    return {key: value for key, value in data.items() if key == "id" or key in fields}
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"JSONに変換できない値です: {type(value)}")
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def dumps_document(data: Dict[str, Any]) -> str:
+    """ドキュメントをJSON文字列に変換する（datetimeは{"$datetime": ISO形式}として保存する）"""
+    return json.dumps(data, ensure_ascii=False, default=_encode_value)
+
+
+def loads_document(text: str) -> Dict[str, Any]:
+    """dumps_documentで変換したJSON文字列をドキュメントに戻す"""
+    return json.loads(text, object_hook=_decode_object)
+
+
+def diary_sort_key(created_at: Any, diary_id: str) -> Tuple[float, str]:
+    """日記一覧の並び順のキー（作成日時が同じ場合はIDで順序を決める）"""
+    return (timestamp_sort_key(created_at), diary_id)
+
+
+class StorageRepository(ABC):
+    """
+    ユーザー・日記・キャッシュ用ドキュメントを保存するリポジトリの基底クラス
+
+    ルートやサービスはこのインターフェースだけを使い、Firestoreなどの
+    バックエンドに直接依存しない。メソッドはすべてブロッキング処理なので、
+    非同期のコードからはrun_blockingで呼び出す。
+    日記・ユーザーは"id"フィールドを含む辞書として扱う。
+    """
+
+    backend_name = "base"
+
+    # ユーザー
+
+    @abstractmethod
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """ユーザーIDでユーザーを取得する"""
+
+    @abstractmethod
+    def find_user_by_firebase_uid(self, firebase_uid: str) -> Optional[Dict[str, Any]]:
+        """Firebase UIDでユーザーを検索する"""
+
+    @abstractmethod
+    def create_user(self, user: Dict[str, Any]) -> None:
+        """ユーザーを保存する"""
+
+    @abstractmethod
+    def count_users(self) -> int:
+        """登録済みユーザー数を返す"""
+
+    # 日記
+
+    @abstractmethod
+    def get_diary(self, diary_id: str) -> Optional[Dict[str, Any]]:
+        """日記IDで日記を取得する"""
+
+    @abstractmethod
+    def save_diary(self, diary: Dict[str, Any]) -> None:
+        """日記を保存する（同じIDの日記があれば置き換える）"""
+
+    @abstractmethod
+    def save_diaries(self, diaries: List[Dict[str, Any]]) -> None:
+        """複数の日記をまとめて保存する"""
+
+    @abstractmethod
+    def update_diary(self, diary_id: str, fields: Dict[str, Any]) -> None:
+        """日記の一部のフィールドを更新する"""
+
+    @abstractmethod
+    def delete_diary(self, diary_id: str) -> None:
+        """日記を削除する"""
+
+    @abstractmethod
+    def list_user_diaries(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_after: Optional[DiaryCursor] = None,
+        fields: Optional[Sequence[str]] = None,
+        created_since: Optional[datetime] = None,
+        created_until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        ユーザーの日記を作成日時の新しい順（同じ日時ではIDの降順）に取得する
+
+        Args:
+            user_id: ユーザーID
+            limit: 取得する最大件数（Noneの場合はすべて）
+            start_after: 前のページの最後の日記の(created_at, id)。指定した場合はその次の日記から取得する
+            fields: 取得するフィールド（Noneの場合はすべて）。idは常に含まれる
+            created_since: 指定した場合はこの日時以降に作成された日記だけを取得する
+            created_until: 指定した場合はこの日時より前に作成された日記だけを取得する
+
+        Returns:
+            List[Dict[str, Any]]: 日記
+        """
+
+    @abstractmethod
+    def list_diaries_by_status(
+        self,
+        status: str,
+        created_before: datetime,
+        limit: int,
+        start_after: Optional[DiaryCursor] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        すべてのユーザーの日記から、指定した状態（"pending"など）で指定日時より前に作成された日記を
+        作成日時の昇順（古い順）に取得する
+
+        Args:
+            status: 日記のstatusフィールドの値
+            created_before: この日時より前に作成された日記だけを取得する
+            limit: 取得する最大件数
+            start_after: 前のページの最後の日記の(作成日時, ID)。指定した場合はその次の日記から取得する
+
+        Returns:
+            List[Dict[str, Any]]: 日記
+        """
+
+    @abstractmethod
+    def scan_diaries(self, limit: int, start_after_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        すべてのユーザーの日記をIDの昇順に取得する（メンテナンス用のツールから使う）
+
+        Args:
+            limit: 取得する最大件数
+            start_after_id: 前のページの最後の日記のID。指定した場合はその次の日記から取得する
+
+        Returns:
+            List[Dict[str, Any]]: 日記
+        """
+
+    # キャッシュなどの補助ドキュメント
+
+    @abstractmethod
+    def get_document(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        """コレクション内のドキュメントを取得する"""
+
+    @abstractmethod
+    def set_document(self, collection: str, key: str, data: Dict[str, Any]) -> None:
+        """コレクション内のドキュメントを保存する"""
+
+    @abstractmethod
+    def delete_document(self, collection: str, key: str) -> None:
+        """コレクション内のドキュメントを削除する"""
+
+    @abstractmethod
+    def update_document(self, collection: str, key: str, updater: DocumentUpdater) -> Dict[str, Any]:
+        """
+        ドキュメントを読み込んで更新する処理を不可分に実行する
+
+        Args:
+            collection: コレクション名
+            key: ドキュメントのキー
+            updater: 現在の内容（存在しない場合はNone）から新しい内容を返す関数。
+                競合時に再実行されることがあるため副作用を持たせないこと
+
+        Returns:
+            Dict[str, Any]: 保存した内容
+        """
+
+    def check_connectivity(self) -> None:
+        """
+        バックエンドに接続できるか確認する（レディネスチェック用）
+
+        Raises:
+            Exception: 接続できない場合
+        """
+
+    def close(self) -> None:
+        """接続などのリソースを解放する"""
@@ -0,0 +1,238 @@
+"""
+SQLiteに保存するストレージリポジトリ
+"""
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from .repository import (
+    DiaryCursor,
+    DocumentUpdater,
+    StorageRepository,
+    dumps_document,
+    loads_document,
+    project_fields,
+    resolve_server_timestamps,
+    timestamp_sort_key,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    firebase_uid TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_firebase_uid ON users (firebase_uid);
+CREATE TABLE IF NOT EXISTS diaries (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    created_at REAL,
+    data TEXT NOT NULL
+);
+DROP INDEX IF EXISTS diaries_user_created_at;
+CREATE INDEX IF NOT EXISTS diaries_user_created_at_id ON diaries (user_id, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, key)
+);
+"""
+
+
+def _created_at_key(created_at: Any) -> Optional[float]:
+    key = timestamp_sort_key(created_at)
+    return key if key != float("-inf") else None
+
+
+class SQLiteRepository(StorageRepository):
+    """
+    SQLiteのファイル（または":memory:"）に保存するリポジトリ
+
+    ドキュメントはJSONとして保存し、検索に使うフィールドだけを列に持つ。
+    外部サービスなしでデータを永続化できるため、1台構成のローカル環境に使う。
+    """
+
+    backend_name = "sqlite"
+
+    def __init__(self, path: str = "mbti_diary.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        # スレッドプールの複数のスレッドから使うため、接続は1つにしてロックで直列化する
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _fetchone(self, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return loads_document(row[0]) if row else None
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._fetchone("SELECT data FROM users WHERE id = ?", (user_id,))
+
+    def find_user_by_firebase_uid(self, firebase_uid: str) -> Optional[Dict[str, Any]]:
+        return self._fetchone("SELECT data FROM users WHERE firebase_uid = ? LIMIT 1", (firebase_uid,))
+
+    def create_user(self, user: Dict[str, Any]) -> None:
+        user = resolve_server_timestamps(user)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO users (id, firebase_uid, data) VALUES (?, ?, ?)",
+                (user["id"], user.get("firebase_uid"), dumps_document(user)),
+            )
+
+    def count_users(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def get_diary(self, diary_id: str) -> Optional[Dict[str, Any]]:
+        return self._fetchone("SELECT data FROM diaries WHERE id = ?", (diary_id,))
+
+    def save_diary(self, diary: Dict[str, Any]) -> None:
+        self.save_diaries([diary])
+
+    def save_diaries(self, diaries: List[Dict[str, Any]]) -> None:
+        rows = []
+        for diary in diaries:
+            diary = resolve_server_timestamps(diary)
+            rows.append((diary["id"], diary.get("user_id"), _created_at_key(diary.get("created_at")), dumps_document(diary)))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO diaries (id, user_id, created_at, data) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def update_diary(self, diary_id: str, fields: Dict[str, Any]) -> None:
+        fields = resolve_server_timestamps(fields)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM diaries WHERE id = ?", (diary_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"日記が見つかりません: {diary_id}")
+                diary = {**loads_document(row[0]), **fields}
+                self._conn.execute(
+                    "UPDATE diaries SET user_id = ?, created_at = ?, data = ? WHERE id = ?",
+                    (diary.get("user_id"), _created_at_key(diary.get("created_at")), dumps_document(diary), diary_id),
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def delete_diary(self, diary_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM diaries WHERE id = ?", (diary_id,))
+
+    def list_user_diaries(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_after: Optional[DiaryCursor] = None,
+        fields: Optional[Sequence[str]] = None,
+        created_since: Optional[datetime] = None,
+        created_until: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        sql = "SELECT data FROM diaries WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if start_after is not None:
+            created_at, diary_id = start_after
+            created_at = _created_at_key(created_at)
+            # 作成日時のない日記（NULL）は降順の最後に並ぶ
+            if created_at is None:
+                sql += " AND created_at IS NULL AND id < ?"
+                params.append(diary_id)
+            else:
+                sql += " AND (created_at < ? OR created_at IS NULL OR (created_at = ? AND id < ?))"
+                params.extend([created_at, created_at, diary_id])
+        if created_since is not None:
+            sql += " AND created_at >= ?"
+            params.append(created_since.timestamp())
+        if created_until is not None:
+            sql += " AND created_at < ?"
+            params.append(created_until.timestamp())
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit if limit is not None else -1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # ドキュメントはJSONで1列に保存しているため、フィールドの絞り込みは読み込み後に行う
+        return [project_fields(loads_document(row[0]), fields) for row in rows]
+
+    def list_diaries_by_status(
+        self,
+        status: str,
+        created_before: datetime,
+        limit: int,
+        start_after: Optional[DiaryCursor] = None,
+    ) -> List[Dict[str, Any]]:
+        # 件数が少ないローカル環境向けのため、statusは列にせずJSONから取り出して絞り込む
+        sql = "SELECT data FROM diaries WHERE json_extract(data, '$.status') = ? AND created_at < ?"
+        params: List[Any] = [status, created_before.timestamp()]
+        if start_after is not None:
+            created_at, diary_id = start_after
+            created_at = _created_at_key(created_at)
+            sql += " AND (created_at > ? OR (created_at = ? AND id > ?))"
+            params.extend([created_at, created_at, diary_id])
+        sql += " ORDER BY created_at, id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [loads_document(row[0]) for row in rows]
+
+    def scan_diaries(self, limit: int, start_after_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM diaries WHERE id > ? ORDER BY id LIMIT ?",
+                (start_after_id or "", limit),
+            ).fetchall()
+        return [loads_document(row[0]) for row in rows]
+
+    def get_document(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._fetchone("SELECT data FROM documents WHERE collection = ? AND key = ?", (collection, key))
+
+    def set_document(self, collection: str, key: str, data: Dict[str, Any]) -> None:
+        data = resolve_server_timestamps(data)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, key, data) VALUES (?, ?, ?)",
+                (collection, key, dumps_document(data)),
+            )
+
+    def delete_document(self, collection: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE collection = ? AND key = ?", (collection, key))
+
+    def update_document(self, collection: str, key: str, updater: DocumentUpdater) -> Dict[str, Any]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data FROM documents WHERE collection = ? AND key = ?", (collection, key)
+                ).fetchone()
+                data = resolve_server_timestamps(updater(loads_document(row[0]) if row else None))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (collection, key, data) VALUES (?, ?, ?)",
+                    (collection, key, dumps_document(data)),
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return data
+
+    def check_connectivity(self) -> None:
+        with self._lock:
+            self._conn.execute("SELECT 1").fetchone()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,39 +1,71 @@
+# 起動時間の計測の起点にするため、最初にインポートする
+from app.services.startup import startup_profile, readiness_monitor
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import firebase_admin
-from firebase_admin import credentials
-import os
 import logging
 
-from app.api.diary import router as diary_router
+from app.api.diary import router as diary_router, dify_service, diary_writer, pending_diary_recovery
 from app.api.users import router as users_router
-# データベースモジュールをインポート - アプリの起動時に初期化される
-from app.database import db
+from app.api.health import router as health_router
+# ストレージリポジトリを生成する（Firestoreのクライアントは最初にアクセスしたときに作成される）
+from app.database import repository
 from app.config import settings
+from app.services.executor import blocking_executor, run_blocking
+from app.services.job_queue import job_queue
+from app.services.pagination import NEXT_CURSOR_HEADER
+from app.services.token_verifier import token_verifier
 
 # ロガーのセットアップ
 logger = logging.getLogger(__name__)
 
-# Firebase Admin SDKの初期化
-try:
-    # Firebase認証情報パスの取得
-    firebase_cred_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "firebase-credentials.json")
-    logger.info(f"Firebase認証情報ファイルパス: {firebase_cred_path}")
-    
-    if not os.path.exists(firebase_cred_path):
-        logger.error(f"Firebase認証情報ファイルが見つかりません: {firebase_cred_path}")
-        raise FileNotFoundError(f"Firebase認証情報ファイルが見つかりません: {firebase_cred_path}")
-    
-    # Firebase Admin SDKの初期化
-    cred = credentials.Certificate(firebase_cred_path)
-    firebase_admin.initialize_app(cred)
-    logger.info("Firebase Admin SDKが正常に初期化されました")
-except Exception as e:
-    logger.error(f"Firebase Admin SDKの初期化エラー: {str(e)}")
-    # アプリケーションの起動は継続するが、認証機能は動作しない
-    logger.error("Firebase認証が無効な状態でアプリケーションを起動します")
-
-app = FastAPI(title="MBTI Diary API")
+startup_profile.mark("imports")
+
+
+async def check_storage() -> None:
+    """ストレージに接続できるか確認する"""
+    await run_blocking(repository.check_connectivity)
+
+
+# ストレージに接続できるまではトラフィックを受けない
+readiness_monitor.add_check("storage", check_storage)
+# 公開鍵の取得などを最初のリクエストの前に済ませる（失敗してもトラフィックは受ける）
+readiness_monitor.add_check("auth", token_verifier.warm_up, required=False)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションの起動・終了処理"""
+    # バックグラウンド分析ジョブのワーカーを起動する
+    with startup_profile.phase("job_queue"):
+        await job_queue.start()
+    # 分析待ちのまま残った日記の回収を始める（前回の停止で失われたジョブを登録し直す）
+    await pending_diary_recovery.start()
+    # 日記のライトビハインドを起動する（前回書き込めなかった日記があれば書き込み直す）
+    if settings.DIARY_WRITE_BEHIND_ENABLED:
+        with startup_profile.phase("diary_writer"):
+            await diary_writer.start()
+    # 外部サービスへの接続確認はバックグラウンドで行い、起動を待たせない
+    with startup_profile.phase("readiness_monitor"):
+        await readiness_monitor.start()
+    startup_profile.mark_serving()
+    yield
+    await readiness_monitor.stop()
+    await pending_diary_recovery.stop()
+    # 受け付け済みのジョブを処理してからワーカーを停止する
+    await job_queue.stop()
+    # 書き込み待ちの日記をストレージに書き込んでから停止する
+    await diary_writer.stop(timeout=settings.WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS)
+    # 終了時にDify APIの接続プールを閉じる
+    await dify_service.aclose()
+    # 終了時にスレッドプールを停止する
+    blocking_executor.shutdown(wait=True)
+    # 終了時にストレージの接続を閉じる
+    repository.close()
+
+
+app = FastAPI(title="MBTI Diary API", lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
@@ -42,8 +74,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ブラウザのクライアントから次のページのカーソルとETagを読めるようにする
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 # ルーターの登録
 app.include_router(diary_router, prefix="/api/v1")
-app.include_router(users_router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(users_router, prefix="/api/v1")
+app.include_router(health_router, prefix="/api/v1")
+
+startup_profile.mark("app")
\ No newline at end of file
@@ -1,12 +1,21 @@
-from pydantic import BaseModel
-from typing import Dict, Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from datetime import date, datetime
 from uuid import uuid4
 
 class DiaryEntry(BaseModel):
     """日記エントリーのモデル"""
     content: str
 
+class DiaryImportEntry(BaseModel):
+    """一括インポートする日記のモデル（元の日付を保持する）"""
+    content: str
+    created_at: datetime
+
+class DiaryBatchRequest(BaseModel):
+    """日記の一括インポートのリクエストモデル"""
+    entries: List[DiaryImportEntry] = Field(..., min_length=1)
+
 class DiaryAnalysis(BaseModel):
     """MBTI分析結果のモデル"""
     dimensions: Dict[str, float]  # EI, SN, TF, JP のスコア
@@ -43,4 +52,37 @@ class DiaryResponse(BaseModel):
     dimensions: Dict[str, float]
     feedback: str
     summary: str
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+
+class DimensionStats(BaseModel):
+    """MBTI次元スコア1つの統計"""
+    mean: float
+    variance: float  # 不偏分散
+    stddev: float
+    ewma: Optional[float] = None  # 指数加重移動平均（日記がない場合はNone）
+
+class DiaryStatsResponse(BaseModel):
+    """ユーザーの日記の統計のレスポンスモデル"""
+    count: int
+    dimensions: Dict[str, DimensionStats]  # EI, SN, TF, JP ごとの統計
+    latest_type: Optional[str] = None  # 最新の日記のMBTIタイプ
+    latest_created_at: Optional[datetime] = None
+
+class TimeseriesPoint(BaseModel):
+    """時系列の1点（1つ以上の区間をまとめたもの）"""
+    start: date  # 区間の開始日（現地時間）
+    count: int  # 含まれる日記の件数
+    dimensions: Dict[str, float]  # EI, SN, TF, JP ごとの平均
+
+class DiaryTimeseriesResponse(BaseModel):
+    """次元スコアの時系列のレスポンスモデル"""
+    bucket: str  # 区間の大きさ（day, week, month）
+    start: date
+    end: date
+    buckets_per_point: int  # 点の数を抑えるために1点にまとめた区間の数
+    points: List[TimeseriesPoint]
+
+# 日記一覧で取得できるフィールド
+DIARY_RESPONSE_FIELDS = tuple(DiaryResponse.model_fields)
+# 一覧画面・グラフ表示用の要約ビュー（本文・フィードバック・要約を含まない）
+DIARY_SUMMARY_FIELDS = ("id", "created_at", "dimensions")
@@ -0,0 +1,51 @@
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+from datetime import datetime
+from enum import Enum
+from uuid import uuid4
+
+
+class JobStatus(str, Enum):
+    """バックグラウンドジョブの状態"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class Job(BaseModel):
+    """バックグラウンドで実行するジョブのモデル"""
+    id: str
+    type: str
+    user_id: str
+    status: JobStatus = JobStatus.PENDING
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    updated_at: datetime
+
+    @property
+    def is_finished(self) -> bool:
+        """ジョブが完了または失敗しているかどうか"""
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    @classmethod
+    def create(cls, job_type: str, user_id: str, job_id: Optional[str] = None):
+        """新しいジョブを作成する"""
+        now = datetime.now()
+        return cls(
+            id=job_id or str(uuid4()),
+            type=job_type,
+            user_id=user_id,
+            created_at=now,
+            updated_at=now
+        )
+
+
+class JobAccepted(BaseModel):
+    """ジョブ受付時のレスポンスモデル"""
+    job_id: str
+    status: JobStatus
+    status_url: str
+    events_url: str
@@ -0,0 +1,218 @@
+"""
+外部APIへの送信数を制御するアドミッションコントロール
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import HTTPException, status
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(HTTPException):
+    """
+    混雑のため外部API呼び出しを受け付けなかった場合の例外
+
+    HTTPExceptionのサブクラスなので、ルートの`except HTTPException: raise`を
+    そのまま通過してクライアントに429/503とRetry-Afterが返る。
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限
+
+    毎秒rate個のトークンを最大burst個まで補充する。reserveは先の時刻のトークンを
+    予約できるため、呼び出し側は返された秒数だけ待てば送信してよい。
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        トークンを1つ予約する
+
+        Args:
+            max_wait: 許容する最大待機時間（秒）
+
+        Returns:
+            Optional[float]: 送信まで待つべき秒数。max_waitを超える場合は予約せずNone
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            wait = 0.0 if self._tokens >= 1.0 else (1.0 - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self._tokens -= 1.0
+            return wait
+
+    def refund(self) -> None:
+        """予約したトークンを返す（送信せずに終わった場合）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate + 1.0)
+            self._updated_at = now
+
+    def time_until_available(self) -> float:
+        """次のトークンが使えるようになるまでの秒数"""
+        with self._lock:
+            tokens = min(self.burst, self._tokens + (time.monotonic() - self._updated_at) * self.rate)
+            return 0.0 if tokens >= 1.0 else (1.0 - tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    外部APIの同時実行数とAPIキーごとの送信レートを制御するクラス
+
+    同時実行数の上限を超えた呼び出しは最大max_queue件まで待機し、
+    queue_timeout秒以内に実行枠を得られなければ503を返す。
+    レート制限のトークンがqueue_timeout秒以内に得られない場合は429を返す。
+    一度に全リクエストが失敗するのではなく、待ち時間が徐々に延びるようにする。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        rate_per_second: float = 5.0,
+        burst: float = 10.0,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._active = 0
+        self._waiting = 0
+        self._peak_waiting = 0
+        self.admitted = 0
+        self.rejected_rate_limited = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate_per_second, self.burst)
+        return bucket
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[None]:
+        """
+        外部API呼び出しの実行枠を確保する
+
+        Args:
+            key: レート制限の単位となるキー（APIキーなど）
+
+        Raises:
+            AdmissionRejected: 待機キューが満杯、レート制限超過、または待機がタイムアウトした場合
+        """
+        if self._waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            logger.warning(f"'{self.name}' の待機キューが満杯のため拒否しました（待機中: {self._waiting}件）")
+            raise AdmissionRejected(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "現在混み合っています。しばらくしてからもう一度お試しください。",
+                self.queue_timeout,
+            )
+
+        bucket = self._bucket(key)
+        token_wait = bucket.reserve(self.queue_timeout)
+        if token_wait is None:
+            self.rejected_rate_limited += 1
+            retry_after = bucket.time_until_available()
+            logger.warning(f"'{self.name}' のレート制限を超えたため拒否しました（再試行まで約{retry_after:.1f}秒）")
+            raise AdmissionRejected(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "リクエストが多すぎます。しばらくしてからもう一度お試しください。",
+                retry_after,
+            )
+
+        started_at = time.monotonic()
+        if token_wait == 0 and not self._semaphore.locked():
+            # 実行枠に空きがあれば待機キューを経由せずに取得する
+            await self._semaphore.acquire()
+        else:
+            try:
+                await self._wait_for_slot(token_wait, started_at)
+            except (AdmissionRejected, asyncio.CancelledError):
+                # 送信せずに終わったので予約したトークンを返す
+                bucket.refund()
+                raise
+
+        wait = time.monotonic() - started_at
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        self.admitted += 1
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    async def _wait_for_slot(self, token_wait: float, started_at: float) -> None:
+        """レート制限のトークンと実行枠を待機キューで待つ"""
+        self._waiting += 1
+        self._peak_waiting = max(self._peak_waiting, self._waiting)
+        try:
+            if token_wait > 0:
+                await asyncio.sleep(token_wait)
+            remaining = self.queue_timeout - (time.monotonic() - started_at)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(remaining, 0.001))
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                logger.warning(f"'{self.name}' の実行枠を{self.queue_timeout}秒以内に確保できませんでした")
+                raise AdmissionRejected(
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "現在混み合っています。しばらくしてからもう一度お試しください。",
+                    self.queue_timeout,
+                )
+        finally:
+            self._waiting -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """同時実行数・待機キューの状態を返す"""
+        return {
+            "name": self.name,
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._waiting,
+            "peak_queue_depth": self._peak_waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self._total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+        }
@@ -0,0 +1,148 @@
+"""
+日記分析結果のキャッシュ
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from app.database.repository import SERVER_TIMESTAMP
+
+from app.services.cache import TTLCache
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_content(content: str) -> str:
+    """
+    キャッシュキー用に日記本文を正規化する
+
+    全角・半角の揺れ（NFKC）と前後・連続する空白の違いを吸収する。
+    """
+    normalized = unicodedata.normalize("NFKC", content)
+    return _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+
+
+def content_hash(content: str, workflow_version: str) -> str:
+    """
+    正規化した本文とワークフローのバージョンからキャッシュキーを生成する
+
+    Args:
+        content: 日記の内容
+        workflow_version: Difyワークフローのバージョン
+
+    Returns:
+        str: SHA-256のハッシュ値（16進文字列）
+    """
+    payload = f"{workflow_version}\n{normalize_content(content)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Dify分析結果の2段キャッシュ
+
+    1段目はプロセス内のLRU、2段目はストレージリポジトリ（本番ではFirestore）のコレクションに保存する。
+    2段目のドキュメントにはexpires_atを持たせているので、FirestoreのTTLポリシーを
+    このフィールドに設定すれば期限切れのドキュメントは自動で削除される。
+    """
+
+    def __init__(
+        self,
+        repository=None,
+        collection: str = "analysis_cache",
+        maxsize: int = 2000,
+        ttl: float = 7 * 24 * 3600,
+        workflow_version: str = "1",
+    ):
+        self.repository = repository
+        self.collection = collection
+        self.ttl = ttl
+        self.workflow_version = workflow_version
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl, name="analysis")
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def make_key(self, content: str) -> str:
+        """日記本文からキャッシュキーを生成する"""
+        return content_hash(content, self.workflow_version)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュから分析結果を取得する
+
+        Args:
+            key: make_keyで生成したキャッシュキー
+
+        Returns:
+            Optional[Dict[str, Any]]: 分析結果。キャッシュに存在しない場合はNone
+        """
+        result = self.memory.get(key)
+        if result is not None:
+            return result
+
+        if self.repository is not None:
+            try:
+                data = await run_blocking(self.repository.get_document, self.collection, key)
+                if data is not None:
+                    expires_at = data.get("expires_at")
+                    if (
+                        data.get("workflow_version") == self.workflow_version
+                        and isinstance(expires_at, datetime)
+                        and expires_at > datetime.now(timezone.utc)
+                    ):
+                        result = data["result"]
+                        remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+                        self.memory.set(key, result, ttl=min(self.ttl, remaining))
+                        self.persistent_hits += 1
+                        return result
+            except Exception as e:
+                # キャッシュの読み込みに失敗しても分析自体は継続する
+                logger.warning(f"分析キャッシュの読み込みに失敗しました: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        """
+        分析結果をキャッシュに保存する
+
+        Args:
+            key: make_keyで生成したキャッシュキー
+            result: 分析結果
+        """
+        self.memory.set(key, result)
+
+        if self.repository is None:
+            return
+        try:
+            await run_blocking(
+                self.repository.set_document,
+                self.collection,
+                key,
+                {
+                    "result": result,
+                    "workflow_version": self.workflow_version,
+                    "created_at": SERVER_TIMESTAMP,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+                },
+            )
+        except Exception as e:
+            logger.warning(f"分析キャッシュの保存に失敗しました: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュのヒット数などを返す"""
+        memory_stats = self.memory.stats()
+        total = memory_stats["hits"] + self.persistent_hits + self.misses
+        return {
+            "memory": memory_stats,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory_stats["hits"] + self.persistent_hits) / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,100 @@
+"""
+プロセス内キャッシュ関連のユーティリティ
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+# キャッシュに値が存在しないことを表す番兵
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """
+    有効期限付きのLRUキャッシュ
+
+    エントリ数がmaxsizeを超えると最も古く参照されたエントリから破棄する。
+    有効期限はキャッシュ全体のttl、またはエントリごとに指定した値を使用する。
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: OrderedDict[Hashable, Tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        キャッシュから値を取得する
+
+        Args:
+            key: キャッシュキー
+            default: 値が存在しない、または期限切れの場合の戻り値
+
+        Returns:
+            キャッシュされた値またはdefault
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """
+        キャッシュに値を保存する
+
+        Args:
+            key: キャッシュキー
+            value: 保存する値
+            ttl: このエントリの有効期間（秒）。未指定の場合はキャッシュ既定値
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """キャッシュからエントリを削除する"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの利用状況を返す"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,230 @@
+"""
+外部APIの障害時に呼び出しを遮断するサーキットブレーカーと再試行の制御
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    """サーキットブレーカーの状態"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いているため呼び出しを行わなかった場合の例外"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"サーキット '{name}' が開いています（再開まで約{retry_after:.0f}秒）")
+
+
+class CircuitBreaker:
+    """
+    失敗率に基づくサーキットブレーカー
+
+    直近window_size回の呼び出しのうち失敗の割合がfailure_rate_threshold以上になると
+    サーキットを開き、open_seconds秒の間は呼び出しを即座に拒否する。
+    その後は半開状態になり、half_open_max_calls回の試行呼び出しが成功すれば閉じ、
+    失敗すれば再び開く。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        minimum_calls: int = 5,
+        window_size: int = 20,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """現在の状態（開いてから一定時間が経過していれば半開とみなす）"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+            logger.info(f"サーキット '{self.name}' を半開状態にしました。試行呼び出しを許可します")
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        呼び出し前に実行可否を判定する
+
+        Raises:
+            CircuitOpenError: サーキットが開いている、または半開状態で試行数が上限に達している場合
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitState.OPEN:
+                self.rejected += 1
+                retry_after = self.open_seconds - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(self.name, max(retry_after, 0.0))
+            if state == CircuitState.HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1.0)
+                self._half_open_in_flight += 1
+
+    def record_success(self) -> None:
+        """呼び出しの成功を記録する"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_max_calls:
+                    self._state = CircuitState.CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"サーキット '{self.name}' を閉じました。通常の呼び出しを再開します")
+                return
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        """呼び出しの失敗を記録する"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (
+                self._state == CircuitState.CLOSED
+                and len(self._outcomes) >= self.minimum_calls
+                and failures / len(self._outcomes) >= self.failure_rate_threshold
+            ):
+                self._open()
+
+    def record_ignored(self) -> None:
+        """成功・失敗のどちらにも数えない結果（リクエスト側の誤りなど）を記録する"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _open(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning(f"サーキット '{self.name}' を開きました。{self.open_seconds}秒間は呼び出しを遮断します")
+
+    def stats(self) -> Dict[str, Any]:
+        """サーキットブレーカーの状態を返す"""
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            return {
+                "name": self.name,
+                "state": state.value,
+                "window_calls": calls,
+                "window_failures": failures,
+                "failure_rate": round(failures / calls, 4) if calls else 0.0,
+                "failure_rate_threshold": self.failure_rate_threshold,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "open_remaining_seconds": (
+                    round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+                    if state == CircuitState.OPEN else 0.0
+                ),
+            }
+
+
+class RetryBudget:
+    """
+    全体の再試行回数を制限する予算
+
+    通常のリクエストごとにratio分のトークンが貯まり、再試行のたびに1トークンを消費する。
+    これにより上流の障害時に再試行でリクエスト数が膨らむのを防ぐ。
+    リクエストが少ない時間帯でも再試行できるよう、毎秒min_per_second分を補充する。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, capacity: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def deposit(self) -> None:
+        """通常のリクエスト1件分のトークンを貯める"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """
+        再試行1回分のトークンを消費する
+
+        Returns:
+            bool: 再試行してよい場合はTrue
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """再試行予算の状態を返す"""
+        with self._lock:
+            self._refill()
+            return {
+                "available": round(self._tokens, 2),
+                "capacity": self.capacity,
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+            }
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    指数バックオフにフルジッターを加えた待機時間を返す
+
+    Args:
+        attempt: 何回目の再試行か（0始まり）
+        base_delay: 初回の最大待機時間（秒）
+        max_delay: 待機時間の上限（秒）
+
+    Returns:
+        float: 待機時間（秒）
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
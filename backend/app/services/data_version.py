@@ -0,0 +1,169 @@
+"""
+ユーザーごとのデータのバージョンと、それに基づくETag（条件付きGET）
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from typing import Any, Dict, Optional, Set, Union
+
+from fastapi import Response
+
+from app.config import settings
+from app.database import repository, SERVER_TIMESTAMP
+from app.services.cache import TTLCache
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+# 条件付きGETに対応したレスポンスのCache-Control（ブラウザには毎回ETagで確認させる）
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+
+class DataVersionStore:
+    """
+    ユーザーごとのデータのバージョンを管理するクラス
+
+    'user_versions'コレクションのユーザーIDのドキュメントに単調増加する整数を保持し、
+    日記の保存やユーザー登録のたびに1つ増やす。バージョンが同じ間はレスポンスも変わらないため、
+    ETagの計算にはバージョンの取得（通常はプロセス内キャッシュの参照）だけで済む。
+    このインスタンスで増やしたバージョンはすぐにキャッシュに反映し、他のインスタンスで
+    増やしたバージョンはキャッシュの有効期限が切れた時点で反映する。
+    バージョンを増やせなかったユーザーは、増やせるまで取得のたびに増やし直し、
+    それでも増やせない間は毎回異なる値を返して古いETagに一致させない（304で古いデータを返さない）。
+    """
+
+    def __init__(
+        self,
+        repository=None,
+        collection: str = "user_versions",
+        cache_size: int = 10000,
+        cache_ttl_seconds: float = 2.0,
+        bump_attempts: int = 3,
+    ):
+        self.repository = repository
+        self.collection = collection
+        self.bump_attempts = bump_attempts
+        self.cache: TTLCache[int] = TTLCache(maxsize=cache_size, ttl=cache_ttl_seconds, name="user-data-versions")
+        # データを変更したのにバージョンを増やせていないユーザー
+        self._unsynced: Set[str] = set()
+
+    async def get(self, user_id: str) -> Union[int, str]:
+        """
+        ユーザーのデータのバージョンを取得する（まだ一度も増やしていない場合は0）
+
+        Args:
+            user_id: ユーザーID
+
+        Returns:
+            Union[int, str]: バージョン。バージョンを増やせていない間は、取得のたびに異なる文字列
+        """
+        if user_id in self._unsynced and not await self.bump(user_id, attempts=1):
+            return f"unsynced-{uuid.uuid4().hex}"
+        version = self.cache.get(user_id)
+        if version is not None:
+            return version
+        document = await run_blocking(self.repository.get_document, self.collection, user_id)
+        version = int(document["version"]) if document else 0
+        self.cache.set(user_id, version)
+        return version
+
+    async def bump(self, user_id: str, attempts: Optional[int] = None) -> bool:
+        """
+        ユーザーのデータのバージョンを1つ増やす（データを変更した後に呼び出す）
+
+        失敗した場合は間隔を空けてbump_attempts回まで試す。それでも失敗した場合、データの変更は
+        成功しているため例外は送出しないが、このインスタンスでは増やせるまでgetが毎回異なる値を返す。
+
+        Args:
+            user_id: ユーザーID
+            attempts: 試す回数（Noneの場合はbump_attempts）
+
+        Returns:
+            bool: バージョンを増やせたかどうか
+        """
+        if self.repository is None:
+            return True
+
+        def update(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            version = int(current["version"]) if current else 0
+            return {"version": version + 1, "updated_at": SERVER_TIMESTAMP}
+
+        attempts = attempts or self.bump_attempts
+        for attempt in range(attempts):
+            try:
+                document = await run_blocking(self.repository.update_document, self.collection, user_id, update)
+            except Exception as e:
+                logger.warning(
+                    f"データのバージョンの更新に失敗しました（{attempt + 1}/{attempts}回目） - ユーザー: {user_id}: {str(e)}"
+                )
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+                continue
+            self.cache.set(user_id, int(document["version"]))
+            self._unsynced.discard(user_id)
+            return True
+
+        logger.error(f"データのバージョンを増やせませんでした。増やせるまでETagを毎回変えます - ユーザー: {user_id}")
+        self.cache.delete(user_id)
+        self._unsynced.add(user_id)
+        return False
+
+
+def make_etag(scope: str, user_id: str, version: Union[int, str], *variant: Any) -> str:
+    """
+    レスポンスの強いETagを作成する
+
+    Args:
+        scope: エンドポイントを区別する名前
+        user_id: ユーザーID
+        version: ユーザーのデータのバージョン（DataVersionStore.getの値）
+        variant: レスポンスの内容を変えるクエリパラメータなど
+
+    Returns:
+        str: 二重引用符で囲んだETag
+    """
+    key = "\x1f".join(str(part) for part in (scope, user_id, version, *variant))
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-MatchヘッダーがETagに一致するか判定する（弱い比較。"*"はすべてに一致する）
+
+    Args:
+        if_none_match: If-None-Matchヘッダーの値
+        etag: 現在のレスポンスのETag
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """変更がない場合に返す304レスポンスを作成する"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """レスポンスにETagとCache-Controlを設定する"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = ETAG_CACHE_CONTROL
+
+
+# ユーザーごとのデータのバージョン（全ルートで共有する）
+data_versions = DataVersionStore(
+    repository=repository,
+    collection=settings.DATA_VERSION_COLLECTION,
+    cache_size=settings.DATA_VERSION_CACHE_SIZE,
+    cache_ttl_seconds=settings.DATA_VERSION_CACHE_TTL_SECONDS,
+)
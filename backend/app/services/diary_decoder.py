@@ -0,0 +1,140 @@
+"""
+保存されている日記ドキュメントのデコードと正規化
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from pydantic import ValidationError
+
+from app.models.diary import DiaryResponse
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+# 正規の形式の日記に付けるスキーマのバージョン
+# 日記の形式を変えた場合は値を上げ、tools/backfill_diaries.pyで既存の日記を書き換える
+DIARY_SCHEMA_VERSION = 1
+
+DIMENSION_KEYS = ("EI", "SN", "TF", "JP")
+# 一覧に表示する日記が持つべきフィールド（分析待ちの日記などは持たない）
+REQUIRED_FIELDS = ("id", "content", "dimensions", "feedback", "summary")
+# 取得しなかったフィールドの値
+_EMPTY_VALUES = {"content": "", "dimensions": {}, "feedback": "", "summary": ""}
+
+
+def is_canonical(data: Dict[str, Any]) -> bool:
+    """日記が正規の形式で保存されているか（読み込み時の補正が不要か）"""
+    return data.get("schema_version") == DIARY_SCHEMA_VERSION
+
+
+def _coerce_created_at(value: Any) -> Optional[datetime]:
+    """作成日時（datetime・Firestoreのタイムスタンプ・UNIX時刻）をdatetimeに変換する（変換できない場合はNone）"""
+    if isinstance(value, datetime):
+        return value
+    if hasattr(value, "timestamp"):
+        # Firestoreのタイムスタンプ
+        return datetime.fromtimestamp(value.timestamp(), tz=timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    return None
+
+
+def _coerce_dimensions(value: Any) -> Dict[str, float]:
+    """
+    次元スコアを4つの次元すべてを持つfloatの辞書に変換する（欠損している次元は50）
+
+    Raises:
+        ValueError: スコアを数値に変換できない場合
+    """
+    if not isinstance(value, dict):
+        logger.warning(f"dimensions が辞書型ではありません: {type(value)}")
+        value = {}
+    dimensions = {key: float(score) for key, score in value.items()}
+    for key in DIMENSION_KEYS:
+        if key not in dimensions:
+            logger.warning(f"次元 {key} が欠損しています。デフォルト値 50 を設定します。")
+            dimensions[key] = 50.0
+    return dimensions
+
+
+def decode_diary(data: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> Optional[DiaryResponse]:
+    """
+    ストレージから取得した日記をDiaryResponseに変換する
+
+    正規の形式で保存されている日記は検証を省いてmodel_constructで組み立てる。
+    それ以外（古い形式の日記）は、作成日時の変換や欠損している次元の補完をしてから検証する。
+
+    Args:
+        data: ストレージから取得した日記
+        fields: 取得したフィールド（Noneの場合はすべて）。取得していないフィールドは空の値になる
+
+    Returns:
+        Optional[DiaryResponse]: 日記。一覧に表示できない日記（分析待ち・フィールドの不足・不正な値）はNone
+    """
+    selected = set(fields) if fields is not None else None
+    if is_canonical(data):
+        return DiaryResponse.model_construct(
+            id=data["id"],
+            created_at=data["created_at"],
+            **{key: data.get(key, empty) for key, empty in _EMPTY_VALUES.items()},
+        )
+
+    missing_fields = [
+        field for field in REQUIRED_FIELDS
+        if (selected is None or field in selected) and field not in data
+    ]
+    if missing_fields:
+        logger.warning(f"日記データに不足フィールドがあります: {missing_fields}, ID={data.get('id')}")
+        return None
+
+    try:
+        created_at = _coerce_created_at(data.get("created_at"))
+        if created_at is None:
+            logger.warning(f"作成日時を変換できません。現在時刻を使用します: ID={data['id']}")
+            created_at = datetime.now()
+        dimensions = _coerce_dimensions(data["dimensions"]) if "dimensions" in data else {}
+        return DiaryResponse(
+            id=data["id"],
+            content=data.get("content", ""),
+            dimensions=dimensions,
+            feedback=data.get("feedback", ""),
+            summary=data.get("summary", ""),
+            created_at=created_at,
+        )
+    except (ValidationError, TypeError, ValueError) as e:
+        logger.warning(f"日記データを変換できません: ID={data.get('id')}: {str(e)}")
+        return None
+
+
+def normalize_diary(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    古い形式の日記を正規の形式に書き換えたドキュメントを返す（バックフィル用）
+
+    作成日時をdatetimeに、次元スコアを4つの次元すべてを持つfloatに揃え、schema_versionを付ける。
+    それ以外のフィールドはそのまま残す。
+
+    Args:
+        data: ストレージから取得した日記（すべてのフィールド）
+
+    Returns:
+        Optional[Dict[str, Any]]: 正規の形式の日記。一覧に表示できない日記（分析待ちなど）や、
+            作成日時がなく補正できない日記はNone
+    """
+    if any(field not in data for field in REQUIRED_FIELDS):
+        return None
+    if not all(isinstance(data[field], str) for field in ("id", "content", "feedback", "summary")):
+        return None
+    created_at = _coerce_created_at(data.get("created_at"))
+    if created_at is None:
+        return None
+    try:
+        dimensions = _coerce_dimensions(data["dimensions"])
+    except (TypeError, ValueError):
+        return None
+    return {
+        **data,
+        "dimensions": dimensions,
+        "created_at": created_at,
+        "schema_version": DIARY_SCHEMA_VERSION,
+    }
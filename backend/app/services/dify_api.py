@@ -1,46 +1,178 @@
-import requests
+import asyncio
+import httpx
 import logging
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, AsyncIterator
 import uuid
-from datetime import datetime, timedelta
-from firebase_admin import firestore
+from datetime import datetime
+
+from app.config import settings
+from app.services.analysis_cache import AnalysisCache
+from app.services.growth_cache import GrowthCache, history_fingerprint
+from app.services.history_digest import HistoryDigestStore, format_history
+from app.services.singleflight import SingleFlight
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from app.services.admission import AdmissionController, AdmissionRejected
 
 logger = logging.getLogger(__name__)
 
+class DifyAPIError(Exception):
+    """Dify APIがエラーレスポンスを返した場合の例外"""
+    
+    def __init__(self, status_code: int, message: str):
+        self.status_code = status_code
+        super().__init__(message)
+    
+    @property
+    def retryable(self) -> bool:
+        """一時的な障害として再試行してよいエラーかどうか"""
+        return self.status_code == 429 or self.status_code >= 500
+
 class DifyAPIService:
     """Dify APIとの連携を行うサービスクラス"""
     
-    def __init__(self, api_key: str = "app-tfRmkpyv8gsTxJFpH9gOGR2H", db=None):
+    def __init__(self, api_key: str = "app-tfRmkpyv8gsTxJFpH9gOGR2H", repository=None, base_url: Optional[str] = None):
         self.api_key = api_key
-        self.base_url = "https://api.dify.ai/v1"
+        self.base_url = base_url or settings.DIFY_BASE_URL
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        self.db = db  # Firestoreクライアントを保持
+        self.repository = repository  # ストレージリポジトリを保持
+        # 同じ本文の再分析を避けるための分析結果キャッシュ
+        self.analysis_cache = AnalysisCache(
+            repository=repository if settings.ANALYSIS_CACHE_PERSISTENT else None,
+            collection=settings.ANALYSIS_CACHE_COLLECTION,
+            maxsize=settings.ANALYSIS_CACHE_SIZE,
+            ttl=settings.ANALYSIS_CACHE_TTL_SECONDS,
+            workflow_version=settings.DIFY_WORKFLOW_VERSION,
+        )
+        # 日記が増えるまで同じ結果を返すためののびしろ情報キャッシュ
+        self.growth_cache = GrowthCache(
+            repository=repository,
+            collection=settings.GROWTH_CACHE_COLLECTION,
+            maxsize=settings.GROWTH_CACHE_SIZE,
+            ttl=settings.GROWTH_CACHE_TTL_SECONDS,
+        )
+        # のびしろ情報の生成で毎回日記を読み直さないための日記履歴ダイジェスト
+        self.history_digest = HistoryDigestStore(
+            repository=repository,
+            collection=settings.HISTORY_DIGEST_COLLECTION,
+            window_size=settings.HISTORY_DIGEST_WINDOW_SIZE,
+            entry_max_chars=settings.HISTORY_DIGEST_ENTRY_MAX_CHARS,
+        )
+        # 同時に届いた同じ分析・のびしろ生成をまとめてDify APIの呼び出しを1回にする
+        self.analysis_flight = SingleFlight(name="analysis")
+        self.growth_flight = SingleFlight(name="growth")
+        # Difyの障害時に呼び出しを遮断し、すぐに既定値を返すためのサーキットブレーカー
+        self.circuit_breaker = CircuitBreaker(
+            name="dify",
+            failure_rate_threshold=settings.DIFY_CB_FAILURE_RATE_THRESHOLD,
+            minimum_calls=settings.DIFY_CB_MINIMUM_CALLS,
+            window_size=settings.DIFY_CB_WINDOW_SIZE,
+            open_seconds=settings.DIFY_CB_OPEN_SECONDS,
+            half_open_max_calls=settings.DIFY_CB_HALF_OPEN_MAX_CALLS,
+        )
+        # 再試行でリクエストが膨らまないよう全体の再試行回数を制限する
+        self.retry_budget = RetryBudget(
+            ratio=settings.DIFY_RETRY_BUDGET_RATIO,
+            min_per_second=settings.DIFY_RETRY_BUDGET_MIN_PER_SECOND,
+            capacity=settings.DIFY_RETRY_BUDGET_CAPACITY,
+        )
+        # 同時実行数とAPIキーごとの送信レートを制限し、混雑時は429/503を返す
+        self.admission = AdmissionController(
+            name="dify",
+            max_concurrency=settings.DIFY_MAX_CONCURRENCY,
+            max_queue=settings.DIFY_ADMISSION_QUEUE_SIZE,
+            queue_timeout=settings.DIFY_ADMISSION_TIMEOUT,
+            rate_per_second=settings.DIFY_RATE_LIMIT_PER_SECOND,
+            burst=settings.DIFY_RATE_LIMIT_BURST,
+        )
+        # 接続を使い回すためのHTTPクライアント（初回呼び出し時に生成）
+        self._client: Optional[httpx.AsyncClient] = None
         logger.info(f"Dify API初期化完了: ワークフローAPIを使用")
     
-    def analyze_diary(self, content: str) -> Dict[str, Any]:
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        接続プール付きのHTTPクライアントを取得する
+        
+        クライアントは一度だけ生成し、analyze_diaryとget_growth_adviceで共有する。
+        これによりTLSハンドシェイクを毎回行わずにkeep-alive接続を再利用できる。
+        """
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=settings.DIFY_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DIFY_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.DIFY_KEEPALIVE_EXPIRY,
+            )
+            timeout = httpx.Timeout(
+                connect=settings.DIFY_CONNECT_TIMEOUT,
+                read=settings.DIFY_READ_TIMEOUT,
+                write=settings.DIFY_WRITE_TIMEOUT,
+                pool=settings.DIFY_POOL_TIMEOUT,
+            )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=limits,
+                timeout=timeout,
+                http2=settings.DIFY_HTTP2,
+            )
+            logger.info(f"Dify API用HTTPクライアントを生成しました（HTTP/2: {settings.DIFY_HTTP2}, 最大接続数: {settings.DIFY_MAX_CONNECTIONS}）")
+        return self._client
+    
+    async def aclose(self) -> None:
+        """HTTPクライアントを閉じて接続プールを解放する"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Dify API用HTTPクライアントを閉じました")
+        self._client = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Dify API呼び出しの統計情報を返す"""
+        return {
+            "circuit_breaker": self.circuit_breaker.stats(),
+            "retry_budget": self.retry_budget.stats(),
+            "admission": self.admission.stats(),
+            "coalescing": {
+                "analysis": self.analysis_flight.stats(),
+                "growth": self.growth_flight.stats(),
+            },
+        }
+    
+    async def analyze_diary(self, content: str, use_fallback: bool = True) -> Dict[str, Any]:
         """
         日記の内容をDify APIに送信してMBTI分析を行う
         
         Args:
             content: 日記の内容
+            use_fallback: 分析に失敗した場合に既定値を返すかどうか。Falseの場合は例外を送出する
             
         Returns:
             Dict[str, Any]: MBTIの次元スコア (E, N, F, J), フィードバック, 要約を含む辞書
         """
         try:
-            # ユーザーIDを生成（セッション追跡用）
-            user_id = f"mbti-diary-{uuid.uuid4()}"
+            # 同じ本文の分析結果がキャッシュにあればDify APIを呼ばずに返す
+            cache_key = self.analysis_cache.make_key(content)
+            cached = await self.analysis_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"分析結果をキャッシュから返します（キー: {cache_key[:12]}）")
+                return cached
             
-            # Dify workflows/run エンドポイントを使用
-            result = self._call_workflow_endpoint(content, user_id, "analysis")
-            return result
+            # 同じ本文の分析が実行中であれば、その結果を待って共有する
+            return await self.analysis_flight.do(cache_key, lambda: self._run_analysis(content, cache_key))
             
+        except AdmissionRejected:
+            # 混雑による拒否は既定値で隠さずにクライアントへ429/503を返す
+            raise
         except Exception as e:
-            logger.error(f"Dify API呼び出し中にエラーが発生しました: {str(e)}")
+            if not use_fallback:
+                raise
+            if isinstance(e, CircuitOpenError):
+                # Difyが停止中と判断されている間は待たずに既定値を返す
+                logger.warning(f"Dify APIを呼び出さずに既定の分析結果を返します: {str(e)}")
+            else:
+                logger.error(f"Dify API呼び出し中にエラーが発生しました: {str(e)}")
             # エラー時はデフォルト値を返す
             return {
                 "dimensions": {
@@ -53,48 +185,67 @@ class DifyAPIService:
                 "summary": "分析結果を取得できませんでした。もう一度お試しください。"
             }
     
-    def get_growth_advice(self, user_id: str) -> Dict[str, Any]:
+    async def _run_analysis(self, content: str, cache_key: str) -> Dict[str, Any]:
+        """Dify APIで日記を分析し、結果をキャッシュに保存する"""
+        # ユーザーIDを生成（セッション追跡用）
+        user_id = f"mbti-diary-{uuid.uuid4()}"
+        
+        # Dify workflows/run エンドポイントを使用
+        result = await self._call_workflow_endpoint(content, user_id, "analysis")
+        # エラー時のデフォルト値はキャッシュしない
+        await self.analysis_cache.set(cache_key, result)
+        return result
+    
+    async def get_growth_advice(self, user_id: str, use_fallback: bool = True) -> Dict[str, Any]:
         """
         ユーザーののびしろ情報をDify APIから取得する
         
         Args:
             user_id: ユーザーID
+            use_fallback: 取得に失敗した場合に既定値を返すかどうか。Falseの場合は例外を送出する
             
         Returns:
             Dict[str, Any]: のびしろアドバイス情報を含む辞書
         """
         try:
-            # 日記データを取得して整形する
-            diary_history = self._format_diary_history(user_id)
+            # 日記履歴ダイジェストを取得し、キャッシュの生成後に日記が保存されていないか確かめる
+            entries = await self.history_digest.load(user_id)
+            fingerprint = history_fingerprint([entry["id"] for entry in entries]) if entries is not None else None
             
-            # Dify workflows/run エンドポイントを使用
-            result = self._call_workflow_endpoint("", user_id, "growth", history=diary_history)
+            # 新しい日記が保存されていなければキャッシュ済みの結果を返す
+            # （履歴を取得できない場合は、キャッシュが最新か確かめられないため使わない）
+            if fingerprint is not None:
+                cached = await self.growth_cache.get(user_id, fingerprint)
+                if cached is not None:
+                    logger.info(f"ユーザー {user_id} ののびしろ情報をキャッシュから返します")
+                    return cached
             
-            # レスポンスの変換処理
-            return {
-                "advice": [
-                    {
-                        "id": 1,
-                        "title": result.get("message1", "内向的な特性を活かす"),
-                        "description": result.get("content1", "深い思考と自己理解を大切にしながら、時には小さな社交の機会も取り入れてみましょう。"),
-                    },
-                    {
-                        "id": 2,
-                        "title": result.get("message2", "直感力の向上"),
-                        "description": result.get("content2", "パターンや関連性を見出す習慣をつけることで、より創造的な問題解決が可能になります。"),
-                    },
-                    {
-                        "id": 3,
-                        "title": result.get("message3", "バランスの取れた判断"),
-                        "description": result.get("content3", "論理的思考と感情的な理解のバランスを意識することで、より良い決断ができるようになります。"),
-                    }
-                ]
-            }
+            # 同じ履歴からののびしろ情報を生成中であれば、その結果を待って共有する
+            return await self.growth_flight.do(
+                f"{user_id}:{fingerprint}", lambda: self._generate_growth_advice(user_id, entries, fingerprint)
+            )
             
+        except AdmissionRejected:
+            # 混雑による拒否は既定値で隠さずにクライアントへ429/503を返す
+            raise
         except Exception as e:
-            logger.error(f"Dify APIのびしろ情報取得中にエラーが発生しました: {str(e)}")
-            # エラー時はデフォルト値を返す
-            return {
+            if not use_fallback:
+                raise
+            return self.fallback_growth_advice(e)
+    
+    def fallback_growth_advice(self, error: Exception) -> Dict[str, Any]:
+        """
+        のびしろ情報を取得できなかった場合の既定値を返す
+        
+        Args:
+            error: 取得に失敗した原因の例外
+        """
+        if isinstance(error, CircuitOpenError):
+            # Difyが停止中と判断されている間は待たずに既定値を返す
+            logger.warning(f"Dify APIを呼び出さずに既定ののびしろ情報を返します: {str(error)}")
+        else:
+            logger.error(f"Dify APIのびしろ情報取得中にエラーが発生しました: {str(error)}")
+        return {
                 "advice": [
                     {
                         "id": 1,
@@ -114,94 +265,55 @@ class DifyAPIService:
                 ]
             }
     
-    def _format_diary_history(self, user_id: str) -> str:
+    async def _generate_growth_advice(
+        self, user_id: str, entries: Optional[List[Dict[str, Any]]], fingerprint: Optional[str]
+    ) -> Dict[str, Any]:
         """
-        ユーザーの日記データを取得してAIが読み取りやすいフォーマットに変換する
+        日記履歴からDify APIでのびしろ情報を生成し、結果をキャッシュに保存する
         
         Args:
             user_id: ユーザーID
-            
-        Returns:
-            str: フォーマット済みの日記履歴テキスト
+            entries: 日記履歴ダイジェストのエントリー（取得に失敗した場合はNone）
+            fingerprint: entriesの日記IDのフィンガープリント
         """
-        try:
-            # データベースの参照を取得
-            from app.database import db
-            
-            # 日記データを取得（作成日時の降順）
-            diary_docs = db.collection('diaries')\
-                .where('user_id', '==', user_id)\
-                .order_by('created_at', direction='DESCENDING')\
-                .limit(10)\
-                .stream()
-            
-            diaries = []
-            for doc in diary_docs:
-                diary_data = doc.to_dict()
-                # 必須フィールドの存在確認
-                if all(field in diary_data for field in ['content', 'dimensions', 'feedback', 'summary']):
-                    # created_atがタイムスタンプの場合は変換
-                    created_at = diary_data.get('created_at')
-                    if hasattr(created_at, 'timestamp'):
-                        created_at = datetime.fromtimestamp(created_at.timestamp())
-                    elif isinstance(created_at, (int, float)):
-                        created_at = datetime.fromtimestamp(created_at)
-                    else:
-                        created_at = datetime.now()  # デフォルト値
-                    
-                    # 日記データを整形
-                    diary_entry = {
-                        "content": diary_data.get('content', ''),
-                        "dimensions": diary_data.get('dimensions', {}),
-                        "feedback": diary_data.get('feedback', ''),
-                        "summary": diary_data.get('summary', ''),
-                        "created_at": created_at
-                    }
-                    diaries.append(diary_entry)
-            
-            # フォーマット済みテキストを生成
-            if not diaries:
-                return "過去の日記データはありません。"
-            
-            formatted_text = "【ユーザーの過去の日記データ】\n\n"
-            
-            for i, diary in enumerate(diaries):
-                created_at = diary.get('created_at', datetime.now()).strftime('%Y-%m-%d')
-                content = diary.get('content', '')
-                dimensions = diary.get('dimensions', {})
-                feedback = diary.get('feedback', '')
-                summary = diary.get('summary', '')
-                
-                # MBTI次元スコアを取得
-                ei_score = dimensions.get('EI', 50)
-                sn_score = dimensions.get('SN', 50)
-                tf_score = dimensions.get('TF', 50)
-                jp_score = dimensions.get('JP', 50)
-                
-                # 日記エントリーをフォーマット
-                entry = f"【日記 {i+1}】{created_at}\n"
-                entry += f"内容: {content}\n"
-                entry += f"MBTI分析: E-I={ei_score}, S-N={sn_score}, T-F={tf_score}, J-P={jp_score}\n"
-                entry += f"要約: {summary}\n"
-                entry += f"フィードバック: {feedback}\n\n"
-                
-                formatted_text += entry
-            
-            # 分析依頼を追加
-            formatted_text += "【分析依頼】\n"
-            formatted_text += "上記の日記データを分析し、ユーザーの性格的な特徴と成長のためのアドバイスを3つ提案してください。\n"
-            
-            logger.info(f"ユーザー {user_id} の日記履歴をフォーマットしました（{len(diaries)}件）")
-            return formatted_text
-                
-        except Exception as e:
-            logger.error(f"日記履歴のフォーマット中にエラーが発生しました: {str(e)}")
-            return "日記履歴の取得中にエラーが発生しました。"
-    
-    def _call_workflow_endpoint(self, content: str, user_id: str, request_type: str = "analysis", history: str = None) -> Dict[str, Any]:
-        """Workflows APIエンドポイントを呼び出す"""
-        endpoint = f"{self.base_url}/workflows/run"
+        # 日記履歴をトークン数の上限内に収まるよう整形する
+        if entries is None:
+            diary_history = "日記履歴の取得中にエラーが発生しました。"
+        else:
+            diary_history = format_history(entries, settings.HISTORY_DIGEST_TOKEN_BUDGET)
+            logger.info(f"ユーザー {user_id} の日記履歴をフォーマットしました（{len(entries)}件）")
         
+        # Dify workflows/run エンドポイントを使用
+        result = await self._call_workflow_endpoint("", user_id, "growth", history=diary_history)
+        
+        # レスポンスの変換処理
+        growth_data = {
+            "advice": [
+                {
+                    "id": 1,
+                    "title": result.get("message1", "内向的な特性を活かす"),
+                    "description": result.get("content1", "深い思考と自己理解を大切にしながら、時には小さな社交の機会も取り入れてみましょう。"),
+                },
+                {
+                    "id": 2,
+                    "title": result.get("message2", "直感力の向上"),
+                    "description": result.get("content2", "パターンや関連性を見出す習慣をつけることで、より創造的な問題解決が可能になります。"),
+                },
+                {
+                    "id": 3,
+                    "title": result.get("message3", "バランスの取れた判断"),
+                    "description": result.get("content3", "論理的思考と感情的な理解のバランスを意識することで、より良い決断ができるようになります。"),
+                }
+            ]
+        }
+        
+        # 履歴の取得に失敗した場合はキャッシュしない
+        if fingerprint is not None:
+            await self.growth_cache.set(user_id, fingerprint, growth_data)
+        return growth_data
+    
+    def _build_payload(self, content: str, user_id: str, request_type: str, history: Optional[str], response_mode: str) -> Dict[str, Any]:
+        """Workflows APIに送るリクエストボディを作成する"""
         # リクエストタイプに応じた入力を作成
         inputs = {
             "type": request_type
@@ -216,18 +328,113 @@ class DifyAPIService:
             if history:
                 inputs["history"] = history
         
-        payload = {
+        return {
             "inputs": inputs,
-            "response_mode": "blocking",
+            "response_mode": response_mode,
             "user": user_id
         }
+    
+    def _parse_outputs(self, request_type: str, outputs: Dict[str, Any]) -> Dict[str, Any]:
+        """ワークフローの出力をリクエストタイプに応じた結果に変換する"""
+        if request_type == "analysis":
+            # 分析リクエストの場合
+            e_score = outputs.get("E", 50.0)
+            n_score = outputs.get("N", 50.0)
+            f_score = outputs.get("F", 50.0)
+            j_score = outputs.get("J", 50.0)
+            feedback = outputs.get("feedback", "フィードバックが生成されませんでした")
+            summary = outputs.get("summary", "要約が生成されませんでした")
+            
+            logger.debug(f"分析結果: E={e_score}, N={n_score}, F={f_score}, J={j_score}")
+            logger.debug(f"フィードバック: {feedback}")
+            logger.debug(f"要約: {summary}")
+            
+            # 結果を返す
+            return {
+                "dimensions": {
+                    "EI": float(e_score),
+                    "SN": float(n_score),
+                    "TF": float(f_score),
+                    "JP": float(j_score)
+                },
+                "feedback": feedback,
+                "summary": summary
+            }
+        elif request_type == "growth":
+            # のびしろリクエストの場合
+            message1 = outputs.get("message1", "内向的な特性を活かす")
+            content1 = outputs.get("content1", "深い思考と自己理解を大切にしながら、時には小さな社交の機会も取り入れてみましょう。")
+            message2 = outputs.get("message2", "直感力の向上")
+            content2 = outputs.get("content2", "パターンや関連性を見出す習慣をつけることで、より創造的な問題解決が可能になります。")
+            message3 = outputs.get("message3", "バランスの取れた判断")
+            content3 = outputs.get("content3", "論理的思考と感情的な理解のバランスを意識することで、より良い決断ができるようになります。")
+            
+            logger.debug(f"のびしろ情報取得成功: {message1}, {message2}, {message3}")
+            
+            # 結果を返す
+            return {
+                "message1": message1,
+                "content1": content1,
+                "message2": message2,
+                "content2": content2,
+                "message3": message3,
+                "content3": content3
+            }
+        else:
+            # その他のリクエストタイプの場合
+            return outputs
+    
+    async def _call_workflow_endpoint(self, content: str, user_id: str, request_type: str = "analysis", history: str = None) -> Dict[str, Any]:
+        """
+        Workflows APIエンドポイントを呼び出す
+        
+        サーキットブレーカーが開いている間は呼び出さずにCircuitOpenErrorを送出する。
+        一時的な障害（通信エラー、429、5xx）の場合は再試行予算の範囲内で
+        ジッター付き指数バックオフで再試行する。
+        各試行はアドミッションコントロールで同時実行数と送信レートを制限し、
+        枠を確保できない場合はAdmissionRejectedを送出する。
+        """
+        endpoint = "/workflows/run"
+        payload = self._build_payload(content, user_id, request_type, history, "blocking")
         
-        logger.info(f"Dify API Workflows エンドポイントに接続: {endpoint}, タイプ: {request_type}")
+        logger.info(f"Dify API Workflows エンドポイントに接続: {self.base_url}{endpoint}, タイプ: {request_type}")
         if history:
             logger.info(f"日記履歴データ付きでリクエスト（約{len(history)}文字）")
         
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_call()
+            try:
+                async with self.admission.admit(self.api_key):
+                    result = await self._post_workflow(endpoint, payload, request_type)
+            except Exception as e:
+                upstream_failure = self._is_upstream_failure(e)
+                if upstream_failure:
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_ignored()
+                
+                if (
+                    not upstream_failure
+                    or attempt >= settings.DIFY_MAX_RETRIES
+                    or not self.retry_budget.try_withdraw()
+                ):
+                    raise
+                
+                delay = backoff_delay(attempt, settings.DIFY_RETRY_BASE_DELAY, settings.DIFY_RETRY_MAX_DELAY)
+                attempt += 1
+                logger.warning(f"Dify API呼び出しに失敗したため{delay:.2f}秒後に再試行します（{attempt}回目）: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            
+            self.circuit_breaker.record_success()
+            return result
+    
+    async def _post_workflow(self, endpoint: str, payload: Dict[str, Any], request_type: str) -> Dict[str, Any]:
+        """Workflows APIにリクエストを1回送信し、結果を変換して返す"""
         start_time = datetime.now()
-        response = requests.post(endpoint, json=payload, headers=self.headers, timeout=60)
+        response = await self._get_client().post(endpoint, json=payload)
         end_time = datetime.now()
         logger.info(f"Dify API呼び出し時間: {(end_time - start_time).total_seconds()}秒")
         
@@ -238,54 +445,113 @@ class DifyAPIService:
             # レスポンスからデータを取得
             result_data = response_data.get("data", {})
             outputs = result_data.get("outputs", {})
+            return self._parse_outputs(request_type, outputs)
+        else:
+            logger.error(f"Dify API呼び出しエラー: {response.status_code}, {response.text}")
+            raise DifyAPIError(response.status_code, f"Dify API呼び出しエラー: {response.status_code}, {response.text}")
+    
+    @staticmethod
+    def _is_upstream_failure(error: Exception) -> bool:
+        """Dify側の障害とみなして再試行・サーキットブレーカーの失敗に数えるエラーかどうか"""
+        if isinstance(error, httpx.TransportError):
+            return True
+        return isinstance(error, DifyAPIError) and error.retryable
+    
+    async def stream_analysis(self, content: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        日記の内容をDify APIのストリーミングモードで分析する
+        
+        生成途中のテキストを{"event": "text_chunk", "text": ..., "field": ...}として順に返し、
+        ワークフロー完了時に{"event": "result", "data": 分析結果}を返す。
+        同じ本文の分析結果がキャッシュにある場合はresultだけをすぐに返す。
+        途中まで送信したテキストがあるため、ストリーミングでは再試行しない。
+        
+        Args:
+            content: 日記の内容
             
-            if request_type == "analysis":
-                # 分析リクエストの場合
-                e_score = outputs.get("E", 50.0)
-                n_score = outputs.get("N", 50.0)
-                f_score = outputs.get("F", 50.0)
-                j_score = outputs.get("J", 50.0)
-                feedback = outputs.get("feedback", "フィードバックが生成されませんでした")
-                summary = outputs.get("summary", "要約が生成されませんでした")
-                
-                logger.debug(f"分析結果: E={e_score}, N={n_score}, F={f_score}, J={j_score}")
-                logger.debug(f"フィードバック: {feedback}")
-                logger.debug(f"要約: {summary}")
-                
-                # 結果を返す
-                return {
-                    "dimensions": {
-                        "EI": float(e_score),
-                        "SN": float(n_score),
-                        "TF": float(f_score),
-                        "JP": float(j_score)
-                    },
-                    "feedback": feedback,
-                    "summary": summary
-                }
-            elif request_type == "growth":
-                # のびしろリクエストの場合
-                message1 = outputs.get("message1", "内向的な特性を活かす")
-                content1 = outputs.get("content1", "深い思考と自己理解を大切にしながら、時には小さな社交の機会も取り入れてみましょう。")
-                message2 = outputs.get("message2", "直感力の向上")
-                content2 = outputs.get("content2", "パターンや関連性を見出す習慣をつけることで、より創造的な問題解決が可能になります。")
-                message3 = outputs.get("message3", "バランスの取れた判断")
-                content3 = outputs.get("content3", "論理的思考と感情的な理解のバランスを意識することで、より良い決断ができるようになります。")
+        Yields:
+            Dict[str, Any]: ストリーミングイベント
+        
+        Raises:
+            CircuitOpenError: サーキットブレーカーが開いている場合
+            AdmissionRejected: 混雑により送信できなかった場合
+            Exception: Dify APIの呼び出しまたはワークフローが失敗した場合
+        """
+        cache_key = self.analysis_cache.make_key(content)
+        cached = await self.analysis_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"分析結果をキャッシュから返します（キー: {cache_key[:12]}）")
+            yield {"event": "result", "data": cached}
+            return
+        
+        user_id = f"mbti-diary-{uuid.uuid4()}"
+        payload = self._build_payload(content, user_id, "analysis", None, "streaming")
+        
+        self.circuit_breaker.before_call()
+        outcome_recorded = False
+        try:
+            async with self.admission.admit(self.api_key):
+                async for event in self._stream_workflow("/workflows/run", payload):
+                    if event["event"] == "result":
+                        self.circuit_breaker.record_success()
+                        outcome_recorded = True
+                        await self.analysis_cache.set(cache_key, event["data"])
+                    yield event
+        except Exception as e:
+            if not outcome_recorded:
+                if self._is_upstream_failure(e):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_ignored()
+                outcome_recorded = True
+            raise
+        finally:
+            # クライアントの切断などで途中終了した場合は結果に数えない
+            if not outcome_recorded:
+                self.circuit_breaker.record_ignored()
+    
+    async def _stream_workflow(self, endpoint: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Workflows APIをストリーミングモードで呼び出し、イベントを変換して返す"""
+        logger.info(f"Dify API Workflows エンドポイントにストリーミング接続: {self.base_url}{endpoint}")
+        start_time = datetime.now()
+        first_chunk_logged = False
+        
+        async with self._get_client().stream("POST", endpoint, json=payload) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                logger.error(f"Dify API呼び出しエラー: {response.status_code}, {body.decode('utf-8', 'replace')}")
+                raise DifyAPIError(response.status_code, f"Dify API呼び出しエラー: {response.status_code}")
+            
+            async for line in response.aiter_lines():
+                # SSEのdata行だけを処理する（ping等のコメント行や空行は無視）
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[len("data:"):].strip())
+                except json.JSONDecodeError:
+                    logger.warning(f"Dify APIのストリーミングイベントを解析できません: {line[:100]}")
+                    continue
                 
-                logger.debug(f"のびしろ情報取得成功: {message1}, {message2}, {message3}")
+                event_type = event.get("event")
+                data = event.get("data") or {}
                 
-                # 結果を返す
-                return {
-                    "message1": message1,
-                    "content1": content1,
-                    "message2": message2,
-                    "content2": content2,
-                    "message3": message3,
-                    "content3": content3
-                }
-            else:
-                # その他のリクエストタイプの場合
-                return outputs
-        else:
-            logger.error(f"Dify API呼び出しエラー: {response.status_code}, {response.text}")
-            raise Exception(f"Dify API呼び出しエラー: {response.status_code}, {response.text}")
\ No newline at end of file
+                if event_type == "text_chunk":
+                    if not first_chunk_logged:
+                        logger.info(f"Dify API最初のチャンク受信までの時間: {(datetime.now() - start_time).total_seconds()}秒")
+                        first_chunk_logged = True
+                    selector = data.get("from_variable_selector") or []
+                    yield {
+                        "event": "text_chunk",
+                        "text": data.get("text", ""),
+                        "field": selector[-1] if selector else None
+                    }
+                elif event_type == "workflow_finished":
+                    logger.info(f"Dify API呼び出し時間（ストリーミング）: {(datetime.now() - start_time).total_seconds()}秒")
+                    if data.get("status") != "succeeded":
+                        raise DifyAPIError(502, f"Difyワークフローが失敗しました: {data.get('error')}")
+                    yield {"event": "result", "data": self._parse_outputs("analysis", data.get("outputs") or {})}
+                    return
+                elif event_type == "error":
+                    raise DifyAPIError(int(event.get("status") or 502), f"Dify APIストリーミングエラー: {event.get('message')}")
+        
+        raise DifyAPIError(502, "Dify APIのストリーミングがworkflow_finishedを受信する前に終了しました")
@@ -0,0 +1,135 @@
+"""
+ブロッキング処理を実行するためのスレッドプール
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from app.config import settings
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """
+    Firestore SDKなどの同期APIをイベントループ外で実行する有界スレッドプール
+
+    同時実行数はmax_workersで制限され、それを超えた呼び出しはキューで待機する。
+    待機中の件数や待機時間を記録し、プールの飽和状況を取得できるようにする。
+    """
+
+    def __init__(self, max_workers: int, name: str = "blocking", saturation_warn_queue: int = 0):
+        self.max_workers = max_workers
+        self.name = name
+        self.saturation_warn_queue = saturation_warn_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._peak_queued = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        同期関数をスレッドプールで実行し、結果を待機する
+
+        Args:
+            func: 実行する同期関数
+            *args: 関数の位置引数
+            **kwargs: 関数のキーワード引数
+
+        Returns:
+            関数の戻り値
+        """
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+            # ワーカー数を超えた分がキューで待機する
+            queued = max(0, self._in_flight - self.max_workers)
+            self._peak_queued = max(self._peak_queued, queued)
+
+        if queued > self.saturation_warn_queue:
+            logger.warning(f"スレッドプール '{self.name}' が飽和しています（待機中: {queued}件, 上限: {self.max_workers}）")
+
+        call = functools.partial(self._run_tracked, func, submitted_at, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _run_tracked(self, func: Callable[..., T], submitted_at: float, *args: Any, **kwargs: Any) -> T:
+        """ワーカースレッド側で待機時間と実行状態を記録しながら関数を実行する"""
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self._active += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        try:
+            result = func(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+            return result
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """プールの利用状況を返す"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": max(0, self._in_flight - self._active),
+                "peak_queued": self._peak_queued,
+                "saturated": self._in_flight >= self.max_workers,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """スレッドプールを停止する"""
+        logger.info(f"スレッドプール '{self.name}' を停止します")
+        self._executor.shutdown(wait=wait)
+
+
+# アプリケーション全体で共有するスレッドプール
+blocking_executor = BlockingExecutor(
+    max_workers=settings.BLOCKING_POOL_MAX_WORKERS,
+    name="blocking-io",
+    saturation_warn_queue=settings.BLOCKING_POOL_SATURATION_WARN_QUEUE,
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    同期関数を共有スレッドプールで実行する
+
+    Args:
+        func: 実行する同期関数
+        *args: 関数の位置引数
+        **kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    return await blocking_executor.run(func, *args, **kwargs)
@@ -0,0 +1,100 @@
+"""
+日記の全履歴のストリーミングエクスポート
+"""
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.database.repository import DiaryCursor
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ("id", "created_at", "content", "EI", "SN", "TF", "JP", "summary", "feedback")
+EXPORT_FIELDS = ["created_at", "content", "dimensions", "summary", "feedback"]
+
+
+def _format_created_at(value: Any) -> Optional[str]:
+    """作成日時をISO形式の文字列に変換する"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).isoformat()
+    return None
+
+
+def export_row(diary: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    日記1件をエクスポートする1行に変換する
+
+    Args:
+        diary: ストレージから取得した日記
+
+    Returns:
+        Optional[Dict[str, Any]]: EXPORT_COLUMNSの値。分析結果のない日記（分析待ちなど）はNone
+    """
+    dimensions = diary.get("dimensions")
+    if not isinstance(dimensions, dict):
+        return None
+    return {
+        "id": diary["id"],
+        "created_at": _format_created_at(diary.get("created_at")),
+        "content": diary.get("content", ""),
+        **{key: dimensions.get(key, 50.0) for key in ("EI", "SN", "TF", "JP")},
+        "summary": diary.get("summary", ""),
+        "feedback": diary.get("feedback", ""),
+    }
+
+
+async def iter_diary_pages(repository, user_id: str, page_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    ユーザーの日記を新しい順にページごとに取得する
+
+    保持するのは1ページ分の日記だけなので、日記の件数によらずメモリ使用量は一定になる。
+
+    Args:
+        repository: ストレージリポジトリ
+        user_id: ユーザーID
+        page_size: 1回に取得する日記の件数
+
+    Yields:
+        List[Dict[str, Any]]: 1ページ分の日記
+    """
+    cursor: Optional[DiaryCursor] = None
+    while True:
+        page = await run_blocking(repository.list_user_diaries, user_id, page_size, cursor, EXPORT_FIELDS)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = (page[-1].get("created_at"), page[-1]["id"])
+
+
+async def iter_ndjson(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+    """日記を1行1件のJSON（NDJSON）に変換する（1ページ分ずつ送る）"""
+    async for page in pages:
+        rows = (export_row(diary) for diary in page)
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows if row is not None)
+
+
+async def iter_csv(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+    """日記をCSVに変換する（1ページ分ずつ送る。Excelで文字化けしないよう先頭にBOMを付ける）"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+
+    def flush() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    # 日記の取得を待たずにヘッダー行を送る
+    writer.writeheader()
+    yield "\ufeff" + flush()
+    async for page in pages:
+        writer.writerows(row for row in map(export_row, page) if row is not None)
+        yield flush()
@@ -0,0 +1,135 @@
+"""
+のびしろ情報（成長アドバイス）のキャッシュ
+"""
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.database.repository import SERVER_TIMESTAMP
+
+from app.services.cache import TTLCache
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+def history_fingerprint(diary_ids: List[str]) -> str:
+    """
+    のびしろ情報の生成に使った日記IDの並びからフィンガープリントを生成する
+
+    Args:
+        diary_ids: 履歴に含めた日記のID（新しい順）
+
+    Returns:
+        str: SHA-256のハッシュ値（16進文字列）
+    """
+    return hashlib.sha256("\n".join(diary_ids).encode("utf-8")).hexdigest()
+
+
+class GrowthCache:
+    """
+    ユーザーごとののびしろ情報キャッシュ
+
+    プロセス内のLRUとストレージリポジトリの'growth_cache'コレクションの2段構成。
+    取得時には生成に使った日記IDのフィンガープリントを現在の日記履歴と比較し、一致しない場合は
+    キャッシュがないものとして扱う。そのため、他のインスタンスで日記が保存された場合や、
+    invalidateの前に始まった生成が古い結果を書き戻した場合でも古いのびしろ情報は返さない。
+    """
+
+    def __init__(self, repository=None, collection: str = "growth_cache", maxsize: int = 5000, ttl: float = 24 * 3600):
+        self.repository = repository
+        self.collection = collection
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl, name="growth")
+        self.persistent_hits = 0
+        self.misses = 0
+        # 日記履歴と一致せずに使わなかったキャッシュの数
+        self.stale = 0
+
+    async def get(self, user_id: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        キャッシュからのびしろ情報を取得する
+
+        Args:
+            user_id: ユーザーID
+            fingerprint: 現在の日記履歴のフィンガープリント
+
+        Returns:
+            Optional[Dict[str, Any]]: のびしろ情報。キャッシュに存在しない場合や、
+                生成後に日記が保存されてフィンガープリントが一致しない場合はNone
+        """
+        entry = self.memory.get(user_id)
+        if entry is not None:
+            if entry["fingerprint"] == fingerprint:
+                return entry["result"]
+            self.memory.delete(user_id)
+            self.stale += 1
+        elif self.repository is not None:
+            try:
+                data = await run_blocking(self.repository.get_document, self.collection, user_id)
+                if data is not None and data.get("fingerprint") == fingerprint:
+                    self.memory.set(user_id, {"fingerprint": fingerprint, "result": data["result"]})
+                    self.persistent_hits += 1
+                    return data["result"]
+                if data is not None:
+                    self.stale += 1
+            except Exception as e:
+                logger.warning(f"のびしろキャッシュの読み込みに失敗しました: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, user_id: str, fingerprint: str, result: Dict[str, Any]) -> None:
+        """
+        のびしろ情報をキャッシュに保存する
+
+        Args:
+            user_id: ユーザーID
+            fingerprint: 生成に使った日記IDのフィンガープリント
+            result: のびしろ情報
+        """
+        self.memory.set(user_id, {"fingerprint": fingerprint, "result": result})
+
+        if self.repository is None:
+            return
+        try:
+            await run_blocking(
+                self.repository.set_document,
+                self.collection,
+                user_id,
+                {
+                    "fingerprint": fingerprint,
+                    "result": result,
+                    "created_at": SERVER_TIMESTAMP,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"のびしろキャッシュの保存に失敗しました: {str(e)}")
+
+    async def invalidate(self, user_id: str) -> None:
+        """
+        ユーザーののびしろ情報キャッシュを破棄する（日記の保存時に呼び出す）
+
+        Args:
+            user_id: ユーザーID
+        """
+        self.memory.delete(user_id)
+
+        if self.repository is None:
+            return
+        try:
+            await run_blocking(self.repository.delete_document, self.collection, user_id)
+        except Exception as e:
+            logger.warning(f"のびしろキャッシュの破棄に失敗しました: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュのヒット数などを返す"""
+        memory_stats = self.memory.stats()
+        total = memory_stats["hits"] + self.persistent_hits + self.misses
+        return {
+            "memory": memory_stats,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round((memory_stats["hits"] + self.persistent_hits) / total, 4) if total else 0.0,
+        }
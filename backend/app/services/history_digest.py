@@ -0,0 +1,286 @@
+"""
+のびしろ情報の生成に使うユーザーごとの日記履歴ダイジェスト
+"""
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.database.repository import SERVER_TIMESTAMP
+from app.services.executor import run_blocking
+from app.services.diary_decoder import decode_diary
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+EMPTY_HISTORY_TEXT = "過去の日記データはありません。"
+HISTORY_HEADER = "【ユーザーの過去の日記データ】\n\n"
+HISTORY_FOOTER = (
+    "【分析依頼】\n"
+    "上記の日記データを分析し、ユーザーの性格的な特徴と成長のためのアドバイスを3つ提案してください。\n"
+)
+
+
+class _DigestMissing(Exception):
+    """ダイジェストがまだない場合に、追記をやめて日記から作成し直すための例外"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する
+
+    日本語などの非ASCII文字は1文字1トークン、ASCII文字は4文字1トークンとして数える。
+    実際のトークナイザーより多めに見積もられるため、上限の判定に使える。
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        int: 概算のトークン数
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """max_chars文字を超える部分を省略する"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "…"
+
+
+def _to_utc(created_at: Any) -> datetime:
+    """作成日時をUTCのdatetimeに揃える（不明な場合は現在時刻）"""
+    if isinstance(created_at, datetime):
+        return created_at.astimezone(timezone.utc)
+    if isinstance(created_at, (int, float)):
+        return datetime.fromtimestamp(created_at, tz=timezone.utc)
+    return datetime.now(timezone.utc)
+
+
+def compact_entry(
+    diary_id: str,
+    content: str,
+    dimensions: Dict[str, float],
+    feedback: str,
+    summary: str,
+    created_at: Any,
+    max_chars: int,
+) -> Dict[str, Any]:
+    """
+    日記1件をダイジェストに保存する要約形式に変換する
+
+    Args:
+        diary_id: 日記ID
+        content: 日記の本文
+        dimensions: MBTI次元スコア
+        feedback: フィードバック
+        summary: 要約
+        created_at: 作成日時（SERVER_TIMESTAMPなどdatetime以外の場合は現在時刻）
+        max_chars: 本文の最大文字数（要約とフィードバックはその半分）
+
+    Returns:
+        Dict[str, Any]: ダイジェストのエントリー
+    """
+    return {
+        "id": diary_id,
+        "created_at": _to_utc(created_at).isoformat(),
+        "content": _truncate(content, max_chars),
+        "dimensions": {key: dimensions.get(key, 50) for key in ("EI", "SN", "TF", "JP")},
+        "summary": _truncate(summary, max_chars // 2),
+        "feedback": _truncate(feedback, max_chars // 2),
+    }
+
+
+def _merge_entries(current: List[Dict[str, Any]], new_entries: Iterable[Dict[str, Any]], window_size: int) -> List[Dict[str, Any]]:
+    """既存のエントリーに新しいエントリーを加え、新しい順に最大window_size件を残す"""
+    merged = {entry["id"]: entry for entry in current}
+    for entry in new_entries:
+        merged[entry["id"]] = entry
+    ordered = sorted(merged.values(), key=lambda entry: entry["created_at"], reverse=True)
+    return ordered[:window_size]
+
+
+def format_history(entries: List[Dict[str, Any]], token_budget: int) -> str:
+    """
+    ダイジェストのエントリーをAIが読み取りやすいテキストに変換する
+
+    新しい日記から順に追加し、トークン数の上限を超える場合は本文とフィードバックを
+    省いた短い形式で追加する。それも入らなくなった時点で古い日記は打ち切る。
+
+    Args:
+        entries: ダイジェストのエントリー（新しい順）
+        token_budget: テキスト全体のトークン数の上限（概算）
+
+    Returns:
+        str: フォーマット済みの日記履歴テキスト
+    """
+    if not entries:
+        return EMPTY_HISTORY_TEXT
+
+    remaining = token_budget - estimate_tokens(HISTORY_HEADER) - estimate_tokens(HISTORY_FOOTER)
+    parts = [HISTORY_HEADER]
+    for i, entry in enumerate(entries):
+        created_at = entry.get("created_at", "")[:10]
+        dimensions = entry.get("dimensions", {})
+        scores = (
+            f"MBTI分析: E-I={dimensions.get('EI', 50)}, S-N={dimensions.get('SN', 50)}, "
+            f"T-F={dimensions.get('TF', 50)}, J-P={dimensions.get('JP', 50)}\n"
+        )
+        full = (
+            f"【日記 {i+1}】{created_at}\n"
+            f"内容: {entry.get('content', '')}\n"
+            f"{scores}"
+            f"要約: {entry.get('summary', '')}\n"
+            f"フィードバック: {entry.get('feedback', '')}\n\n"
+        )
+        short = f"【日記 {i+1}】{created_at}\n{scores}要約: {entry.get('summary', '')}\n\n"
+
+        for block in (full, short):
+            cost = estimate_tokens(block)
+            if cost <= remaining:
+                parts.append(block)
+                remaining -= cost
+                break
+        else:
+            logger.info(f"トークン数の上限に達したため、古い日記{len(entries) - i}件を履歴から省きました")
+            break
+
+    parts.append(HISTORY_FOOTER)
+    return "".join(parts)
+
+
+class HistoryDigestStore:
+    """
+    ユーザーごとの日記履歴ダイジェストを管理するクラス
+
+    'history_digests'コレクションのユーザーIDのドキュメントに直近window_size件の日記を要約形式で保持する。
+    日記の保存時に追記するため、のびしろ情報の生成時は1ドキュメントを読むだけで済む。
+    ダイジェストがまだないユーザーは、初回の読み込み時に日記から作成する。
+    """
+
+    def __init__(
+        self,
+        repository=None,
+        collection: str = "history_digests",
+        window_size: int = 10,
+        entry_max_chars: int = 400,
+    ):
+        self.repository = repository
+        self.collection = collection
+        self.window_size = window_size
+        self.entry_max_chars = entry_max_chars
+
+    def make_entry(
+        self,
+        diary_id: str,
+        content: str,
+        dimensions: Dict[str, float],
+        feedback: str,
+        summary: str,
+        created_at: Any = None,
+    ) -> Dict[str, Any]:
+        """日記1件をこのストアの設定でダイジェストのエントリーに変換する"""
+        return compact_entry(diary_id, content, dimensions, feedback, summary, created_at, self.entry_max_chars)
+
+    async def append(self, user_id: str, entries: List[Dict[str, Any]]) -> None:
+        """
+        ダイジェストに日記を追記する（日記の保存時に呼び出す）
+
+        ダイジェストがまだない場合は直近の日記から作成する（一覧の取得に間に合わなかった今回の日記も含める）。
+        失敗しても日記の保存は成功しているため、例外は送出せずに警告を記録する。
+        ダイジェストは次回の読み込み時に作り直される。
+
+        Args:
+            user_id: ユーザーID
+            entries: make_entryで作成したエントリー
+        """
+        if self.repository is None or not entries:
+            return
+        try:
+            await run_blocking(self._append, user_id, entries)
+        except Exception as e:
+            logger.warning(f"日記履歴ダイジェストの更新に失敗しました - ユーザー: {user_id}: {str(e)}")
+            await self.invalidate(user_id)
+
+    async def load(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        ダイジェストのエントリーを取得する
+
+        Args:
+            user_id: ユーザーID
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: エントリー（新しい順）。取得に失敗した場合はNone
+        """
+        if self.repository is None:
+            return None
+        try:
+            digest = await run_blocking(self.repository.get_document, self.collection, user_id)
+            if digest is not None:
+                return digest.get("entries", [])
+            return await run_blocking(self._rebuild, user_id)
+        except Exception as e:
+            logger.error(f"日記履歴ダイジェストの取得中にエラーが発生しました: {str(e)}")
+            return None
+
+    async def invalidate(self, user_id: str) -> None:
+        """ダイジェストを破棄し、次回の読み込み時に日記から作り直させる"""
+        if self.repository is None:
+            return
+        try:
+            await run_blocking(self.repository.delete_document, self.collection, user_id)
+        except Exception as e:
+            logger.warning(f"日記履歴ダイジェストの破棄に失敗しました: {str(e)}")
+
+    def _append(self, user_id: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """ダイジェストに新しいエントリーを反映する（ダイジェストがまだない場合は日記から作成する）"""
+        try:
+            return self._merge(user_id, entries, require_existing=True)
+        except _DigestMissing:
+            return self._rebuild(user_id, entries)
+
+    def _merge(self, user_id: str, entries: List[Dict[str, Any]], require_existing: bool = False) -> List[Dict[str, Any]]:
+        """
+        ダイジェストを読み込み、新しいエントリーを反映して書き戻す（不可分に実行）
+
+        Raises:
+            _DigestMissing: require_existingがTrueで、ダイジェストがまだない場合
+        """
+        def merge(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if current is None and require_existing:
+                raise _DigestMissing()
+            return {
+                "entries": _merge_entries((current or {}).get("entries", []), entries, self.window_size),
+                "updated_at": SERVER_TIMESTAMP,
+            }
+
+        return self.repository.update_document(self.collection, user_id, merge)["entries"]
+
+    def _rebuild(self, user_id: str, new_entries: List[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+        """
+        直近の日記からダイジェストを作成する
+
+        Args:
+            user_id: ユーザーID
+            new_entries: 保存したばかりの日記のエントリー（一覧に含まれていなくても加える）
+        """
+        entries = []
+        for diary_data in self.repository.list_user_diaries(user_id, limit=self.window_size):
+            # 分析結果のない日記（分析待ちなど）は含めない
+            diary = decode_diary(diary_data)
+            if diary is None:
+                continue
+            entries.append(self.make_entry(
+                diary.id,
+                diary.content,
+                diary.dimensions,
+                diary.feedback,
+                diary.summary,
+                diary.created_at,
+            ))
+
+        # 作成中に追記された日記も失わないよう、読み込みと更新を不可分に反映する
+        merged = self._merge(user_id, entries + list(new_entries))
+        logger.info(f"ユーザー {user_id} の日記履歴ダイジェストを作成しました（{len(merged)}件）")
+        return merged
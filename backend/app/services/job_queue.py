@@ -0,0 +1,242 @@
+"""
+バックグラウンドジョブのキュー
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.models.job import Job, JobStatus
+from app.services.cache import TTLCache
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+# ジョブハンドラー: ジョブと入力を受け取り、結果の辞書を返す
+JobHandler = Callable[[Job, Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class QueueFullError(Exception):
+    """ジョブキューが満杯で受け付けられない場合の例外"""
+    pass
+
+
+class JobQueueBackend(ABC):
+    """
+    ジョブキューのバックエンドの基底クラス
+
+    ジョブの種類ごとにハンドラーを登録し、enqueueされたジョブを
+    バックグラウンドで実行する。実装を差し替えられるように
+    ルートからはこのインターフェースだけを使う。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+
+    def register_handler(self, job_type: str, handler: JobHandler) -> None:
+        """
+        ジョブの種類に対応するハンドラーを登録する
+
+        Args:
+            job_type: ジョブの種類
+            handler: ジョブを実行する非同期関数
+        """
+        self._handlers[job_type] = handler
+
+    @abstractmethod
+    async def start(self) -> None:
+        """ワーカーを起動する"""
+
+    @abstractmethod
+    async def stop(self) -> None:
+        """ワーカーを停止する"""
+
+    @abstractmethod
+    async def enqueue(self, job_type: str, user_id: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> Job:
+        """
+        ジョブをキューに追加する
+
+        Raises:
+            QueueFullError: キューが満杯の場合
+        """
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        """ジョブの状態を取得する"""
+
+    @abstractmethod
+    async def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        """実行中のジョブの進捗を更新する"""
+
+    @abstractmethod
+    async def wait_for_change(self, job_id: str, since: datetime, timeout: float) -> Optional[Job]:
+        """ジョブがsince以降に更新されるまで最大timeout秒待機し、最新の状態を返す"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """キューの利用状況を返す"""
+
+
+class InProcessJobQueue(JobQueueBackend):
+    """
+    プロセス内で動作するジョブキュー
+
+    asyncio.Queueと固定数のワーカータスクで同時実行数を制限する。
+    ジョブの状態はプロセス内に保持するため、インスタンスをまたいだ参照はできない。
+    """
+
+    def __init__(self, concurrency: int = 4, max_queue_size: int = 1000, retention_seconds: float = 3600):
+        super().__init__()
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: TTLCache[Job] = TTLCache(maxsize=10000, ttl=retention_seconds, name="jobs")
+        self._changed = asyncio.Condition()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"ジョブキューのワーカーを起動しました（同時実行数: {self.concurrency}）")
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        if not self._workers:
+            return
+        # 受け付け済みのジョブはできるだけ処理してから停止する
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ジョブキューの停止待ちがタイムアウトしました（残り: {self._queue.qsize()}件）")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("ジョブキューのワーカーを停止しました")
+
+    async def enqueue(self, job_type: str, user_id: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> Job:
+        if job_type not in self._handlers:
+            raise ValueError(f"未登録のジョブの種類です: {job_type}")
+        if self._queue is None:
+            raise RuntimeError("ジョブキューが起動していません")
+
+        job = Job.create(job_type, user_id, job_id=job_id)
+        try:
+            self._queue.put_nowait((job.id, payload))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"ジョブキューが満杯です（上限: {self.max_queue_size}件）")
+        await self._save(job)
+        logger.info(f"ジョブを受け付けました - ID: {job.id}, 種類: {job_type}, 待機中: {self._queue.qsize()}件")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        await self._save(job.model_copy(update={"progress": progress, "updated_at": datetime.now()}))
+
+    async def wait_for_change(self, job_id: str, since: datetime, timeout: float) -> Optional[Job]:
+        def changed() -> bool:
+            job = self._jobs.get(job_id)
+            return job is None or job.updated_at > since
+
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(changed), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "concurrency": self.concurrency,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+    async def _save(self, job: Job) -> None:
+        """ジョブの状態を保存し、待機中の購読者に通知する"""
+        self._jobs.set(job.id, job)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _worker(self, index: int) -> None:
+        """キューからジョブを取り出して順に実行する"""
+        while True:
+            job_id, payload = await self._queue.get()
+            try:
+                await self._run(job_id, payload)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, payload: Dict[str, Any]) -> None:
+        """ジョブを1件実行し、結果を記録する"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            logger.warning(f"ジョブの状態が見つかりません: {job_id}")
+            return
+
+        job = job.model_copy(update={"status": JobStatus.RUNNING, "updated_at": datetime.now()})
+        await self._save(job)
+        self._running += 1
+        try:
+            result = await self._handlers[job.type](job, payload)
+            # 実行中に更新された進捗を引き継ぐ
+            latest = self._jobs.get(job_id) or job
+            await self._save(latest.model_copy(update={
+                "status": JobStatus.COMPLETED,
+                "result": result,
+                "updated_at": datetime.now(),
+            }))
+            self._completed += 1
+            logger.info(f"ジョブが完了しました - ID: {job_id}")
+        except Exception as e:
+            logger.error(f"ジョブの実行中にエラーが発生しました - ID: {job_id}: {str(e)}")
+            latest = self._jobs.get(job_id) or job
+            await self._save(latest.model_copy(update={
+                "status": JobStatus.FAILED,
+                "error": str(e),
+                "updated_at": datetime.now(),
+            }))
+            self._failed += 1
+        finally:
+            self._running -= 1
+
+
+def create_job_queue(backend: str) -> JobQueueBackend:
+    """
+    設定に応じたジョブキューのバックエンドを生成する
+
+    Args:
+        backend: バックエンドの種類（現在は"memory"のみ）
+
+    Returns:
+        JobQueueBackend: ジョブキュー
+    """
+    if backend == "memory":
+        return InProcessJobQueue(
+            concurrency=settings.JOB_QUEUE_CONCURRENCY,
+            max_queue_size=settings.JOB_QUEUE_MAX_SIZE,
+            retention_seconds=settings.JOB_RETENTION_SECONDS,
+        )
+    raise ValueError(f"未対応のジョブキューバックエンドです: {backend}")
+
+
+# アプリケーション全体で共有するジョブキュー
+job_queue = create_job_queue(settings.JOB_QUEUE_BACKEND)
@@ -0,0 +1,82 @@
+"""
+日記一覧のカーソルページング
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.database.repository import DiaryCursor
+
+# 次のページのカーソルを返すレスポンスヘッダー
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """ページングのカーソルを解釈できない場合の例外"""
+
+
+def encode_cursor(diary: Dict[str, Any]) -> str:
+    """
+    日記の(created_at, id)をクライアントに返す不透明なカーソル文字列に変換する
+
+    Args:
+        diary: ページの最後の日記（ストレージから取得したままのもの）
+
+    Returns:
+        str: URLセーフなカーソル文字列
+    """
+    created_at = diary.get("created_at")
+    if isinstance(created_at, datetime):
+        # Firestoreのタイムスタンプと一致させるため、マイクロ秒まで含めて保持する
+        payload = {"d": created_at.isoformat(), "id": diary["id"]}
+    elif isinstance(created_at, (int, float)):
+        payload = {"n": created_at, "id": diary["id"]}
+    else:
+        payload = {"id": diary["id"]}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> DiaryCursor:
+    """
+    カーソル文字列を(created_at, id)に戻す
+
+    Args:
+        cursor: encode_cursorで作成したカーソル文字列
+
+    Returns:
+        DiaryCursor: リポジトリのstart_afterに渡す値
+
+    Raises:
+        InvalidCursorError: カーソルを解釈できない場合
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        diary_id = payload["id"]
+        if not isinstance(diary_id, str):
+            raise TypeError("idが文字列ではありません")
+        if "d" in payload:
+            return datetime.fromisoformat(payload["d"]), diary_id
+        if "n" in payload:
+            return float(payload["n"]), diary_id
+        return None, diary_id
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCursorError(f"不正なカーソルです: {str(e)}") from e
+
+
+def split_page(diaries: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    limit + 1件取得した日記を1ページ分と次のページのカーソルに分ける
+
+    Args:
+        diaries: limit + 1件を上限に取得した日記
+        limit: 1ページの件数
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[str]]: ページの日記と、続きがある場合は次のページのカーソル
+    """
+    page = diaries[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(diaries) > limit and page else None
+    return page, next_cursor
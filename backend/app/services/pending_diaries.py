@@ -0,0 +1,144 @@
+"""
+分析待ちのまま残った日記の回収
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from app.database.repository import SERVER_TIMESTAMP, timestamp_sort_key
+from app.models.job import JobStatus
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+class PendingDiaryRecovery:
+    """
+    分析待ち（status="pending"）のまま残った日記を定期的に回収するクラス
+
+    分析ジョブはプロセス内のキューにしかないため、インスタンスが停止すると日記は
+    分析待ちのまま一覧に表示されなくなる。起動時とinterval_secondsごとに、
+    timeout_seconds以上分析待ちのままの日記を古い順にbatch_size件ずつすべて調べ、
+    max_attempts回までは分析ジョブを登録し直し、それを超えた日記は分析失敗（status="failed"）にする。
+    このインスタンスで実行中・待機中のジョブの日記は対象にしない。
+    他のインスタンスと同時に回収しないよう、登録し直した時刻をrecovered_atに記録し、
+    そこからtimeout_secondsが経つまでは再び回収しない。
+    """
+
+    def __init__(
+        self,
+        repository,
+        job_queue,
+        requeue: Callable[[Dict[str, Any]], Awaitable[None]],
+        timeout_seconds: float = 600.0,
+        interval_seconds: float = 300.0,
+        max_attempts: int = 2,
+        batch_size: int = 100,
+    ):
+        self.repository = repository
+        self.job_queue = job_queue
+        self.requeue = requeue
+        self.timeout_seconds = timeout_seconds
+        self.interval_seconds = interval_seconds
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.requeued = 0
+        self.failed = 0
+        self.last_sweep_at: Optional[float] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="pending-diary-recovery")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"分析待ちの日記の回収に失敗しました: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _is_active(self, diary_id: str) -> bool:
+        """このインスタンスで日記の分析ジョブが待機中・実行中か"""
+        job = await self.job_queue.get(diary_id)
+        return job is not None and not job.is_finished
+
+    async def _stale_pending_diaries(self, created_before: datetime) -> AsyncIterator[Dict[str, Any]]:
+        """created_beforeより前に作成された分析待ちの日記を、古い順にbatch_size件ずつ読み込んで返す"""
+        start_after = None
+        while True:
+            page = await run_blocking(
+                self.repository.list_diaries_by_status,
+                JobStatus.PENDING.value,
+                created_before,
+                self.batch_size,
+                start_after,
+            )
+            for diary in page:
+                yield diary
+            if len(page) < self.batch_size:
+                return
+            start_after = (page[-1].get("created_at"), page[-1]["id"])
+
+    async def sweep(self) -> Dict[str, int]:
+        """
+        分析待ちのまま残った日記を1回回収する
+
+        Returns:
+            Dict[str, int]: 登録し直した件数と分析失敗にした件数
+        """
+        now = time.time()
+        created_before = datetime.now(timezone.utc) - timedelta(seconds=self.timeout_seconds)
+        requeued = failed = 0
+        async for diary in self._stale_pending_diaries(created_before):
+            # 登録し直してからtimeout_secondsが経っていない日記と、このインスタンスで分析中の日記は対象にしない
+            if now - timestamp_sort_key(diary.get("recovered_at")) < self.timeout_seconds or await self._is_active(diary["id"]):
+                continue
+
+            attempts = diary.get("recovery_attempts", 0)
+            if attempts >= self.max_attempts:
+                await run_blocking(self.repository.update_diary, diary["id"], {
+                    "status": JobStatus.FAILED.value,
+                    "error": "分析が完了しないまま時間が経過しました",
+                })
+                failed += 1
+                logger.warning(f"分析待ちのまま残った日記を分析失敗にしました - ID: {diary['id']}")
+                continue
+
+            await run_blocking(self.repository.update_diary, diary["id"], {
+                "recovery_attempts": attempts + 1,
+                "recovered_at": SERVER_TIMESTAMP,
+            })
+            try:
+                await self.requeue(diary)
+            except Exception as e:
+                # 登録できなかった日記は次回の回収で再び試す
+                logger.warning(f"分析待ちの日記のジョブを登録し直せませんでした - ID: {diary['id']}: {str(e)}")
+                continue
+            requeued += 1
+            logger.info(f"分析待ちのまま残った日記のジョブを登録し直しました - ID: {diary['id']}（{attempts + 1}回目）")
+
+        self.requeued += requeued
+        self.failed += failed
+        self.last_sweep_at = now
+        return {"requeued": requeued, "failed": failed}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "timeout_seconds": self.timeout_seconds,
+            "requeued": self.requeued,
+            "failed": self.failed,
+            "last_sweep_at": self.last_sweep_at,
+        }
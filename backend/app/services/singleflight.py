@@ -0,0 +1,59 @@
+"""
+同一キーの並行呼び出しをまとめるシングルフライト
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    同じキーで同時に呼び出された処理を1回の実行にまとめるクラス
+
+    実行中のキーに対する後続の呼び出しは、新たに処理を開始せずに
+    実行中の処理の結果（または例外）を待って受け取る。
+    処理はタスクとして実行するため、最初の呼び出し元がキャンセルされても
+    待機中の他の呼び出し元には影響しない。
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        キーごとに処理を1回だけ実行し、その結果を返す
+
+        Args:
+            key: 重複をまとめるためのキー
+            func: 実行する非同期処理を返す関数
+
+        Returns:
+            処理の結果
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"'{self.name}' の実行中の処理に合流します（キー: {key}）")
+        else:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """実行数と合流した呼び出し数を返す"""
+        return {
+            "name": self.name,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
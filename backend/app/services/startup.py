@@ -0,0 +1,197 @@
+"""
+起動時間の計測とレディネスチェック
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from app.config import settings
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """
+    起動処理の各段階にかかった時間を記録するクラス
+
+    このモジュールを最初にインポートした時点を起点とし、段階ごとの所要時間と
+    レディネスチェックが初めて成功するまでの時間を記録する。
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._last = self._origin
+        self.started_at = datetime.now(timezone.utc)
+        self.phases: Dict[str, float] = {}
+        self.serving_after: Optional[float] = None
+        self.ready_after: Optional[float] = None
+
+    def mark(self, name: str) -> None:
+        """直前の記録からこの時点までを1つの段階として記録する"""
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """withブロックの実行時間を1つの段階として記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases[name] = now - start
+            self._last = now
+
+    def mark_serving(self) -> None:
+        """リクエストの受け付けを開始した時点を記録する"""
+        self.serving_after = time.perf_counter() - self._origin
+        breakdown = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases.items())
+        logger.info(f"起動処理が完了しました（{self.serving_after * 1000:.1f}ms: {breakdown}）")
+
+    def mark_ready(self) -> None:
+        """レディネスチェックが初めて成功した時点を記録する"""
+        if self.ready_after is None:
+            self.ready_after = time.perf_counter() - self._origin
+            logger.info(f"レディネスチェックに成功しました（起動から{self.ready_after * 1000:.1f}ms）")
+
+    def report(self) -> Dict[str, Any]:
+        def to_ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "phases_ms": {name: to_ms(seconds) for name, seconds in self.phases.items()},
+            "serving_after_ms": to_ms(self.serving_after),
+            "ready_after_ms": to_ms(self.ready_after),
+        }
+
+
+@dataclass
+class ReadinessCheck:
+    """レディネスチェック1件の定義と直近の結果"""
+    name: str
+    check: Callable[[], Awaitable[Any]]
+    required: bool = True
+    ok: Optional[bool] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+    checked_at: Optional[datetime] = None
+    failures: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "required": self.required,
+            "error": self.error,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "consecutive_failures": self.failures,
+        }
+
+
+class ReadinessMonitor:
+    """
+    外部サービスへの接続をバックグラウンドで確認するクラス
+
+    起動処理やリクエストの処理をチェックの完了で待たせないよう、チェックは
+    バックグラウンドのタスクで実行し、/health/readyは直近の結果だけを返す。
+    必須のチェックがすべて成功するまでは間隔を倍にしながら再試行し、
+    成功した後はinterval_secondsごとに確認し直す。
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 30.0,
+        timeout_seconds: float = 5.0,
+        retry_initial_seconds: float = 0.5,
+        retry_max_seconds: float = 10.0,
+        profile: Optional[StartupProfile] = None,
+    ):
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.profile = profile
+        self.checks: List[ReadinessCheck] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_check(self, name: str, check: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        """
+        チェックを登録する
+
+        Args:
+            name: チェックの名前
+            check: 接続できない場合に例外を送出するコルーチン関数
+            required: Falseの場合は失敗しても準備完了の判定に含めない（ウォームアップなど）
+        """
+        self.checks.append(ReadinessCheck(name=name, check=check, required=required))
+
+    @property
+    def ready(self) -> bool:
+        """必須のチェックがすべて直近で成功しているか"""
+        return all(check.ok for check in self.checks if check.required)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="readiness-monitor")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def run_checks(self) -> bool:
+        """登録されたチェックを並行して1回実行し、準備完了かどうかを返す"""
+        await asyncio.gather(*(self._run_check(check) for check in self.checks))
+        ready = self.ready
+        if ready and self.profile is not None:
+            self.profile.mark_ready()
+        return ready
+
+    async def _run_check(self, check: ReadinessCheck) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(check.check(), self.timeout_seconds)
+            check.ok, check.error, check.failures = True, None, 0
+        except Exception as e:
+            if check.ok is not False:
+                logger.warning(f"レディネスチェック「{check.name}」に失敗しました: {type(e).__name__}: {str(e)}")
+            check.ok, check.error = False, f"{type(e).__name__}: {str(e)}"
+            check.failures += 1
+        check.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        check.checked_at = datetime.now(timezone.utc)
+
+    async def _run(self) -> None:
+        delay = self.retry_initial_seconds
+        while True:
+            if await self.run_checks():
+                delay = self.retry_initial_seconds
+                await asyncio.sleep(self.interval_seconds)
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "checks": {check.name: check.to_dict() for check in self.checks},
+        }
+
+
+# アプリケーション全体で共有するインスタンス（起点の時刻を早く取るため、main.pyの最初でインポートする）
+startup_profile = StartupProfile()
+readiness_monitor = ReadinessMonitor(
+    interval_seconds=settings.READINESS_CHECK_INTERVAL_SECONDS,
+    timeout_seconds=settings.READINESS_CHECK_TIMEOUT_SECONDS,
+    retry_initial_seconds=settings.READINESS_RETRY_INITIAL_SECONDS,
+    retry_max_seconds=settings.READINESS_RETRY_MAX_SECONDS,
+    profile=startup_profile,
+)
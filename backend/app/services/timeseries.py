@@ -0,0 +1,121 @@
+"""
+グラフ表示用のMBTI次元スコアの時系列集計
+"""
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+
+from app.database.repository import timestamp_sort_key
+
+DIMENSION_KEYS = ("EI", "SN", "TF", "JP")
+
+# 1970-01-01（木曜日）を基準に、週の区切りを月曜日にするためのずれ（日）
+_MONDAY_OFFSET_DAYS = 3
+
+
+def _bucket_starts(days: np.ndarray, bucket: str) -> np.ndarray:
+    """
+    1970-01-01からの日数を、各日が属する区間の開始日（1970-01-01からの日数）に変換する
+
+    Args:
+        days: 現地時間での1970-01-01からの日数
+        bucket: 区間の大きさ（"day", "week", "month"）
+
+    Returns:
+        np.ndarray: 区間の開始日
+    """
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        return (days + _MONDAY_OFFSET_DAYS) // 7 * 7 - _MONDAY_OFFSET_DAYS
+    months = days.astype("datetime64[D]").astype("datetime64[M]")
+    return months.astype("datetime64[D]").astype(np.int64)
+
+
+def aggregate(
+    diaries: Sequence[Dict[str, Any]],
+    bucket: str,
+    tz_offset_minutes: int = 0,
+    max_points: int = 100,
+) -> Dict[str, Any]:
+    """
+    日記の次元スコアを区間ごとに平均する
+
+    区間の数がmax_pointsを超える場合は、隣り合う区間を件数で重み付けして平均し、
+    max_points以下の点にまとめる。
+
+    Args:
+        diaries: created_atとdimensionsを持つ日記
+        bucket: 区間の大きさ（"day", "week", "month"）
+        tz_offset_minutes: 区間の区切りに使う現地時間のUTCからのずれ（分）
+        max_points: 返す点の最大数
+
+    Returns:
+        Dict[str, Any]: 点のリスト（開始日・件数・次元ごとの平均）と1点あたりの区間数
+    """
+    rows = [diary for diary in diaries if isinstance(diary.get("dimensions"), dict)]
+    if not rows:
+        return {"buckets_per_point": 1, "points": []}
+
+    timestamps = np.fromiter(
+        (timestamp_sort_key(diary.get("created_at")) for diary in rows), dtype=np.float64, count=len(rows)
+    )
+    scores = np.array(
+        [[float(diary["dimensions"].get(key, 50)) for key in DIMENSION_KEYS] for diary in rows],
+        dtype=np.float64,
+    )
+    # 作成日時のない日記は集計できないため除く
+    valid = np.isfinite(timestamps)
+    timestamps, scores = timestamps[valid], scores[valid]
+    if timestamps.size == 0:
+        return {"buckets_per_point": 1, "points": []}
+
+    days = np.floor((timestamps + tz_offset_minutes * 60) / 86400).astype(np.int64)
+    starts, inverse, counts = np.unique(_bucket_starts(days, bucket), return_inverse=True, return_counts=True)
+    sums = np.stack(
+        [np.bincount(inverse, weights=scores[:, i], minlength=starts.size) for i in range(len(DIMENSION_KEYS))],
+        axis=1,
+    )
+
+    # 区間が多すぎる場合は隣り合う区間をまとめる（件数の合計で割るので平均は件数で重み付けされる）
+    buckets_per_point = max(1, math.ceil(starts.size / max_points))
+    if buckets_per_point > 1:
+        groups = np.arange(starts.size) // buckets_per_point
+        starts = starts[::buckets_per_point]
+        counts = np.bincount(groups, weights=counts).astype(np.int64)
+        sums = np.stack(
+            [np.bincount(groups, weights=sums[:, i]) for i in range(len(DIMENSION_KEYS))],
+            axis=1,
+        )
+
+    means = np.round(sums / counts[:, None], 2)
+    epoch = date(1970, 1, 1)
+    points = [
+        {
+            "start": epoch + timedelta(days=int(start)),
+            "count": int(count),
+            "dimensions": dict(zip(DIMENSION_KEYS, row.tolist())),
+        }
+        for start, count, row in zip(starts, counts, means)
+    ]
+    return {"buckets_per_point": buckets_per_point, "points": points}
+
+
+def local_day_bounds(start: date, end: date, tz_offset_minutes: int) -> Tuple[datetime, datetime]:
+    """
+    現地時間の開始日・終了日（終了日を含む）を、UTCの[開始日時, 終了日時)に変換する
+
+    Args:
+        start: 開始日
+        end: 終了日（この日を含む）
+        tz_offset_minutes: 現地時間のUTCからのずれ（分）
+
+    Returns:
+        Tuple[datetime, datetime]: UTCの開始日時と終了日時
+    """
+    tz = timezone(timedelta(minutes=tz_offset_minutes))
+    since = datetime.combine(start, datetime.min.time(), tzinfo=tz)
+    until = datetime.combine(end + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+    return since.astimezone(timezone.utc), until.astimezone(timezone.utc)
@@ -0,0 +1,218 @@
+"""
+Firebase IDトークンのローカル検証サービス
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from firebase_admin import auth
+from firebase_admin.auth import InvalidIdTokenError, ExpiredIdTokenError, RevokedIdTokenError, UserDisabledError
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from app.config import settings
+from app.database.firebase import get_firebase_app
+from app.services.cache import TTLCache
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class FirebaseTokenVerifier:
+    """
+    Firebase IDトークンを検証するクラス
+
+    Googleの公開鍵はCache-Controlヘッダーのmax-ageに従ってキャッシュし、
+    未知の鍵IDによる再取得はcerts_min_refresh_seconds秒に1回までに制限する。
+    一度検証したトークンはトークンのハッシュをキーにデコード済みクレームを
+    expまで保持する。同じトークンが繰り返し送られてきた場合は
+    署名検証（RSA演算）を省略してキャッシュから返す。
+    """
+
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        claims_cache_size: int = 10000,
+        clock_skew_seconds: int = 0,
+        certs_url: str = settings.FIREBASE_CERTS_URL,
+        certs_min_refresh_seconds: float = 60.0,
+    ):
+        self._project_id = project_id
+        self.certs_url = certs_url
+        self.clock_skew_seconds = clock_skew_seconds
+        self._certs: Dict[str, str] = {}
+        self._certs_expire_at = 0.0
+        self.certs_min_refresh_seconds = certs_min_refresh_seconds
+        # 公開鍵を最後に取得しようとした時刻（未知の鍵IDによる再取得の間隔の制限に使う）
+        self._certs_fetched_at: Optional[float] = None
+        self._certs_lock = asyncio.Lock()
+        # デコード済みクレームのキャッシュ（有効期限はエントリごとにトークンのexpまで）
+        self.claims_cache: TTLCache[Dict[str, Any]] = TTLCache(
+            maxsize=claims_cache_size, ttl=3600, name="id-token-claims"
+        )
+
+    @property
+    def project_id(self) -> Optional[str]:
+        """トークンのaud/issの検証に使うFirebaseプロジェクトID"""
+        if self._project_id:
+            return self._project_id
+        try:
+            self._project_id = get_firebase_app().project_id
+        except Exception as e:
+            # 認証情報がないなどでFirebase Admin SDKを初期化できない
+            logger.debug(f"Firebase Admin SDKからプロジェクトIDを取得できません: {str(e)}")
+            return None
+        return self._project_id
+
+    async def verify(self, token: str, check_revoked: bool = False) -> Dict[str, Any]:
+        """
+        IDトークンを検証し、デコード済みのクレームを返す
+
+        Args:
+            token: Firebase IDトークン
+            check_revoked: トークンが無効化されていないかFirebaseに問い合わせるかどうか
+
+        Returns:
+            Dict[str, Any]: デコード済みクレーム（uidを含む）
+
+        Raises:
+            InvalidIdTokenError: トークンが不正な場合
+            ExpiredIdTokenError: トークンの期限が切れている場合
+            RevokedIdTokenError: トークンが無効化されている場合
+        """
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        claims = self.claims_cache.get(cache_key)
+
+        if claims is None:
+            claims = await self._decode(token)
+            ttl = claims["exp"] - time.time()
+            if ttl > 0:
+                self.claims_cache.set(cache_key, claims, ttl=ttl)
+
+        if check_revoked:
+            await self._check_revoked(claims)
+
+        return claims
+
+    async def _decode(self, token: str) -> Dict[str, Any]:
+        """署名とクレームを検証してトークンをデコードする"""
+        project_id = self.project_id
+        if not project_id:
+            # プロジェクトIDが分からない場合はFirebase Admin SDKの検証にフォールバックする
+            logger.debug("プロジェクトIDが不明なため、Firebase Admin SDKでトークンを検証します")
+            return await run_blocking(lambda: auth.verify_id_token(token, app=get_firebase_app()))
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise InvalidIdTokenError(f"IDトークンのヘッダーを解析できません: {str(e)}", cause=e)
+
+        kid = header.get("kid")
+        if header.get("alg") != "RS256" or not kid:
+            raise InvalidIdTokenError("IDトークンの署名アルゴリズムまたは鍵IDが不正です")
+
+        certs = await self._get_certs()
+        if kid not in certs:
+            # 鍵のローテーション直後の可能性があるので再取得する（不正な鍵IDで繰り返し取得させないよう間隔を制限する）
+            certs = await self._get_certs(force_refresh=True)
+        cert = certs.get(kid)
+        if not cert:
+            raise InvalidIdTokenError(f"IDトークンの鍵IDに対応する公開鍵がありません: {kid}")
+
+        try:
+            claims = jwt.decode(
+                token,
+                cert,
+                algorithms=["RS256"],
+                audience=project_id,
+                issuer=f"https://securetoken.google.com/{project_id}",
+                options={"leeway": self.clock_skew_seconds},
+            )
+        except ExpiredSignatureError as e:
+            raise ExpiredIdTokenError("IDトークンの期限が切れています", e)
+        except JWTError as e:
+            raise InvalidIdTokenError(f"IDトークンの検証に失敗しました: {str(e)}", cause=e)
+
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidIdTokenError("IDトークンのsubクレームが不正です")
+        if claims.get("auth_time", 0) > time.time() + self.clock_skew_seconds:
+            raise InvalidIdTokenError("IDトークンのauth_timeが未来の時刻です")
+
+        claims["uid"] = subject
+        return claims
+
+    def _certs_fresh(self, force_refresh: bool) -> bool:
+        """キャッシュ済みの公開鍵をそのまま使えるか"""
+        if not self._certs:
+            return False
+        now = time.monotonic()
+        if force_refresh:
+            # 直近に取得した（または取得を試みた）場合は再取得しない
+            return self._certs_fetched_at is not None and now - self._certs_fetched_at < self.certs_min_refresh_seconds
+        return now < self._certs_expire_at
+
+    async def _get_certs(self, force_refresh: bool = False) -> Dict[str, str]:
+        """Googleの公開鍵を取得する（Cache-Controlのmax-ageまでキャッシュ）"""
+        if self._certs_fresh(force_refresh):
+            return self._certs
+
+        async with self._certs_lock:
+            # 待機中に他のリクエストが更新済みであればそれを使う
+            if self._certs_fresh(force_refresh):
+                return self._certs
+
+            self._certs_fetched_at = time.monotonic()
+            try:
+                async with httpx.AsyncClient(timeout=10.0) as client:
+                    response = await client.get(self.certs_url)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                if self._certs:
+                    logger.warning(f"公開鍵の更新に失敗したため、キャッシュ済みの鍵を使用します: {str(e)}")
+                    return self._certs
+                raise InvalidIdTokenError(f"公開鍵を取得できませんでした: {str(e)}", cause=e)
+
+            match = _MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+            max_age = int(match.group(1)) if match else 3600
+            self._certs = response.json()
+            self._certs_expire_at = time.monotonic() + max_age
+            logger.info(f"Googleの公開鍵を取得しました（{len(self._certs)}件, キャッシュ期間: {max_age}秒）")
+            return self._certs
+
+    async def warm_up(self) -> None:
+        """
+        最初のリクエストの前にプロジェクトIDの解決と公開鍵の取得を済ませる
+
+        Raises:
+            Exception: 公開鍵を取得できない場合
+        """
+        if self._project_id is None:
+            await run_blocking(lambda: self.project_id)
+        await self._get_certs()
+
+    async def _check_revoked(self, claims: Dict[str, Any]) -> None:
+        """トークンが無効化されていないか、ユーザーが無効になっていないか確認する"""
+        user = await run_blocking(lambda: auth.get_user(claims["uid"], app=get_firebase_app()))
+        if user.disabled:
+            raise UserDisabledError("ユーザーが無効化されています")
+        valid_after = user.tokens_valid_after_timestamp
+        if valid_after and claims.get("iat", 0) * 1000 < valid_after:
+            raise RevokedIdTokenError("IDトークンが無効化されています")
+
+
+# アプリケーション全体で共有するトークン検証インスタンス
+token_verifier = FirebaseTokenVerifier(
+    project_id=settings.FIREBASE_PROJECT_ID or None,
+    claims_cache_size=settings.TOKEN_CLAIMS_CACHE_SIZE,
+    clock_skew_seconds=settings.TOKEN_CLOCK_SKEW_SECONDS,
+    certs_url=settings.FIREBASE_CERTS_URL,
+    certs_min_refresh_seconds=settings.TOKEN_CERTS_MIN_REFRESH_SECONDS,
+)
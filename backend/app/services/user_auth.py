@@ -1,18 +1,30 @@
 """
 ユーザー認証関連のサービス
 """
-from fastapi import Depends, HTTPException, status, Header, Request
+from fastapi import Depends, HTTPException, status, Header
 from typing import Optional, Dict, Any
 import logging
-import firebase_admin
-from firebase_admin import auth, credentials
 from firebase_admin.auth import InvalidIdTokenError, ExpiredIdTokenError, RevokedIdTokenError
 
-from app.database import db
+from app.database import repository
+from app.services.executor import run_blocking
+from app.services.token_verifier import token_verifier
+from app.services.cache import TTLCache
+from app.config import settings
 
 # ロガーのセットアップ
 logger = logging.getLogger(__name__)
 
+# 未登録ユーザーをキャッシュするための番兵
+_UNREGISTERED = object()
+
+# firebase_uid → ユーザー情報のキャッシュ（ユーザーIDは変化しないため全ルートで共有する）
+user_cache: TTLCache[Any] = TTLCache(
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+    name="users-by-firebase-uid",
+)
+
 async def verify_firebase_token(authorization: str = Header(None)) -> str:
     """
     Firebaseトークンを検証し、ユーザーIDを返す
@@ -45,7 +57,8 @@ async def verify_firebase_token(authorization: str = Header(None)) -> str:
         
         # Firebaseトークンを検証
         try:
-            decoded_token = auth.verify_id_token(token)
+            # 公開鍵とデコード済みクレームをキャッシュする検証器を使用
+            decoded_token = await token_verifier.verify(token, check_revoked=settings.FIREBASE_CHECK_REVOKED)
             uid = decoded_token.get("uid")
             if not uid:
                 raise HTTPException(
@@ -55,12 +68,6 @@ async def verify_firebase_token(authorization: str = Header(None)) -> str:
                 )
             
             return uid
-        except InvalidIdTokenError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="無効な認証トークンです",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
         except ExpiredIdTokenError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,6 +80,15 @@ async def verify_firebase_token(authorization: str = Header(None)) -> str:
                 detail="認証トークンが無効化されています",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        # ExpiredIdTokenError/RevokedIdTokenErrorはInvalidIdTokenErrorのサブクラスなので最後に捕捉する
+        except InvalidIdTokenError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="無効な認証トークンです",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"トークン検証エラー: {str(e)}")
         raise HTTPException(
@@ -81,6 +97,44 @@ async def verify_firebase_token(authorization: str = Header(None)) -> str:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def resolve_user(firebase_uid: str) -> Optional[Dict[str, Any]]:
+    """
+    Firebase UIDからユーザー情報を取得する（キャッシュ付き）
+    
+    未登録ユーザーも短い期間だけキャッシュし、登録前のリクエストが
+    続いてもFirestoreへの問い合わせが繰り返されないようにする。
+    
+    Args:
+        firebase_uid: 検証済みのFirebase UID
+    
+    Returns:
+        dict: ユーザー情報。未登録の場合はNone
+    """
+    cached = user_cache.get(firebase_uid)
+    if cached is _UNREGISTERED:
+        return None
+    if cached is not None:
+        return dict(cached)
+    
+    # ストレージからユーザー検索
+    user_data = await run_blocking(repository.find_user_by_firebase_uid, firebase_uid)
+    
+    if user_data is None:
+        user_cache.set(firebase_uid, _UNREGISTERED, ttl=settings.USER_NEGATIVE_CACHE_TTL_SECONDS)
+        return None
+    
+    user_cache.set(firebase_uid, user_data)
+    return dict(user_data)
+
+def invalidate_user(firebase_uid: str) -> None:
+    """
+    ユーザー情報のキャッシュを破棄する（ユーザー登録・更新時に呼び出す）
+    
+    Args:
+        firebase_uid: Firebase UID
+    """
+    user_cache.delete(firebase_uid)
+
 async def get_current_user(firebase_uid: str = Depends(verify_firebase_token)) -> Dict[str, Any]:
     """
     認証済みのFirebase UIDからユーザー情報を取得する
@@ -95,12 +149,9 @@ async def get_current_user(firebase_uid: str = Depends(verify_firebase_token)) -
         HTTPException: ユーザーが見つからない場合
     """
     try:
-        # Firestoreでユーザー検索
-        users_ref = db.collection('users')
-        query = users_ref.where("firebase_uid", "==", firebase_uid).limit(1)
-        users = list(query.stream())
+        user_data = await resolve_user(firebase_uid)
         
-        if not users:
+        if user_data is None:
             # ユーザーが見つからない場合は404エラー
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -108,7 +159,7 @@ async def get_current_user(firebase_uid: str = Depends(verify_firebase_token)) -
             )
         
         # ユーザーデータを返す
-        return users[0].to_dict()
+        return user_data
     except HTTPException:
         raise
     except Exception as e:
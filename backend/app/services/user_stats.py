@@ -0,0 +1,238 @@
+"""
+ユーザーごとのMBTI次元スコアの統計
+"""
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.database.repository import SERVER_TIMESTAMP, timestamp_sort_key
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+DIMENSION_KEYS = ("EI", "SN", "TF", "JP")
+# 同じ日記を二重に数えないように保持する直近の日記IDの件数
+RECENT_IDS_SIZE = 50
+
+
+class _StatsMissing(Exception):
+    """統計ドキュメントがまだない場合に、加算をやめて日記から作成し直すための例外"""
+
+
+def mbti_type(dimensions: Dict[str, float]) -> str:
+    """
+    次元スコアからMBTIタイプを求める
+
+    スコアが50未満なら1文字目（E, S, T, J）、50以上なら2文字目（I, N, F, P）とする。
+    アプリの分析画面の判定と同じ。
+    """
+    return "".join(key[0] if dimensions.get(key, 50) < 50 else key[1] for key in DIMENSION_KEYS)
+
+
+def _to_datetime(created_at: Any) -> datetime:
+    """作成日時（datetime・ISO形式の文字列・UNIX時刻）をUTCのdatetimeに揃える（不明な場合は現在時刻）"""
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            return datetime.now(timezone.utc)
+    if isinstance(created_at, datetime):
+        return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+    if isinstance(created_at, (int, float)):
+        return datetime.fromtimestamp(created_at, tz=timezone.utc)
+    return datetime.now(timezone.utc)
+
+
+def empty_stats() -> Dict[str, Any]:
+    """日記が1件もない状態の統計"""
+    return {
+        "count": 0,
+        "dimensions": {key: {"mean": 0.0, "m2": 0.0, "ewma": None} for key in DIMENSION_KEYS},
+        "latest": None,
+        "recent_ids": [],
+    }
+
+
+def apply_entries(stats: Dict[str, Any], entries: Iterable[Dict[str, Any]], ewma_alpha: float) -> Dict[str, Any]:
+    """
+    統計に日記を加えた新しい統計を返す（引数の統計は変更しない）
+
+    平均と分散はWelfordの方法で逐次更新する。EWMAは時系列の順に更新する必要があるため、
+    すでに加えた最新の日記より古い日記（元の日付でインポートした日記など）はEWMAに含めない。
+    recent_idsに含まれる日記はすでに数えているため読み飛ばす。
+
+    Args:
+        stats: 現在の統計
+        entries: id・dimensions・created_atを持つ日記（古い順）
+        ewma_alpha: EWMAの平滑化係数（大きいほど新しい日記の重みが大きい）
+
+    Returns:
+        Dict[str, Any]: 更新後の統計
+    """
+    count = stats["count"]
+    dimensions = {key: dict(value) for key, value in stats["dimensions"].items()}
+    latest = stats.get("latest")
+    recent_ids = list(stats.get("recent_ids", []))
+
+    for entry in entries:
+        if entry["id"] in recent_ids:
+            continue
+        count += 1
+        scores = entry.get("dimensions") or {}
+        created_at = _to_datetime(entry.get("created_at"))
+        is_newest = latest is None or created_at >= _to_datetime(latest["created_at"])
+        for key in DIMENSION_KEYS:
+            value = float(scores.get(key, 50))
+            dimension = dimensions.setdefault(key, {"mean": 0.0, "m2": 0.0, "ewma": None})
+            delta = value - dimension["mean"]
+            dimension["mean"] += delta / count
+            dimension["m2"] += delta * (value - dimension["mean"])
+            previous = dimension["ewma"]
+            if previous is None:
+                dimension["ewma"] = value
+            elif is_newest:
+                dimension["ewma"] = ewma_alpha * value + (1 - ewma_alpha) * previous
+
+        if is_newest:
+            latest = {
+                "id": entry["id"],
+                "created_at": created_at.isoformat(),
+                "type": mbti_type(scores),
+            }
+        recent_ids = (recent_ids + [entry["id"]])[-RECENT_IDS_SIZE:]
+
+    return {"count": count, "dimensions": dimensions, "latest": latest, "recent_ids": recent_ids}
+
+
+def summarize(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """保存している統計をAPIレスポンスの形式に変換する（分散は不偏分散）"""
+    count = stats["count"]
+    dimensions = {}
+    for key in DIMENSION_KEYS:
+        dimension = stats["dimensions"].get(key, {"mean": 0.0, "m2": 0.0, "ewma": None})
+        variance = dimension["m2"] / (count - 1) if count > 1 else 0.0
+        dimensions[key] = {
+            "mean": round(dimension["mean"], 4),
+            "variance": round(variance, 4),
+            "stddev": round(math.sqrt(variance), 4),
+            "ewma": round(dimension["ewma"], 4) if dimension["ewma"] is not None else None,
+        }
+    latest = stats.get("latest")
+    return {
+        "count": count,
+        "dimensions": dimensions,
+        "latest_type": latest["type"] if latest else None,
+        "latest_created_at": latest["created_at"] if latest else None,
+    }
+
+
+class UserStatsStore:
+    """
+    ユーザーごとの次元スコアの統計を管理するクラス
+
+    'user_stats'コレクションのユーザーIDのドキュメントに件数・平均・分散（Welfordの方法のM2）・
+    EWMA・最新のタイプを保持し、日記の保存時にトランザクションで更新する。
+    統計の取得は日記の件数によらず1ドキュメントの読み込みで済む。
+    統計がまだないユーザーは、初回の読み込み時に日記から作成する。
+    """
+
+    def __init__(self, repository=None, collection: str = "user_stats", ewma_alpha: float = 0.3):
+        self.repository = repository
+        self.collection = collection
+        self.ewma_alpha = ewma_alpha
+
+    async def record(self, user_id: str, entries: List[Dict[str, Any]]) -> None:
+        """
+        統計に日記を加える（日記の保存時に呼び出す）
+
+        統計がまだない場合は日記から作成する（一覧の取得に間に合わなかった今回の日記も含める）。
+        失敗しても日記の保存は成功しているため、例外は送出せずに警告を記録する。
+        統計は次回の読み込み時に作り直される。
+
+        Args:
+            user_id: ユーザーID
+            entries: id・dimensions・created_atを持つ日記
+        """
+        if self.repository is None or not entries:
+            return
+        try:
+            await run_blocking(self._apply, user_id, entries)
+        except Exception as e:
+            logger.warning(f"ユーザー統計の更新に失敗しました - ユーザー: {user_id}: {str(e)}")
+            await self.invalidate(user_id)
+
+    async def load(self, user_id: str) -> Dict[str, Any]:
+        """
+        統計を取得する
+
+        Args:
+            user_id: ユーザーID
+
+        Returns:
+            Dict[str, Any]: summarizeで変換した統計
+        """
+        stats = await run_blocking(self.repository.get_document, self.collection, user_id)
+        if stats is None:
+            stats = await run_blocking(self._rebuild, user_id)
+        return summarize(stats)
+
+    async def invalidate(self, user_id: str) -> None:
+        """統計を破棄し、次回の読み込み時に日記から作り直させる"""
+        if self.repository is None:
+            return
+        try:
+            await run_blocking(self.repository.delete_document, self.collection, user_id)
+        except Exception as e:
+            logger.warning(f"ユーザー統計の破棄に失敗しました: {str(e)}")
+
+    @staticmethod
+    def _sorted(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """日記を古い順に並べる（EWMAを時系列の順に更新するため）"""
+        return sorted(entries, key=lambda entry: timestamp_sort_key(_to_datetime(entry.get("created_at"))))
+
+    def _apply(self, user_id: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """統計を読み込み、日記を加えて書き戻す（不可分に実行。統計がまだない場合は日記から作成する）"""
+        entries = self._sorted(entries)
+
+        def update(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if current is None:
+                raise _StatsMissing()
+            return {**apply_entries(current, entries, self.ewma_alpha), "updated_at": SERVER_TIMESTAMP}
+
+        try:
+            return self.repository.update_document(self.collection, user_id, update)
+        except _StatsMissing:
+            return self._rebuild(user_id, entries)
+
+    def _rebuild(self, user_id: str, new_entries: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """
+        ユーザーのすべての日記から統計を作成する
+
+        Args:
+            user_id: ユーザーID
+            new_entries: 保存したばかりの日記（一覧に含まれていなければ加える）
+        """
+        diaries = self.repository.list_user_diaries(user_id, fields=["dimensions", "created_at"])
+        listed_ids = {diary["id"] for diary in diaries}
+        # 分析結果のない日記（分析待ちなど）は含めない
+        entries = self._sorted(
+            [diary for diary in diaries if diary.get("dimensions")]
+            + [entry for entry in new_entries if entry["id"] not in listed_ids]
+        )
+        rebuilt = apply_entries(empty_stats(), entries, self.ewma_alpha)
+
+        def update(current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if current is not None and not new_entries:
+                return current
+            if current is not None:
+                # 作成中に他のリクエストが統計を作成していた場合はそちらを使い、
+                # 保存したばかりの日記がそちらの一覧に間に合わなかった場合に備えて加える
+                # （すでに数えている日記はrecent_idsで読み飛ばされる）
+                return {**apply_entries(current, new_entries, self.ewma_alpha), "updated_at": SERVER_TIMESTAMP}
+            return {**rebuilt, "updated_at": SERVER_TIMESTAMP}
+
+        stats = self.repository.update_document(self.collection, user_id, update)
+        logger.info(f"ユーザー {user_id} の統計を作成しました（{stats['count']}件）")
+        return stats
@@ -0,0 +1,363 @@
+"""
+日記の保存を遅延してまとめて書き込むライトビハインドバッファ
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.database.repository import dumps_document, loads_document, resolve_server_timestamps
+from app.services.executor import run_blocking
+
+# ロガーのセットアップ
+logger = logging.getLogger(__name__)
+
+
+class DiaryJournal:
+    """
+    書き込み待ちの日記を記録する追記専用のファイル
+
+    日記はストレージに書き込む前にこのファイルへ追記（fsync）し、プロセスが異常終了しても
+    次回の起動時に書き込み直せるようにする。書き込みが済んだら未書き込みの日記だけで作り直す。
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def append(self, diary: Dict[str, Any]) -> None:
+        """日記を1行追記し、ディスクに書き出すまで待つ"""
+        line = dumps_document(diary) + "\n"
+        with self._lock:
+            file = self._open()
+            file.write(line)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+
+    def load(self) -> List[Dict[str, Any]]:
+        """記録されている日記を読み込む（同じIDの日記は後の行を使う）"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return []
+            diaries: Dict[str, Dict[str, Any]] = {}
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        diary = loads_document(line)
+                    except ValueError:
+                        # 書き込み途中で終了した最後の行は読み飛ばす（fsync前なので応答もしていない）
+                        logger.warning("ジャーナルの不完全な行を読み飛ばしました")
+                        continue
+                    diaries[diary["id"]] = diary
+            return list(diaries.values())
+
+    def rewrite(self, snapshot: Callable[[], List[Dict[str, Any]]]) -> None:
+        """
+        書き込みが済んでいない日記だけでファイルを作り直す
+
+        Args:
+            snapshot: 書き込みが済んでいない日記を返す関数。追記と競合しないよう、ロックを取ってから呼び出す
+                （ロックの前に取得すると、その間に追記された日記が作り直したファイルから消える）
+        """
+        with self._lock:
+            diaries = snapshot()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not diaries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.writelines(dumps_document(diary) + "\n" for diary in diaries)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+
+    def park(self, diary: Dict[str, Any]) -> None:
+        """書き込めない日記を別のファイル（パス + ".rejected"）に退避する（手動での確認・復旧用）"""
+        line = dumps_document(diary) + "\n"
+        with self._lock:
+            with open(self.path + ".rejected", "a", encoding="utf-8") as file:
+                file.write(line)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class DiaryWriteBehind:
+    """
+    日記の保存をまとめてバッチ書き込みするクラス
+
+    submitはジャーナルへの追記が済んだ時点で戻るため、リクエストはストレージへの書き込みを待たない。
+    書き込み待ちの日記はmax_batch_size件たまるか、最初の日記からflush_interval_secondsが経つと
+    まとめてsave_diariesで書き込む。バッチの書き込みに失敗した場合は1件ずつ書き込み直し、
+    他の日記は書き込めたのに失敗した日記がmax_item_attempts回に達したら、ジャーナルの
+    ".rejected"ファイルに退避して書き込み待ちから外す（1件の不正な日記で全体を止めないため）。
+    すべて失敗した場合は間隔を空けて再試行する。
+    日記IDで上書きするため、同じ日記を二度書き込んでも結果は変わらない（少なくとも1回の書き込みを保証する）。
+    on_flushedを指定した場合は、書き込みが済んだ日記を渡して呼び出す（wait_for_userの待機が終わる前に完了する）。
+    """
+
+    def __init__(
+        self,
+        repository,
+        journal: DiaryJournal,
+        max_batch_size: int = 200,
+        flush_interval_seconds: float = 0.1,
+        retry_max_seconds: float = 30.0,
+        max_item_attempts: int = 3,
+        on_flushed: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ):
+        self.repository = repository
+        self.journal = journal
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_item_attempts = max_item_attempts
+        self.on_flushed = on_flushed
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # 日記IDごとの、単独で書き込みに失敗した回数
+        self._item_failures: Dict[str, int] = {}
+        self._journal_dirty = False
+        # 書き込み待ちの日記があることを知らせる
+        self._wakeup: Optional[asyncio.Event] = None
+        # 時間の窓を待たずにすぐ書き込ませる（件数が上限に達した・読み込みが待っている）
+        self._flush_now: Optional[asyncio.Event] = None
+        self._flushed: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._flushed = asyncio.Condition()
+        # 前回の終了時に書き込めなかった日記を書き込み直す
+        for diary in await run_blocking(self.journal.load):
+            self._pending[diary["id"]] = diary
+        if self._pending:
+            self.replayed = len(self._pending)
+            self._journal_dirty = True
+            self._wakeup.set()
+            self._flush_now.set()
+            logger.warning(f"ジャーナルから書き込み待ちの日記を{self.replayed}件復元しました")
+        self._task = asyncio.create_task(self._run(), name="diary-write-behind")
+        logger.info(
+            f"日記のライトビハインドを開始しました（最大{self.max_batch_size}件 / {self.flush_interval_seconds}秒ごと）"
+        )
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """書き込み待ちの日記を書き込んでから停止する（書き込めなかった日記はジャーナルに残る）"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await asyncio.wait_for(self._flush_until_empty(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"日記の書き込みが終わらないまま停止します（残り: {len(self._pending)}件。次回の起動時に書き込み直します）")
+        await run_blocking(self.journal.close)
+        logger.info("日記のライトビハインドを停止しました")
+
+    async def submit(self, diary: Dict[str, Any]) -> None:
+        """
+        日記を書き込み待ちに加える（ジャーナルへの追記が済んだ時点で戻る）
+
+        SERVER_TIMESTAMPは書き込み直したときにも同じ日時になるよう、この時点の時刻に置き換える。
+
+        Args:
+            diary: 保存する日記（"id"を含む）
+        """
+        if self._task is None:
+            raise RuntimeError("日記のライトビハインドが起動していません")
+        diary = resolve_server_timestamps(diary)
+        # 追記より先に書き込み待ちに加える（追記中にジャーナルを作り直しても、この日記が残るように）
+        self._pending[diary["id"]] = diary
+        try:
+            await run_blocking(self.journal.append, diary)
+        except Exception:
+            self._discard(diary)
+            raise
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_now.set()
+
+    def has_pending(self, user_id: str) -> bool:
+        return any(diary.get("user_id") == user_id for diary in self._pending.values())
+
+    async def wait_for_user(self, user_id: str, timeout: float = 5.0) -> None:
+        """
+        ユーザーの書き込み待ちの日記がストレージに書き込まれるまで待つ（読み込み前の整合性のため）
+
+        Args:
+            user_id: ユーザーID
+            timeout: 待つ最大時間（秒）。超えた場合は書き込みを待たずに戻る
+        """
+        if self._task is None or not self.has_pending(user_id):
+            return
+        # 時間の経過を待たずにすぐ書き込ませる
+        self._wakeup.set()
+        self._flush_now.set()
+        try:
+            async with self._flushed:
+                await asyncio.wait_for(self._flushed.wait_for(lambda: not self.has_pending(user_id)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ユーザー {user_id} の日記の書き込み待ちがタイムアウトしました")
+
+    async def _run(self) -> None:
+        delay = self.flush_interval_seconds
+        while True:
+            await self._wakeup.wait()
+            # 時間の窓の間に届いた日記をまとめる（件数が上限に達したか、読み込みが待っていればすぐ書き込む）
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._flush_now.clear()
+            if await self._flush_once():
+                delay = self.flush_interval_seconds
+            else:
+                # 失敗した場合は間隔を空けて再試行する
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_seconds)
+            if self._pending:
+                self._wakeup.set()
+
+    async def _flush_once(self) -> bool:
+        """書き込み待ちの日記を最大max_batch_size件書き込む"""
+        if not self._pending:
+            return True
+        batch = list(self._pending.values())[:self.max_batch_size]
+        start = time.perf_counter()
+        try:
+            await run_blocking(self.repository.save_diaries, batch)
+            written = batch
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"日記のバッチ書き込みに失敗しました（{len(batch)}件。1件ずつ書き込み直します）: {str(e)}")
+            written = await self._write_individually(batch)
+            if not written:
+                return False
+        self.last_flush_seconds = time.perf_counter() - start
+        self.flushes += 1
+        self.written += len(written)
+        for diary in written:
+            self._item_failures.pop(diary["id"], None)
+            self._discard(diary)
+        self._journal_dirty = True
+        await self._compact_journal()
+        if self.on_flushed is not None:
+            try:
+                await self.on_flushed(written)
+            except Exception as e:
+                logger.warning(f"書き込み後の処理に失敗しました: {str(e)}")
+        async with self._flushed:
+            self._flushed.notify_all()
+        return True
+
+    def _discard(self, diary: Dict[str, Any]) -> None:
+        """書き込み待ちから外す（書き込み中に同じIDで再投入された日記は残す）"""
+        if self._pending.get(diary["id"]) is diary:
+            del self._pending[diary["id"]]
+
+    async def _write_individually(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        バッチの書き込みに失敗した日記を1件ずつ書き込む
+
+        他の日記は書き込めたのに失敗した日記は、その日記自体に問題があるとみなして失敗の回数を数え、
+        max_item_attempts回に達したらジャーナルの".rejected"ファイルに退避して書き込み待ちから外す。
+
+        Returns:
+            List[Dict[str, Any]]: 書き込めた日記
+        """
+        written: List[Dict[str, Any]] = []
+        failed = []
+        for diary in batch:
+            try:
+                await run_blocking(self.repository.save_diary, diary)
+                written.append(diary)
+            except Exception as e:
+                failed.append((diary, e))
+        if not written:
+            # すべて失敗した場合はストレージの障害とみなし、日記ごとの失敗には数えない
+            return written
+
+        for diary, error in failed:
+            attempts = self._item_failures.get(diary["id"], 0) + 1
+            if attempts < self.max_item_attempts:
+                self._item_failures[diary["id"]] = attempts
+                logger.warning(f"日記を書き込めませんでした（{attempts}回目。再試行します） - ID: {diary['id']}: {str(error)}")
+                continue
+            try:
+                await run_blocking(self.journal.park, diary)
+            except Exception as e:
+                logger.error(f"書き込めない日記を退避できませんでした - ID: {diary['id']}: {str(e)}")
+                continue
+            self._item_failures.pop(diary["id"], None)
+            self._discard(diary)
+            self._journal_dirty = True
+            self.rejected += 1
+            logger.error(
+                f"日記を{attempts}回書き込めなかったため、書き込み待ちから外して退避しました"
+                f"（{self.journal.path}.rejected） - ID: {diary['id']}: {str(error)}"
+            )
+        return written
+
+    async def _compact_journal(self) -> None:
+        if not self._journal_dirty:
+            return
+        try:
+            await run_blocking(self.journal.rewrite, lambda: list(self._pending.values()))
+            self._journal_dirty = False
+        except Exception as e:
+            # 書き込み済みの日記が残っていても、復元時に同じIDで上書きするだけなので問題ない
+            logger.warning(f"ジャーナルの整理に失敗しました: {str(e)}")
+
+    async def _flush_until_empty(self) -> None:
+        delay = self.flush_interval_seconds
+        while self._pending:
+            if not await self._flush_once():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "pending": len(self._pending),
+            "max_batch_size": self.max_batch_size,
+            "flush_interval_seconds": self.flush_interval_seconds,
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 1),
+        }
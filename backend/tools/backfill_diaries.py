@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+日記ドキュメントの正規化バックフィル
+
+古い形式で保存されている日記（UNIX時刻の作成日時、欠損している次元スコア、数値以外のスコアなど）を
+正規の形式に書き換え、schema_versionを付ける。正規の形式の日記は読み込み時に補正や検証をせずに
+返せるようになる（app/services/diary_decoder.pyを参照）。
+
+保存先はバックエンドと同じ設定（STORAGE_BACKENDなど、.envを含む）から決まる。
+すべての日記をIDの順に読み込み、書き換えが必要な日記だけをまとめて書き込む。
+何度実行しても結果は同じなので、途中で止めた場合は表示された最後のIDを--start-afterに
+指定して再開できる。分析待ち・分析失敗の日記や、作成日時がなく補正できない日記は書き換えない。
+
+使い方:
+    python tools/backfill_diaries.py --dry-run
+    python tools/backfill_diaries.py --batch-size 200
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# backendディレクトリからappパッケージを読み込む
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import repository  # noqa: E402
+from app.services.data_version import data_versions  # noqa: E402
+from app.services.diary_decoder import is_canonical, normalize_diary  # noqa: E402
+from app.services.executor import blocking_executor  # noqa: E402
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="日記ドキュメントを正規の形式に書き換える")
+    parser.add_argument("--batch-size", type=int, default=200, help="1回に読み込む（書き込む）日記の件数")
+    parser.add_argument("--start-after", default=None, help="このIDより後の日記から処理する（中断した処理の再開用）")
+    parser.add_argument("--dry-run", action="store_true", help="書き換えずに件数だけを表示する")
+    return parser.parse_args(argv)
+
+
+async def bump_versions(user_ids: List[str]) -> List[str]:
+    """
+    日記を書き換えたユーザーのデータのバージョンを増やす（クライアントのETagを無効にする）
+
+    Returns:
+        List[str]: バージョンを増やせなかったユーザーのID
+    """
+    return [user_id for user_id in user_ids if not await data_versions.bump(user_id)]
+
+
+def main() -> None:
+    args = parse_args()
+    if args.batch_size <= 0:
+        sys.exit("--batch-sizeには正の値を指定してください")
+
+    print(f"日記のバックフィルを開始します（保存先: {repository.backend_name}{'、ドライラン' if args.dry_run else ''}）")
+    counts = {"scanned": 0, "canonical": 0, "rewritten": 0, "skipped": 0}
+    user_ids = set()
+    last_id = args.start_after
+    start = time.monotonic()
+    try:
+        while True:
+            page = repository.scan_diaries(args.batch_size, last_id)
+            if not page:
+                break
+            rewritten = []
+            for diary in page:
+                counts["scanned"] += 1
+                if is_canonical(diary):
+                    counts["canonical"] += 1
+                    continue
+                normalized = normalize_diary(diary)
+                if normalized is None:
+                    counts["skipped"] += 1
+                    continue
+                rewritten.append(normalized)
+            if rewritten and not args.dry_run:
+                repository.save_diaries(rewritten)
+            counts["rewritten"] += len(rewritten)
+            user_ids.update(diary["user_id"] for diary in rewritten if diary.get("user_id"))
+            last_id = page[-1]["id"]
+            print(
+                f"{counts['scanned']}件を確認しました（書き換え: {counts['rewritten']}件, "
+                f"対象外: {counts['skipped']}件, 最後のID: {last_id}）"
+            )
+            if len(page) < args.batch_size:
+                break
+
+        if user_ids and not args.dry_run:
+            failed_user_ids = asyncio.run(bump_versions(sorted(user_ids)))
+            if failed_user_ids:
+                print(
+                    f"データのバージョンを増やせなかったユーザーが{len(failed_user_ids)}件あります"
+                    f"（次にデータを変更するまで古いETagが一致する場合があります）: {', '.join(failed_user_ids)}"
+                )
+    finally:
+        blocking_executor.shutdown(wait=True)
+        repository.close()
+
+    elapsed = time.monotonic() - start
+    print(
+        f"完了しました（{elapsed:.1f}秒）: 確認 {counts['scanned']}件, 正規の形式 {counts['canonical']}件, "
+        f"{'書き換え対象' if args.dry_run else '書き換え'} {counts['rewritten']}件, 対象外 {counts['skipped']}件"
+    )
+
+
+if __name__ == "__main__":
+    main()
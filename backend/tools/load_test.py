@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+バックエンドのエンドツーエンド負荷試験ツール
+
+目標RPSで /diary/analyze-and-save, /diary/user, /diary/user/growth にリクエストを送り、
+エンドポイントごとのレイテンシー（p50/p95/p99）、スループット、エラー率を集計する。
+tools/mock_dify_server.pyと組み合わせるとネットワークに接続せずに実行できる
+（起動手順はmock_dify_server.pyの説明を参照）。
+
+リクエストは前のリクエストの完了を待たずに一定間隔で送る（オープンループ）。
+レイテンシーは送信予定時刻から計測するため、サーバーが遅くなっても
+送信が遅れて結果が良く見えること（coordinated omission）はない。
+
+使い方:
+    python tools/load_test.py --target http://localhost:8000 --auth-server http://localhost:8787 \\
+        --rps 20 --duration 60 --users 50 --mix analyze=1,list=3,growth=1
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+API_PREFIX = "/api/v1"
+
+ENDPOINTS = {
+    "analyze": ("POST", f"{API_PREFIX}/diary/analyze-and-save"),
+    "list": ("GET", f"{API_PREFIX}/diary/user"),
+    "growth": ("GET", f"{API_PREFIX}/diary/user/growth"),
+}
+
+DIARY_TEMPLATES = [
+    "今日は{n}時に起きて、朝から散歩に出かけた。空気が澄んでいて気持ちよかった。",
+    "仕事で新しいプロジェクトが始まった。メンバーは{n}人で、少し緊張している。",
+    "友人と久しぶりに会って{n}時間も話し込んでしまった。とても楽しかった。",
+    "一人で本を読んで過ごした。{n}ページほど進んだが、考えさせられる内容だった。",
+    "予定が{n}件も重なって慌ただしい一日だった。計画を立て直す必要がありそうだ。",
+]
+
+
+@dataclass
+class EndpointResult:
+    """エンドポイントごとの計測結果"""
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    ok: int = 0
+
+    def record(self, status: str, latency: float, ok: bool) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if ok:
+            self.ok += 1
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """昇順に並んだ値から最近傍順位法でパーセンタイルを求める"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """'analyze=1,list=3,growth=1' 形式のリクエスト比率を解析する"""
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"未対応のエンドポイントです: {name}（{', '.join(ENDPOINTS)}から選択）")
+        weights.append((name, float(weight or 1)))
+    return weights
+
+
+class LoadTest:
+    """目標RPSでリクエストを送り、結果を集計するクラス"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.tokens: List[str] = []
+        self.results: Dict[str, EndpointResult] = {name: EndpointResult() for name, _ in self.mix}
+        self.dropped = 0
+        self.in_flight = 0
+        self.max_schedule_lag = 0.0
+        self.recent_contents: List[str] = []
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        """仮想ユーザーのトークンを取得し、バックエンドに登録する"""
+        async with httpx.AsyncClient(base_url=self.args.auth_server, timeout=10.0) as auth_client:
+            for i in range(self.args.users):
+                uid = f"loadtest-{i}"
+                response = await auth_client.get("/token", params={"uid": uid})
+                response.raise_for_status()
+                token = response.json()["id_token"]
+                self.tokens.append(token)
+
+                response = await client.post(
+                    f"{API_PREFIX}/users/register",
+                    json={"username": uid, "mbti": "INFP", "firebase_uid": uid},
+                    headers={"Authorization": f"Bearer {token}"},
+                )
+                # 既に登録済みの場合（409）は前回の試験のユーザーをそのまま使う
+                if response.status_code not in (201, 409):
+                    raise RuntimeError(f"ユーザー登録に失敗しました: {response.status_code} {response.text}")
+        print(f"仮想ユーザー{len(self.tokens)}人の準備が完了しました")
+
+    def diary_content(self) -> str:
+        """日記本文を生成する（--duplicate-ratioの割合で過去の本文を再利用する）"""
+        if self.recent_contents and self.rng.random() < self.args.duplicate_ratio:
+            return self.rng.choice(self.recent_contents)
+        content = self.rng.choice(DIARY_TEMPLATES).format(n=self.rng.randint(1, 1000))
+        self.recent_contents = (self.recent_contents + [content])[-100:]
+        return content
+
+    async def send(self, client: httpx.AsyncClient, name: str, scheduled_at: float, measured: bool) -> None:
+        """リクエストを1件送り、送信予定時刻からのレイテンシーを記録する"""
+        method, path = ENDPOINTS[name]
+        headers = {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+        body = {"content": self.diary_content()} if method == "POST" else None
+        self.in_flight += 1
+        try:
+            response = await client.request(method, path, json=body, headers=headers)
+            status, ok = str(response.status_code), response.status_code < 400
+        except httpx.TimeoutException:
+            status, ok = "timeout", False
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        finally:
+            self.in_flight -= 1
+        if measured:
+            self.results[name].record(status, time.monotonic() - scheduled_at, ok)
+
+    async def run(self) -> float:
+        """ウォームアップと計測期間の負荷をかけ、計測期間の長さ（秒）を返す"""
+        limits = httpx.Limits(max_connections=self.args.max_in_flight, max_keepalive_connections=self.args.max_in_flight)
+        async with httpx.AsyncClient(base_url=self.args.target, timeout=self.args.timeout, limits=limits) as client:
+            await self.setup(client)
+
+            names = [name for name, _ in self.mix]
+            weights = [weight for _, weight in self.mix]
+            interval = 1.0 / self.args.rps
+            total = int((self.args.warmup + self.args.duration) * self.args.rps)
+            tasks = set()
+
+            print(f"負荷試験を開始します - {self.args.rps} RPS, ウォームアップ {self.args.warmup}秒, 計測 {self.args.duration}秒")
+            started_at = time.monotonic()
+            for k in range(total):
+                scheduled_at = started_at + k * interval
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_schedule_lag = max(self.max_schedule_lag, -delay)
+
+                measured = k * interval >= self.args.warmup
+                if self.in_flight >= self.args.max_in_flight:
+                    # 負荷生成側の上限に達した場合は送らずに数える
+                    if measured:
+                        self.dropped += 1
+                    continue
+
+                name = self.rng.choices(names, weights)[0]
+                task = asyncio.create_task(self.send(client, name, scheduled_at, measured))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            measured_until = time.monotonic()
+            if tasks:
+                await asyncio.gather(*tasks)
+            return max(measured_until - started_at - self.args.warmup, 1e-9)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """集計結果を表示し、辞書として返す"""
+        summary: Dict[str, Any] = {
+            "target_rps": self.args.rps,
+            "duration_seconds": round(elapsed, 2),
+            "dropped": self.dropped,
+            "max_schedule_lag_ms": round(self.max_schedule_lag * 1000, 1),
+            "endpoints": {},
+        }
+        all_latencies: List[float] = []
+        total_requests = total_ok = 0
+
+        print()
+        print(f"{'endpoint':<10}{'requests':>10}{'ok/s':>10}{'error%':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, result in self.results.items():
+            latencies = sorted(result.latencies)
+            all_latencies.extend(latencies)
+            count = len(latencies)
+            total_requests += count
+            total_ok += result.ok
+            stats = {
+                "requests": count,
+                "throughput_rps": round(result.ok / elapsed, 2),
+                "error_rate": round((count - result.ok) / count, 4) if count else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+                "statuses": result.statuses,
+            }
+            summary["endpoints"][name] = stats
+            print(
+                f"{name:<10}{count:>10}{stats['throughput_rps']:>10}{stats['error_rate'] * 100:>8.2f}%"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+            )
+
+        all_latencies.sort()
+        summary["total"] = {
+            "requests": total_requests,
+            "throughput_rps": round(total_ok / elapsed, 2),
+            "error_rate": round((total_requests - total_ok) / total_requests, 4) if total_requests else 0.0,
+            "p50_ms": round(percentile(all_latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(all_latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(all_latencies, 99) * 1000, 1),
+        }
+        total = summary["total"]
+        print(
+            f"{'total':<10}{total_requests:>10}{total['throughput_rps']:>10}{total['error_rate'] * 100:>8.2f}%"
+            f"{total['p50_ms']:>10}{total['p95_ms']:>10}{total['p99_ms']:>10}"
+        )
+        print()
+        for name, stats in summary["endpoints"].items():
+            print(f"{name} のステータス内訳: {stats['statuses']}")
+        if self.dropped:
+            print(f"⚠️ 同時送信数の上限（{self.args.max_in_flight}）に達したため{self.dropped}件を送信しませんでした")
+        if self.max_schedule_lag > 0.05:
+            print(f"⚠️ 負荷生成側の送信が最大{summary['max_schedule_lag_ms']}ms遅れました。RPSを下げるか複数プロセスで実行してください")
+        return summary
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="バックエンドのエンドツーエンド負荷試験")
+    parser.add_argument("--target", default="http://localhost:8000", help="バックエンドのURL")
+    parser.add_argument("--auth-server", default="http://localhost:8787", help="トークンを発行するモックサーバーのURL")
+    parser.add_argument("--rps", type=float, default=10, help="目標RPS")
+    parser.add_argument("--duration", type=float, default=30, help="計測期間（秒）")
+    parser.add_argument("--warmup", type=float, default=5, help="計測に含めないウォームアップ期間（秒）")
+    parser.add_argument("--users", type=int, default=20, help="仮想ユーザー数")
+    parser.add_argument("--mix", default="analyze=1,list=3,growth=1", help="エンドポイントごとのリクエスト比率")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="過去と同じ本文で分析を依頼する割合（0〜1）")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="同時に送信中にできるリクエスト数の上限")
+    parser.add_argument("--timeout", type=float, default=60, help="リクエストのタイムアウト（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="乱数のシード")
+    parser.add_argument("--json-output", default=None, help="集計結果をJSONで書き出すパス")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    if args.rps <= 0:
+        sys.exit("--rpsには正の値を指定してください")
+
+    load_test = LoadTest(args)
+    elapsed = asyncio.run(load_test.run())
+    summary = load_test.report(elapsed)
+
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"集計結果を書き出しました: {args.json_output}")
+
+
+if __name__ == "__main__":
+    main()
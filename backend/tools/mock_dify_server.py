@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+負荷試験用のDify APIモックサーバー
+
+Difyの /v1/workflows/run をローカルで再現し、応答時間の分布・エラー率・
+ストリーミングを設定できる。ネットワークに接続せずにバックエンドを負荷試験するため、
+Firebase IDトークンの署名に使う公開鍵（/certs）とトークンの発行（/token）も提供する。
+
+使い方:
+    # モックサーバーを起動する
+    python tools/mock_dify_server.py --port 8787 --project-id mbti-diary-loadtest \\
+        --latency-dist lognormal --latency-ms 800 --error-rate 0.02
+
+    # バックエンドをモックサーバーとプロセス内ストレージに向けて起動する
+    STORAGE_BACKEND=memory \\
+    FIREBASE_PROJECT_ID=mbti-diary-loadtest \\
+    FIREBASE_CERTS_URL=http://localhost:8787/certs \\
+    DIFY_BASE_URL=http://localhost:8787/v1 \\
+    uvicorn app.main:app --port 8000
+
+    # Firestoreの挙動も含めて試験する場合は、Firestoreエミュレーターを起動し
+    # --write-credentialsで書き出したダミーの認証情報を使う
+    #   firebase emulators:start --only firestore --project mbti-diary-loadtest
+    #   STORAGE_BACKEND=firestore FIRESTORE_EMULATOR_HOST=localhost:8080 \\
+    #   FIREBASE_CREDENTIALS_PATH=/tmp/loadtest-credentials.json ...
+
+    # 負荷をかける（tools/load_test.pyを参照）
+    python tools/load_test.py --target http://localhost:8000 --auth-server http://localhost:8787 --rps 20
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import random
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import uvicorn
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from jose import jwt
+
+# ロガーのセットアップ
+logger = logging.getLogger("mock_dify_server")
+
+FEEDBACK_TEXT = (
+    "日々の出来事を丁寧に振り返る姿勢から、内省を大切にする傾向がうかがえます。"
+    "新しい経験に対しても前向きで、状況に応じて柔軟に考え方を切り替えられています。"
+    "周囲の人への気配りも感じられ、協調性の高さが文章に表れています。"
+)
+SUMMARY_TEXT = "内省的で柔軟、周囲への気配りができるタイプです。"
+
+
+class LatencyModel:
+    """設定された分布に従って応答時間（秒）を生成する"""
+
+    def __init__(self, dist: str, latency_ms: float, jitter_ms: float, sigma: float, rng: random.Random):
+        self.dist = dist
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.sigma = sigma
+        self.rng = rng
+
+    def sample(self) -> float:
+        if self.dist == "fixed":
+            value = self.latency
+        elif self.dist == "uniform":
+            value = self.rng.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        elif self.dist == "normal":
+            value = self.rng.gauss(self.latency, self.jitter)
+        elif self.dist == "lognormal":
+            # latency_msを中央値とする裾の長い分布
+            value = self.latency * self.rng.lognormvariate(0.0, self.sigma)
+        elif self.dist == "exponential":
+            value = self.rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        else:
+            raise ValueError(f"未対応の分布です: {self.dist}")
+        return max(0.0, value)
+
+
+class MockStats:
+    """モックサーバーが受けたリクエストの集計"""
+
+    def __init__(self):
+        self.requests = 0
+        self.streaming_requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.by_type: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "streaming_requests": self.streaming_requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "by_type": dict(self.by_type),
+        }
+
+
+class SigningKey:
+    """Firebase IDトークンの代わりに使うトークンの署名鍵と証明書"""
+
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+        self.kid = uuid.uuid4().hex
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode("ascii")
+
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "mock-securetoken")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode("ascii")
+
+    def mint(self, uid: str, lifetime: int = 3600) -> str:
+        """Firebase IDトークンと同じ形式のトークンを発行する"""
+        now = int(time.time())
+        claims = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "sub": uid,
+            "user_id": uid,
+            "iat": now,
+            "auth_time": now,
+            "exp": now + lifetime,
+        }
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+    def service_account(self) -> Dict[str, Any]:
+        """Firebase Admin SDKの初期化に使えるダミーのサービスアカウント情報"""
+        return {
+            "type": "service_account",
+            "project_id": self.project_id,
+            "private_key_id": self.kid,
+            "private_key": self.private_pem,
+            "client_email": f"loadtest@{self.project_id}.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+
+
+def build_outputs(request_type: str, rng: random.Random) -> Dict[str, Any]:
+    """リクエストの種類に応じたワークフローの出力を生成する"""
+    if request_type == "growth":
+        return {
+            "message1": "内省の時間を活かす",
+            "content1": "振り返りの習慣を続けながら、気づきを小さな行動に移してみましょう。",
+            "message2": "新しい経験を取り入れる",
+            "content2": "普段と違う場所や人との出会いが、視野を広げるきっかけになります。",
+            "message3": "自分の気持ちを言葉にする",
+            "content3": "感じたことを周囲に伝えることで、より良い関係を築けます。",
+        }
+    return {
+        "E": round(rng.uniform(20, 80), 1),
+        "N": round(rng.uniform(20, 80), 1),
+        "F": round(rng.uniform(20, 80), 1),
+        "J": round(rng.uniform(20, 80), 1),
+        "feedback": FEEDBACK_TEXT,
+        "summary": SUMMARY_TEXT,
+    }
+
+
+def create_app(args: argparse.Namespace, signing_key: SigningKey) -> FastAPI:
+    """モックサーバーのアプリケーションを生成する"""
+    rng = random.Random(args.seed)
+    latency = LatencyModel(args.latency_dist, args.latency_ms, args.jitter_ms, args.lognormal_sigma, rng)
+    stats = MockStats()
+    app = FastAPI(title="Mock Dify API")
+
+    def injected_failure() -> Optional[str]:
+        """エラーを注入する場合はその種類を返す"""
+        roll = rng.random()
+        if roll < args.timeout_rate:
+            return "timeout"
+        if roll < args.timeout_rate + args.error_rate:
+            return "error"
+        return None
+
+    @app.post("/v1/workflows/run")
+    async def run_workflow(request: Request):
+        payload = await request.json()
+        inputs = payload.get("inputs") or {}
+        request_type = inputs.get("type", "analysis")
+        streaming = payload.get("response_mode") == "streaming"
+
+        stats.requests += 1
+        stats.by_type[request_type] = stats.by_type.get(request_type, 0) + 1
+        if streaming:
+            stats.streaming_requests += 1
+
+        failure = injected_failure()
+        if failure == "timeout":
+            stats.timeouts += 1
+            # クライアントの読み取りタイムアウトを発生させるため応答しない
+            await asyncio.sleep(args.hang_seconds)
+        if failure is not None:
+            stats.errors += 1
+            return JSONResponse(
+                status_code=args.error_status,
+                content={"code": "mock_error", "message": "モックサーバーが注入したエラーです", "status": args.error_status},
+            )
+
+        outputs = build_outputs(request_type, rng)
+        delay = latency.sample()
+        workflow_run_id = str(uuid.uuid4())
+
+        if streaming:
+            return StreamingResponse(
+                stream_events(workflow_run_id, outputs, delay),
+                media_type="text/event-stream",
+            )
+
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            stats.in_flight -= 1
+        return {
+            "workflow_run_id": workflow_run_id,
+            "data": {
+                "id": workflow_run_id,
+                "status": "succeeded",
+                "outputs": outputs,
+                "elapsed_time": round(delay, 3),
+            },
+        }
+
+    async def stream_events(workflow_run_id: str, outputs: Dict[str, Any], delay: float):
+        """DifyのSSE形式でtext_chunkとworkflow_finishedを送る"""
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            yield _sse({"event": "workflow_started", "workflow_run_id": workflow_run_id, "data": {"id": workflow_run_id}})
+            text = outputs.get("feedback", "")
+            chunks = max(1, args.stream_chunks)
+            size = max(1, -(-len(text) // chunks))
+            for start in range(0, len(text), size):
+                await asyncio.sleep(delay / chunks)
+                yield _sse({
+                    "event": "text_chunk",
+                    "workflow_run_id": workflow_run_id,
+                    "data": {"text": text[start:start + size], "from_variable_selector": ["llm", "feedback"]},
+                })
+            yield _sse({
+                "event": "workflow_finished",
+                "workflow_run_id": workflow_run_id,
+                "data": {"id": workflow_run_id, "status": "succeeded", "outputs": outputs, "elapsed_time": round(delay, 3)},
+            })
+        finally:
+            stats.in_flight -= 1
+
+    @app.get("/certs")
+    async def certs():
+        return JSONResponse(
+            content={signing_key.kid: signing_key.cert_pem},
+            headers={"Cache-Control": "public, max-age=3600"},
+        )
+
+    @app.get("/token")
+    async def token(uid: str):
+        return {"id_token": signing_key.mint(uid)}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        nonlocal stats
+        stats = MockStats()
+        return stats.to_dict()
+
+    return app
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="負荷試験用のDify APIモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--project-id", default="mbti-diary-loadtest", help="発行するトークンのaud/issに使うプロジェクトID")
+    parser.add_argument(
+        "--latency-dist",
+        choices=["fixed", "uniform", "normal", "lognormal", "exponential"],
+        default="lognormal",
+        help="応答時間の分布",
+    )
+    parser.add_argument("--latency-ms", type=float, default=800, help="応答時間の基準値（fixed/uniform/normal/exponentialは平均、lognormalは中央値）")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="uniformの幅（±）、normalの標準偏差")
+    parser.add_argument("--lognormal-sigma", type=float, default=0.6, help="lognormalの形状パラメーター（大きいほど裾が長い）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す割合（0〜1）")
+    parser.add_argument("--error-status", type=int, default=503, help="注入するエラーのHTTPステータス")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="応答せずに待たせる割合（0〜1）")
+    parser.add_argument("--hang-seconds", type=float, default=120, help="タイムアウトを注入する場合に待たせる秒数")
+    parser.add_argument("--stream-chunks", type=int, default=8, help="ストリーミングで送るtext_chunkの数")
+    parser.add_argument("--seed", type=int, default=None, help="乱数のシード（再現性が必要な場合に指定）")
+    parser.add_argument("--write-credentials", default=None, help="Firebase Admin SDK用のダミー認証情報を書き出すパス")
+    return parser.parse_args()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    args = parse_args()
+    signing_key = SigningKey(args.project_id)
+
+    if args.write_credentials:
+        with open(args.write_credentials, "w") as f:
+            json.dump(signing_key.service_account(), f, indent=2)
+        logger.info(f"ダミーの認証情報を書き出しました: {args.write_credentials}")
+
+    logger.info(
+        f"モックサーバーを起動します - 分布: {args.latency_dist}, 基準値: {args.latency_ms}ms, "
+        f"エラー率: {args.error_rate}, タイムアウト率: {args.timeout_rate}"
+    )
+    uvicorn.run(create_app(args, signing_key), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()